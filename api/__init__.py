@@ -0,0 +1,5 @@
+from api.errors import (ApiError, ApiKeyMissingError, ApiHTTPError, ApiConnectionError,
+                        ApiTimeoutError, ApiResponseError, ApiOverloadedError, ApiUnavailableError,
+                        ApiQuotaExhaustedError)
+from api.movie import Movie
+from api.poiskkino import PoiskKinoClient, MoviePage, get_client, get_cache
@@ -0,0 +1,180 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from api.movie import to_json
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(endpoint: str, params: dict) -> str: # нормализованный ключ: эндпоинт + отсортированные параметры
+    items = []
+    for name, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for v in values:
+            if isinstance(v, str):
+                v = v.strip()
+                if name == "query":
+                    v = " ".join(v.casefold().split())
+            elif isinstance(v, float) and v.is_integer():
+                v = int(v)
+            items.append((name, str(v)))
+    return endpoint + "?" + urlencode(sorted(items))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024, ttls=None, default_ttl=300, disk_path=None,
+                 stale_ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl # сколько секунд после истечения ответ еще хранится для get_stale
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @property
+    def on_disk(self) -> bool: # есть дисковый уровень: get/get_stale/set могут ждать SQLite
+        return self._disk is not None
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                if entry[0] + self.stale_ttl <= now:
+                    self._drop(key)
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._put(key, *entry)
+        return entry[2]
+
+    def get_stale(self, key: str): # последний сохраненный ответ, даже просроченный; None, если его нет
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] + self.stale_ttl > now:
+                self.stale_hits += 1
+                return entry[2]
+        entry = self._disk_get(key, now - self.stale_ttl)
+        if entry is None:
+            return None
+        with self._lock:
+            self.stale_hits += 1
+        return entry[2]
+
+    def set(self, key: str, endpoint: str, value, size: int):
+        expires_at = time.time() + self.ttl_for(endpoint)
+        with self._lock:
+            self._put(key, expires_at, size, value)
+        self._disk_set(key, endpoint, expires_at, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                with self._disk:
+                    self._disk.execute("DELETE FROM response_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _put(self, key, expires_at, size, value): # вызывается под self._lock
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _open_disk(self, path): # дисковый уровень, чтобы после рестарта кэш оставался тёплым
+        try:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            with self._disk:
+                self._disk.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time() - self.stale_ttl,))
+        except sqlite3.Error as e:
+            logger.error("Не удалось открыть дисковый кэш %s: %s", path, e)
+            self._disk = None
+
+    def _disk_get(self, key, now): # запись, действительная на момент now
+        if self._disk is None:
+            return None
+        try:
+            with self._lock:
+                row = self._disk.execute(
+                    "SELECT expires_at, payload FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Ошибка чтения дискового кэша: %s", e)
+            return None
+        if row is None:
+            return None
+        return row[0], len(row[1]), json.loads(row[1])
+
+    def _disk_set(self, key, endpoint, expires_at, value):
+        if self._disk is None:
+            return
+        try:
+            payload = json.dumps(value, ensure_ascii=False, default=to_json)
+            with self._lock, self._disk:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, endpoint, expires_at, payload) VALUES (?, ?, ?, ?)",
+                    (key, endpoint, expires_at, payload),
+                )
+                self._disk_writes += 1
+                if self._disk_writes % 500 == 0: # периодически чистим просроченные записи
+                    self._disk.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time() - self.stale_ttl,))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning("Ошибка записи в дисковый кэш: %s", e)
@@ -0,0 +1,284 @@
+import re
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import datetime
+import threading
+
+import config
+from services import metrics
+from services.logs import setup_logging
+from api.movie import Movie
+from api.poiskkino import MoviePage, PoiskKinoClient
+
+logger = logging.getLogger(__name__)
+
+# Локальная копия каталога PoiskKino в SQLite: FTS5 по названиям и B-tree индексы по рейтингу,
+# бюджету и году. Поиск по названию и выборки по рейтингу/бюджету отвечаются отсюда,
+# а при промахе клиент идет в API.
+#
+#   python -m api.catalog --full          # первичная загрузка (можно прерывать — продолжит с той же страницы)
+#   python -m api.catalog                 # догрузка изменений по updatedAt
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS movie ("
+    " id INTEGER PRIMARY KEY, name TEXT, alternative_name TEXT, year INTEGER,"
+    " rating_kp REAL, budget_value INTEGER, updated_at TEXT, doc TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS movie_rating_kp ON movie (rating_kp)",
+    "CREATE INDEX IF NOT EXISTS movie_budget_value ON movie (budget_value)",
+    "CREATE INDEX IF NOT EXISTS movie_year ON movie (year)",
+    "CREATE TABLE IF NOT EXISTS catalog_state (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+FTS_SCHEMA = [ # внешний контент: текст хранится только в movie, триггеры держат индекс в актуальном состоянии
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movie_fts USING fts5("
+    " name, alternative_name, content='movie', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS movie_ai AFTER INSERT ON movie BEGIN"
+    " INSERT INTO movie_fts (rowid, name, alternative_name) VALUES (new.id, new.name, new.alternative_name); END",
+    "CREATE TRIGGER IF NOT EXISTS movie_ad AFTER DELETE ON movie BEGIN"
+    " INSERT INTO movie_fts (movie_fts, rowid, name, alternative_name) VALUES ('delete', old.id, old.name, old.alternative_name); END",
+    "CREATE TRIGGER IF NOT EXISTS movie_au AFTER UPDATE ON movie BEGIN"
+    " INSERT INTO movie_fts (movie_fts, rowid, name, alternative_name) VALUES ('delete', old.id, old.name, old.alternative_name);"
+    " INSERT INTO movie_fts (rowid, name, alternative_name) VALUES (new.id, new.name, new.alternative_name); END",
+]
+
+RANGE_COLUMNS = {"rating.kp": "rating_kp", "budget.value": "budget_value", "year": "year"} # фильтр/сортировка API -> колонка
+
+
+def _range(value): # "7.5-10" -> (7.5, 10.0); 2000 или [2000] -> (2000, 2000), как фильтры API
+    if isinstance(value, (list, tuple)):
+        if len(value) != 1:
+            return None
+        value = value[0]
+    try:
+        if isinstance(value, str) and "-" in value.strip("-"):
+            low, high = value.split("-", 1)
+            return float(low), float(high)
+        return float(value), float(value)
+    except ValueError: # формат, который каталог не понимает, — отвечает API
+        return None
+
+
+def fts_query(query: str): # каждое слово запроса — префикс: "матр" находит "Матрица"
+    words = re.findall(r"\w+", query.casefold())
+    return " ".join(f'"{word}"*' for word in words) or None
+
+
+class MovieCatalog:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._lock = threading.Lock()
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        try:
+            for statement in FTS_SCHEMA:
+                self._conn.execute(statement)
+            self.fts = True
+        except sqlite3.OperationalError as e: # SQLite собран без FTS5 — поиск по названию только через API
+            logger.warning("FTS5 недоступен, поиск по названию в локальном каталоге отключен: %s", e)
+            self.fts = False
+        self.hits = 0
+        self.misses = 0
+
+    def upsert(self, docs) -> int:
+        rows = []
+        for doc in docs:
+            if doc.get("id") is None:
+                continue
+            rating = (doc.get("rating") or {}).get("kp")
+            budget = (doc.get("budget") or {}).get("value")
+            rows.append((doc["id"], doc.get("name"), doc.get("alternativeName"), doc.get("year"),
+                         rating, budget, doc.get("updatedAt"), json.dumps(Movie.from_doc(doc).to_dict(), ensure_ascii=False)))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO movie (id, name, alternative_name, year, rating_kp, budget_value, updated_at, doc)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET"
+                    " name = excluded.name, alternative_name = excluded.alternative_name, year = excluded.year,"
+                    " rating_kp = excluded.rating_kp, budget_value = excluded.budget_value,"
+                    " updated_at = excluded.updated_at, doc = excluded.doc",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def search(self, query: str, page: int = 1, limit: int = 10): # MoviePage или None, если в каталоге ничего нет
+        # до конца первичной загрузки не отвечаем: неполный каталог дал бы часть фильмов и неверный total
+        match = fts_query(query) if self.fts else None
+        if match is None or not self.complete:
+            return self._miss()
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM movie_fts WHERE movie_fts MATCH ?", (match,)).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT movie.doc FROM movie_fts JOIN movie ON movie.id = movie_fts.rowid"
+                " WHERE movie_fts MATCH ? ORDER BY bm25(movie_fts), movie.rating_kp DESC LIMIT ? OFFSET ?",
+                (match, limit, (page - 1) * limit),
+            ).fetchall() if total else []
+            if total:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not total:
+            return None
+        return self._page(rows, total, page, limit)
+
+    def discover(self, filters: dict, page: int = 1, limit: int = 10, sort_field: str = None, sort_type: int = -1):
+        # только полный каталог и только фильтры-диапазоны по rating.kp/budget.value/year, иначе None
+        if not self.complete or (sort_field and sort_field not in RANGE_COLUMNS):
+            return self._miss()
+        where, args = [], []
+        for name, value in filters.items():
+            bounds = _range(value) if name in RANGE_COLUMNS else None
+            if bounds is None:
+                return self._miss()
+            where.append(f"{RANGE_COLUMNS[name]} BETWEEN ? AND ?")
+            args.extend(bounds)
+        sql = " FROM movie" + (" WHERE " + " AND ".join(where) if where else "")
+        order = f" ORDER BY {RANGE_COLUMNS[sort_field]} {'DESC' if sort_type == -1 else 'ASC'}, id" if sort_field else " ORDER BY id"
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*)" + sql, args).fetchone()[0]
+            rows = self._conn.execute("SELECT doc" + sql + order + " LIMIT ? OFFSET ?", args + [limit, (page - 1) * limit]).fetchall()
+            self.hits += 1 # каталог полный — пустой результат тоже ответ
+        return self._page(rows, total, page, limit)
+
+    @property
+    def complete(self) -> bool: # первичная загрузка дошла до конца
+        return self.get_state("complete") == "1"
+
+    def get_state(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM catalog_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO catalog_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def max_updated_at(self):
+        with self._lock:
+            return self._conn.execute("SELECT MAX(updated_at) FROM movie").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            movies = self._conn.execute("SELECT COUNT(*) FROM movie").fetchone()[0]
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {"movies": movies, "complete": self.complete, "hits": hits, "misses": misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0}
+
+    def close(self):
+        self._conn.close()
+
+    def _page(self, rows, total, page, limit):
+        return MoviePage(docs=[Movie.from_doc(json.loads(row[0])) for row in rows], total=total, page=page,
+                         pages=(total + limit - 1) // limit, limit=limit)
+
+    def _miss(self):
+        with self._lock: # счетчики меняют рабочие потоки одновременно
+            self.misses += 1
+        return None
+
+
+class CatalogSync: # заполняет MovieCatalog постранично из /v1.4/movie
+    def __init__(self, catalog: MovieCatalog, client: PoiskKinoClient = None, page_size=None):
+        self.catalog = catalog
+        # свой клиент без кэша ответов и без каталога: иначе синхронизация читала бы сама себя;
+        # без индекса inline-подсказок: весь каталог в памяти не нужен; без предохранителя: ошибки синхронизации
+        # не должны отключать API для пользователей, а сама она повторит загрузку в следующий проход
+        self.client = client or PoiskKinoClient(cache=False, catalog=False, title_index=False, breaker=False)
+        self.page_size = page_size or config.CATALOG_SYNC_PAGE_SIZE
+
+    def full(self, max_pages=0): # с последней загруженной страницы до конца каталога (или max_pages страниц за вызов)
+        page = int(self.catalog.get_state("full_page", 1))
+        loaded = fetched = 0
+        while True:
+            result = self.client.discover({}, page=page, limit=self.page_size, sort_field="id", sort_type=1)
+            loaded += self.catalog.upsert(result.docs)
+            logger.info("Каталог: страница %s/%s, загружено %s", page, result.pages, loaded)
+            if page >= result.pages or not result.docs:
+                self.catalog.set_state("complete", 1)
+                self.catalog.set_state("full_page", 1)
+                return loaded
+            page += 1
+            fetched += 1
+            self.catalog.set_state("full_page", page)
+            if max_pages and fetched >= max_pages:
+                return loaded
+
+    def incremental(self): # фильмы, измененные с последнего updatedAt в каталоге
+        since = self.catalog.max_updated_at()
+        if not since:
+            return self.full()
+        start = datetime.datetime.fromisoformat(since.replace("Z", "+00:00")).date()
+        filters = {"updatedAt": f"{start:%d.%m.%Y}-{datetime.date.today() + datetime.timedelta(days=1):%d.%m.%Y}"}
+        page, loaded = 1, 0
+        while True:
+            result = self.client.discover(filters, page=page, limit=self.page_size, sort_field="updatedAt", sort_type=1)
+            loaded += self.catalog.upsert(result.docs)
+            if page >= result.pages or not result.docs:
+                break
+            page += 1
+        logger.info("Каталог: обновлено %s фильмов с %s", loaded, since)
+        return loaded
+
+    def run_forever(self, interval, stop_event): # фоновая догрузка в процессе бота
+        while not stop_event.is_set():
+            try:
+                if self.catalog.complete:
+                    self.incremental()
+                else:
+                    self.full(max_pages=config.CATALOG_SYNC_MAX_PAGES)
+            except Exception as e:
+                logger.error("Ошибка синхронизации каталога: %s", e)
+            stop_event.wait(interval)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog(): # None, если CATALOG_DB_PATH не задан
+    global _catalog
+    if _catalog is None and config.CATALOG_DB_PATH:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MovieCatalog(config.CATALOG_DB_PATH)
+                metrics.collector("catalog", _catalog.stats)
+    return _catalog
+
+def start_background_sync(): # поток догрузки каталога; ничего не делает без CATALOG_DB_PATH
+    catalog = get_catalog()
+    if catalog is None or config.CATALOG_REFRESH_INTERVAL <= 0:
+        return None
+    stop_event = threading.Event()
+    thread = threading.Thread(target=CatalogSync(catalog).run_forever, args=(config.CATALOG_REFRESH_INTERVAL, stop_event),
+                              name="catalog-sync", daemon=True)
+    thread.start()
+    return stop_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the local PoiskKino catalog")
+    parser.add_argument("--full", action="store_true", help="первичная загрузка всего каталога")
+    parser.add_argument("--max-pages", type=int, default=0, help="загрузить не больше N страниц за запуск (0 — до конца)")
+    parser.add_argument("--db", default=config.CATALOG_DB_PATH or "catalog.db")
+    args = parser.parse_args()
+    setup_logging()
+    catalog = MovieCatalog(args.db)
+    sync = CatalogSync(catalog)
+    started = time.monotonic()
+    loaded = sync.full(args.max_pages) if args.full or not catalog.complete else sync.incremental()
+    print(json.dumps(dict(catalog.stats(), loaded=loaded, seconds=round(time.monotonic() - started, 1)), ensure_ascii=False))
+    catalog.close()
+
+
+if __name__ == '__main__':
+    main()
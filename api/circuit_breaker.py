@@ -0,0 +1,109 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from api.errors import ApiHTTPError, ApiConnectionError, ApiTimeoutError, ApiResponseError
+
+logger = logging.getLogger(__name__)
+
+# Предохранитель для запросов к PoiskKino. Закрыт — запросы идут в API, исходы последних window запросов
+# запоминаются. Если среди них слишком много ошибок или медленных ответов, он размыкается: в API никто не идет,
+# обработчики сразу получают последний удачный ответ из кэша (помеченный как устаревший) или ошибку,
+# а не ждут таймаутов. Через open_seconds один пробный запрос уходит в фоне (полуоткрытое состояние):
+# удачный замыкает предохранитель, неудачный размыкает снова. Проба, которая ничего не сказала о состоянии API
+# (нет свободного ключа, ошибка в самом запросе), не считается: следующий вызов пробует снова.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_upstream_failure(error) -> bool: # сбой на стороне API, а не ошибка в самом запросе (400, 401, 404)
+    if isinstance(error, ApiHTTPError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (ApiConnectionError, ApiTimeoutError, ApiResponseError))
+
+
+class CircuitBreaker:
+    def __init__(self, window=20, min_calls=10, error_ratio=0.5, slow_call=5.0, slow_ratio=0.5, open_seconds=30.0):
+        self.window = window
+        self.min_calls = min_calls # раньше решения не принимаем: пара ошибок после старта не размыкает
+        self.error_ratio = error_ratio
+        self.slow_call = slow_call # ответ дольше — медленный, даже если удачный; 0 — не учитывать
+        self.slow_ratio = slow_ratio
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window) # (ошибка, медленный) последних запросов
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def allow(self) -> bool: # False — в API не идем
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def probe_due(self) -> bool: # True — вызывающий запускает пробный запрос, предохранитель переходит в HALF_OPEN
+        with self._lock:
+            if self.state != OPEN or time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+            self.probes += 1
+            return True
+
+    def release_probe(self): # проба не дошла до API или ответ ничего не говорит о нем — не замыкаем и не размыкаем
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self._opened_at = time.monotonic() - self.open_seconds # probe_due() сработает при следующем вызове
+
+    def record(self, seconds, failed=False, probe=False):
+        slow = bool(self.slow_call) and seconds >= self.slow_call
+        with self._lock:
+            if probe:
+                if failed or slow:
+                    self._open(f"пробный запрос {'не удался' if failed else f'занял {seconds:.1f} с'}")
+                else:
+                    self._close()
+                return
+            if self.state != CLOSED: # ответ на запрос, начатый до размыкания
+                return
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            errors = sum(1 for failed, _ in self._outcomes if failed) / len(self._outcomes)
+            slows = sum(1 for _, slow in self._outcomes if slow) / len(self._outcomes)
+            if errors >= self.error_ratio:
+                self._open(f"ошибок {errors:.0%} из последних {len(self._outcomes)} запросов")
+            elif slows >= self.slow_ratio:
+                self._open(f"медленных ответов {slows:.0%} из последних {len(self._outcomes)} запросов")
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "open": self.state != CLOSED,
+                "half_open": self.state == HALF_OPEN,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "probes": self.probes,
+                "error_ratio": round(sum(1 for failed, _ in self._outcomes if failed) / calls, 4) if calls else 0.0,
+            }
+
+    def _open(self, reason): # вызывается под self._lock
+        if self.state == CLOSED:
+            self.opened += 1
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning("PoiskKino недоступен (%s): запросы к API приостановлены на %.0f с", reason, self.open_seconds)
+
+    def _close(self): # вызывается под self._lock
+        self.state = CLOSED
+        self._outcomes.clear()
+        logger.info("PoiskKino снова отвечает: запросы к API возобновлены")
@@ -0,0 +1,37 @@
+class ApiError(Exception): # общая ошибка обращения к PoiskKino API
+    pass
+
+
+class ApiKeyMissingError(ApiError): # ключ POISKINO_API_KEY не задан в окружении
+    pass
+
+
+class ApiHTTPError(ApiError): # API ответил статусом 4xx/5xx
+    def __init__(self, status_code: int, text: str = ""):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+
+class ApiConnectionError(ApiError): # не удалось подключиться к API
+    pass
+
+
+class ApiTimeoutError(ApiError): # API не ответил за отведенное время
+    pass
+
+
+class ApiResponseError(ApiError, ValueError): # пустой или некорректный ответ API
+    pass
+
+
+class ApiOverloadedError(ApiError): # слишком много запросов ждут один и тот же ответ API
+    pass
+
+
+class ApiUnavailableError(ApiError): # предохранитель разомкнут, а сохраненного ответа нет
+    pass
+
+
+class ApiQuotaExhaustedError(ApiError): # все ключи API исчерпали дневной лимит
+    pass
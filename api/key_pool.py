@@ -0,0 +1,283 @@
+import time
+import atexit
+import random
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+
+import config
+from services import metrics
+from api.errors import ApiHTTPError, ApiQuotaExhaustedError
+
+logger = logging.getLogger(__name__)
+
+# Пул ключей PoiskKino. У каждого ключа дневной бюджет запросов (0 — без ограничения) и вес.
+# Запрос уходит с ключом, у которого использована наименьшая доля веса (least_used), или со случайным
+# с вероятностью по весу (weighted). Ключ, который исчерпал бюджет или на который API ответил 401/403,
+# исключается до сброса квоты (полночь по POISKINO_QUOTA_UTC_OFFSET), после 429 — на POISKINO_KEY_COOLDOWN.
+# 401/403 исключает ключ до сброса, только если в пуле есть другой рабочий ключ. Последний ключ получает
+# лишь паузу POISKINO_KEY_COOLDOWN: ключ могли исправить, а один ответ не должен выключать бота до полуночи.
+# Пока он на паузе, запросы получают ту же ошибку HTTP, а не "квота исчерпана".
+# С 429 так же: пауза POISKINO_KEY_COOLDOWN — только если есть другой ключ, последний ключ ждет лишь Retry-After
+# (или задержку повтора), чтобы повтор запроса после паузы прошел, а не упал с "квота исчерпана".
+# Счетчики пишутся в SQLite приращениями: переживают рестарт и суммируются между процессами.
+# Запись — в фоновом потоке раз в flush_interval: acquire() вызывается и из event loop и не ждет диска.
+#
+#   POISKINO_API_KEYS=key1:200,key2:500,key3:1000:3   # ключ[:бюджет[:вес]]; вес по умолчанию равен бюджету
+
+KEY_USED = metrics.gauge("poiskkino_key_used", "Запросов с ключом за текущие сутки квоты", ("key",))
+KEY_REMAINING = metrics.gauge("poiskkino_key_remaining", "Остаток дневного бюджета ключа", ("key",))
+KEY_AVAILABLE = metrics.gauge("poiskkino_key_available", "1 — ключ используется, 0 — исключен до сброса или паузы", ("key",))
+
+SCHEMA = ("CREATE TABLE IF NOT EXISTS api_key_usage ("
+          "key_id TEXT PRIMARY KEY, period TEXT NOT NULL, used INTEGER NOT NULL, blocked_until REAL NOT NULL)")
+
+
+def key_id(value: str) -> str: # в базе и метриках — не сам ключ, а его хэш
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:10]
+
+
+def parse_keys(spec: str, default_budget=0) -> list: # "key1:200,key2:500:3" -> [ApiKey]
+    keys = []
+    for item in (spec or "").split(","):
+        parts = [part.strip() for part in item.split(":")]
+        if not parts[0]:
+            continue
+        budget = int(parts[1]) if len(parts) > 1 and parts[1] else default_budget
+        weight = float(parts[2]) if len(parts) > 2 and parts[2] else None
+        keys.append(ApiKey(parts[0], budget, weight))
+    return keys
+
+
+class ApiKey:
+    __slots__ = ("value", "id", "budget", "weight", "period", "used", "pending", "blocked_until", "rejected")
+
+    def __init__(self, value, budget=0, weight=None):
+        self.value = value
+        self.id = key_id(value)
+        self.budget = budget
+        self.weight = weight or budget or 1 # без явного веса ключи расходуются пропорционально бюджету
+        self.period = None # сутки квоты, к которым относится used
+        self.used = 0
+        self.pending = 0 # еще не записано в базу
+        self.blocked_until = 0.0 # time.time(), до которого ключ исключен
+        self.rejected = None # статус 401/403/429, из-за которого ключ на паузе
+
+    @property
+    def remaining(self):
+        return max(self.budget - self.used, 0) if self.budget else None
+
+
+class ApiKeyPool:
+    def __init__(self, keys, strategy="least_used", cooldown=60.0, utc_offset=3.0, db_path=None, flush_interval=5.0):
+        if strategy not in ("least_used", "weighted"):
+            raise ValueError(f"Неизвестная стратегия выбора ключа: {strategy}")
+        self.keys = list(keys)
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.tz = datetime.timezone(datetime.timedelta(hours=utc_offset))
+        self.flush_interval = flush_interval
+        self.rejections = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # одна запись за раз: фоновый поток и close()
+        self._wake = threading.Event()
+        self._closed = False
+        self._db = None
+        if db_path:
+            self._open(db_path)
+        if self._db is not None:
+            threading.Thread(target=self._flush_loop, name="poiskkino-keys-flush", daemon=True).start()
+        self._update_gauges()
+
+    def acquire(self) -> ApiKey: # ключ для одного запроса; запрос сразу засчитывается
+        now = time.time()
+        with self._lock:
+            candidates = [key for key in self._rolled(now) if self._usable(key, now)]
+            if not candidates:
+                rejected = self._rejected(now)
+                if rejected == 429: # не квота, а ограничение частоты — показываем настоящую ошибку
+                    raise ApiHTTPError(rejected, f"Ключ PoiskKino на паузе после 429 до {self._next_unblock(now)}")
+                if rejected is not None: # не квота, а ключ не принят — показываем настоящую ошибку
+                    raise ApiHTTPError(rejected, "Ключ PoiskKino отклонен, повторная проверка после паузы")
+                raise ApiQuotaExhaustedError(f"Все ключи PoiskKino исчерпаны или на паузе до {self._next_unblock(now)}")
+            if self.strategy == "weighted":
+                key = random.choices(candidates, weights=[key.weight for key in candidates])[0]
+            else:
+                key = min(candidates, key=lambda key: key.used / key.weight)
+            key.used += 1
+            key.pending += 1
+            for other in self.keys: # заодно обновляем ключи, у которых кончилась пауза
+                self._update_gauge(other, now)
+        return key
+
+    def reject(self, key: ApiKey, status: int) -> bool: # 401/403: ключ недействителен или дневной лимит исчерпан
+        now = time.time()
+        with self._lock:
+            available = any(self._usable(other, now) for other in self._rolled(now) if other is not key)
+            if available:
+                key.blocked_until = max(key.blocked_until, self._reset_at(now))
+            else: # последний рабочий ключ: короткая пауза, как после 429
+                key.blocked_until = max(key.blocked_until, now + self.cooldown)
+            key.rejected = status
+            self.rejections += 1
+            self._update_gauge(key, now)
+        if available:
+            logger.warning("PoiskKino отклонил ключ %s (HTTP %s): не используем его до сброса квоты", key.id, status)
+        else:
+            logger.error("PoiskKino отклонил ключ %s (HTTP %s), другого ключа нет: пауза %.0f с", key.id, status, self.cooldown)
+        self._wake.set() # блокировку ключа — другим процессам без ожидания flush_interval
+        return available # True — есть другой ключ, запрос можно сразу повторить; иначе — ошибка HTTP пользователю
+
+    def throttle(self, key: ApiKey, retry_after=None, delay=0.0) -> bool: # 429: пауза для ключа, остальные продолжают работать
+        try:
+            wait = float(retry_after) if retry_after else None
+        except ValueError:
+            wait = None
+        now = time.time()
+        with self._lock:
+            available = any(self._usable(other, now) for other in self._rolled(now) if other is not key)
+            if available:
+                pause = max(self.cooldown, wait or 0)
+            else: # последний рабочий ключ: ждем столько, сколько просит API (или до повтора), а не cooldown
+                pause = wait if wait is not None else delay
+            key.blocked_until = max(key.blocked_until, now + pause)
+            key.rejected = 429
+            self._update_gauge(key, now)
+        logger.warning("PoiskKino ограничил частоту для ключа %s: пауза %.1f с", key.id, pause)
+        return available
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            keys = self._rolled(now)
+            budgeted = [key for key in keys if key.budget]
+            return {
+                "keys": len(keys),
+                "available": sum(1 for key in keys if self._usable(key, now)),
+                "used": sum(key.used for key in keys),
+                "remaining": sum(key.remaining for key in budgeted if self._usable(key, now)), # только ключи с бюджетом
+                "budget": sum(key.budget for key in budgeted),
+                "rejections": self.rejections,
+            }
+
+    def flush(self): # приращения счетчиков в базу; из базы — суммы с учетом других процессов
+        if self._db is None:
+            return
+        with self._flush_lock:
+            with self._lock: # под блокировкой пула — только снимок, запись в базу идет без нее
+                self._rolled(time.time())
+                rows = [(key.id, key.period, key.pending, key.blocked_until) for key in self.keys]
+                for key in self.keys:
+                    key.pending = 0
+            try:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT INTO api_key_usage (key_id, period, used, blocked_until) VALUES (?, ?, ?, ?)"
+                        " ON CONFLICT (key_id) DO UPDATE SET"
+                        " used = CASE WHEN period = excluded.period THEN used + excluded.used ELSE excluded.used END,"
+                        " period = excluded.period, blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                        rows,
+                    )
+                    saved = self._read()
+            except sqlite3.Error as e:
+                logger.warning("Не удалось сохранить счетчики ключей PoiskKino: %s", e)
+                with self._lock: # не записанное — в следующую попытку
+                    for key, (_, period, pending, _) in zip(self.keys, rows):
+                        if key.period == period:
+                            key.pending += pending
+                return
+            with self._lock:
+                self._load(saved)
+
+    def close(self): # последняя запись счетчиков; фоновый поток завершается
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def _open(self, path):
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute(SCHEMA)
+            saved = self._read()
+            with self._lock:
+                self._rolled(time.time())
+                self._load(saved)
+        except sqlite3.Error as e:
+            logger.error("Не удалось открыть базу счетчиков ключей %s: %s. Счет только в памяти.", path, e)
+            self._db = None
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self._closed:
+                self.flush()
+
+    def _read(self): # key_id -> (period, used, blocked_until) из базы
+        return {row[0]: row[1:] for row in self._db.execute("SELECT key_id, period, used, blocked_until FROM api_key_usage")}
+
+    def _load(self, rows): # вызывается под self._lock
+        for key in self.keys:
+            period, used, blocked_until = rows.get(key.id, (None, 0, 0.0))
+            if period == key.period:
+                key.used = used + key.pending
+            key.blocked_until = max(key.blocked_until, blocked_until)
+
+    def _rolled(self, now): # вызывается под self._lock; с новыми сутками квоты счетчики обнуляются
+        period = datetime.datetime.fromtimestamp(now, self.tz).date().isoformat()
+        for key in self.keys:
+            if key.period != period:
+                key.period, key.used, key.pending = period, 0, 0
+        return self.keys
+
+    def _usable(self, key, now):
+        return key.blocked_until <= now and not (key.budget and key.used >= key.budget)
+
+    def _rejected(self, now): # вызывается под self._lock; статус 401/403/429, если все ключи на паузе из-за него
+        blocked = [key for key in self.keys if key.blocked_until > now and not (key.budget and key.used >= key.budget)]
+        if blocked and all(key.rejected is not None for key in blocked):
+            return blocked[0].rejected
+        return None
+
+    def _reset_at(self, now): # ближайшая полночь в часовом поясе квоты
+        today = datetime.datetime.fromtimestamp(now, self.tz).date()
+        return datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time(), self.tz).timestamp()
+
+    def _next_unblock(self, now):
+        blocked = [key.blocked_until for key in self.keys if key.blocked_until > now and not (key.budget and key.used >= key.budget)]
+        until = min(blocked) if blocked else self._reset_at(now)
+        return datetime.datetime.fromtimestamp(until, self.tz).strftime("%d.%m %H:%M:%S")
+
+    def _update_gauge(self, key, now):
+        KEY_USED.labels(key.id).set(key.used)
+        if key.budget:
+            KEY_REMAINING.labels(key.id).set(key.remaining)
+        KEY_AVAILABLE.labels(key.id).set(int(self._usable(key, now)))
+
+    def _update_gauges(self):
+        now = time.time()
+        with self._lock:
+            for key in self._rolled(now):
+                self._update_gauge(key, now)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_key_pool(): # None, если ни одного ключа не задано
+    global _pool
+    if _pool is None:
+        keys = parse_keys(config.POISKINO_API_KEYS or config.POISKINO_API_KEY, config.POISKINO_DAILY_BUDGET)
+        if not keys:
+            return None
+        with _pool_lock:
+            if _pool is None:
+                _pool = ApiKeyPool(keys, strategy=config.POISKINO_KEY_STRATEGY, cooldown=config.POISKINO_KEY_COOLDOWN,
+                                   utc_offset=config.POISKINO_QUOTA_UTC_OFFSET, db_path=config.POISKINO_KEYS_DB_PATH or None)
+                metrics.collector("poiskkino_keys", _pool.stats)
+                atexit.register(_pool.close)
+    return _pool
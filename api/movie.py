@@ -0,0 +1,133 @@
+import re
+import json
+
+# Компактная запись фильма. Обработчикам нужны только название, год, описание, рейтинги, бюджет и постер,
+# а документ PoiskKino содержит еще персоны, факты, видео и т.д. В кэше ответов, предзагрузке и индексе
+# названий хранятся записи Movie со __slots__, а не полные dict. Чтение — как у dict (get, [], in),
+# поэтому обработчики и форматирование карточек работают с записью так же, как с документом API.
+
+SELECT_FIELDS = ("id", "name", "alternativeName", "year", "description", "rating", "budget", "poster", "updatedAt")
+NESTED_FIELDS = { # вложенные объекты: оставляем только используемые ключи
+    "rating": ("kp", "imdb"),
+    "budget": ("value", "currency"),
+    "poster": ("url", "previewUrl"),
+}
+
+
+def _project(value, keys):
+    if not isinstance(value, dict):
+        return None
+    projected = {key: value[key] for key in keys if value.get(key) is not None}
+    return projected or None
+
+
+class Movie:
+    __slots__ = SELECT_FIELDS
+
+    def __init__(self, id=None, name=None, alternativeName=None, year=None, description=None,
+                 rating=None, budget=None, poster=None, updatedAt=None):
+        self.id = id
+        self.name = name
+        self.alternativeName = alternativeName
+        self.year = year
+        self.description = description
+        self.rating = rating
+        self.budget = budget
+        self.poster = poster
+        self.updatedAt = updatedAt
+
+    @classmethod
+    def from_doc(cls, doc): # документ API (полный или уже урезанный) -> Movie; Movie возвращается как есть
+        if isinstance(doc, cls):
+            return doc
+        return cls(doc.get("id"), doc.get("name"), doc.get("alternativeName"), doc.get("year"), doc.get("description"),
+                   _project(doc.get("rating"), NESTED_FIELDS["rating"]),
+                   _project(doc.get("budget"), NESTED_FIELDS["budget"]),
+                   _project(doc.get("poster"), NESTED_FIELDS["poster"]),
+                   doc.get("updatedAt"))
+
+    def get(self, key, default=None): # отсутствующее поле и null одинаково дают default
+        value = getattr(self, key, None) if key in SELECT_FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [name for name in SELECT_FIELDS if getattr(self, name) is not None]
+
+    def to_dict(self) -> dict: # для JSON: дисковый кэш, каталог
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def __repr__(self):
+        return f"Movie(id={self.id!r}, name={self.name!r}, year={self.year!r})"
+
+
+_decoder = json.JSONDecoder()
+_space = re.compile(r"[ \t\n\r]*")
+
+
+def _skip(text, pos, char=None): # пропускает пробелы и, если задан, ожидаемый символ
+    pos = _space.match(text, pos).end()
+    if char is not None:
+        if text[pos:pos + 1] != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", text, pos)
+        pos = _space.match(text, pos + 1).end()
+    return pos
+
+
+def _decode_docs(text, pos): # массив docs: каждый документ сразу урезается до Movie, полный список не строится
+    docs = []
+    pos = _skip(text, pos, "[")
+    if text[pos:pos + 1] == "]":
+        return docs, pos + 1
+    while True:
+        doc, pos = _decoder.raw_decode(text, pos)
+        if isinstance(doc, dict):
+            docs.append(Movie.from_doc(doc))
+        pos = _skip(text, pos)
+        if text[pos:pos + 1] == "]":
+            return docs, pos + 1
+        pos = _skip(text, pos, ",")
+
+
+def decode_page(body) -> dict: # тело ответа API -> dict страницы с записями Movie в docs
+    # верхний объект разбирается по ключам; документы фильмов — по одному, так что в памяти одновременно
+    # не больше одного полного документа, а не весь ответ
+    text = body.decode("utf-8") if isinstance(body, (bytes, bytearray)) else body
+    pos = _skip(text, 0)
+    if text[pos:pos + 1] != "{": # не страница (ошибка, массив) — обычный разбор
+        return json.loads(text)
+    data = {}
+    pos = _skip(text, pos, "{")
+    while text[pos:pos + 1] != "}":
+        if text[pos:pos + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip(text, pos, ":")
+        if key == "docs" and text[pos:pos + 1] == "[":
+            data[key], pos = _decode_docs(text, pos)
+        else:
+            data[key], pos = _decoder.raw_decode(text, pos)
+        pos = _skip(text, pos)
+        if text[pos:pos + 1] == ",":
+            pos = _skip(text, pos + 1)
+            if text[pos:pos + 1] != '"':
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+        elif text[pos:pos + 1] != "}":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+    if _skip(text, pos + 1) != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos + 1)
+    return data
+
+
+def to_json(value): # default для json.dumps: записи Movie сохраняются как dict
+    if isinstance(value, Movie):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
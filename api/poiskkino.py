@@ -0,0 +1,357 @@
+import abc
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from services import metrics
+from services.logs import clip
+from services.title_index import get_title_index
+from api.cache import ResponseCache, make_key
+from api.movie import Movie, SELECT_FIELDS, decode_page
+from api.singleflight import SingleFlight
+from api.circuit_breaker import CircuitBreaker, is_upstream_failure
+from api.key_pool import ApiKey, ApiKeyPool, get_key_pool
+from api.errors import (ApiError, ApiKeyMissingError, ApiHTTPError, ApiConnectionError,
+                        ApiTimeoutError, ApiResponseError, ApiUnavailableError, ApiQuotaExhaustedError)
+
+logger = logging.getLogger(__name__)
+
+SEARCH_ENDPOINT = "/v1.4/movie/search"
+DISCOVER_ENDPOINT = "/v1.4/movie"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+KEY_REJECTED_STATUSES = {401, 403} # ключ недействителен или исчерпал дневной лимит — пробуем другой ключ пула
+
+REQUEST_SECONDS = metrics.histogram("poiskkino_request_seconds", "Запрос к PoiskKino вместе с повторами", ("endpoint",))
+REQUESTS = metrics.counter("poiskkino_requests_total", "Запросы к PoiskKino по результату", ("endpoint", "outcome"))
+RETRIES = metrics.counter("poiskkino_retries_total", "Повторы запросов к PoiskKino", ("endpoint",))
+
+
+@dataclass
+class MoviePage: # одна страница результатов API
+    docs: list = field(default_factory=list) # записи Movie
+    total: int = 0
+    page: int = 1
+    pages: int = 0
+    limit: int = 0
+    stale: bool = False # сохраненный ответ, выданный вместо недоступного API
+
+
+def search_params(query: str, page: int, limit: int) -> dict:
+    return {"query": query, "page": page, "limit": limit}
+
+def discover_params(filters: dict, page: int, limit: int, sort_field: str = None, sort_type: int = -1) -> dict:
+    params = dict(filters)
+    params.update({"page": page, "limit": limit})
+    if sort_field:
+        params.update({"sortField": sort_field, "sortType": sort_type})
+    if config.POISKINO_SELECT_FIELDS: # /movie/search выбор полей не поддерживает — там урезаем при разборе
+        params["selectFields"] = list(SELECT_FIELDS)
+    return params
+
+def to_page(data: dict, stale: bool = False) -> MoviePage:
+    return MoviePage(
+        docs=[Movie.from_doc(doc) for doc in data.get("docs", [])], # из дискового кэша docs приходят как dict
+        total=data.get("total", 0),
+        page=data.get("page", 1),
+        pages=data.get("pages", 0),
+        limit=data.get("limit", 0),
+        stale=stale,
+    )
+
+def remember_titles(title_index, page: MoviePage) -> MoviePage: # фильмы из ответа — в индекс inline-подсказок
+    if title_index and page.docs:
+        title_index.add(page.docs)
+    return page
+
+def observe_request(endpoint, started, error=None): # метрики одного запроса к API (sync и async)
+    REQUEST_SECONDS.labels(endpoint).observe(time.monotonic() - started)
+    if error is None:
+        outcome = "ok"
+    elif isinstance(error, ApiHTTPError):
+        outcome = f"http_{error.status_code}"
+    else:
+        outcome = type(error).__name__
+    REQUESTS.labels(endpoint, outcome).inc()
+
+def record_outcome(breaker, started, error=None, probe=False): # исход запроса для предохранителя (sync и async)
+    if not breaker:
+        return
+    failed = error is not None and is_upstream_failure(error)
+    if probe and error is not None and not failed: # исчерпанная квота, 4xx: API не проверен
+        breaker.release_probe()
+        return
+    breaker.record(time.monotonic() - started, failed, probe)
+
+def can_serve_stale(error) -> bool: # сбой API или исчерпанная квота: сохраненный ответ лучше ошибки
+    return is_upstream_failure(error) or isinstance(error, ApiQuotaExhaustedError)
+
+def stale_response(cache, key, error): # (последний удачный ответ, True) вместо ошибки или недоступного API
+    return stale_or_raise(cache.get_stale(key) if cache else None, key, error)
+
+def stale_or_raise(data, key, error): # то же, когда сохраненный ответ уже прочитан (async читает его в потоке)
+    if data is None:
+        raise error
+    logger.warning("Отвечаем сохраненными данными для %s: %s", key, error)
+    return data, True
+
+def unavailable_error():
+    return ApiUnavailableError("PoiskKino временно недоступен")
+
+def backoff_delay(attempt, backoff, backoff_max, retry_after=None): # экспоненциальная задержка с полным джиттером
+    if retry_after:
+        try:
+            return min(float(retry_after), backoff_max)
+        except ValueError:
+            pass
+    return random.uniform(0, min(backoff_max, backoff * 2 ** attempt))
+
+
+def decode_response(status: int, body: bytes): # (данные, размер) или ошибка API по коду и телу ответа
+    if status >= 400:
+        raise ApiHTTPError(status, clip(body.decode("utf-8", errors="replace")))
+    if not body.strip():
+        raise ApiResponseError("API вернул пустой ответ или ответ без содержимого.")
+    try:
+        return decode_page(body), len(body)
+    except ValueError as e:
+        raise ApiResponseError(f"Некорректный JSON в ответе API: {e}") from e
+
+
+class RetryLoop: # решения цикла повторов одного запроса; сам запрос и пауза — в клиенте (sync или async)
+    def __init__(self, client, endpoint):
+        self.client = client
+        self.endpoint = endpoint
+        self.attempt = 0
+
+    def failed(self, error, cause, what) -> float: # сбой соединения или таймаут: пауза до повтора либо error
+        if self.attempt >= self.client.max_retries:
+            raise error from cause
+        delay = backoff_delay(self.attempt, self.client.backoff, self.client.backoff_max)
+        logger.warning("%s %s: %s. Повтор через %.2f с", what, self.endpoint, cause, delay)
+        return self._retry(delay)
+
+    def answered(self, api_key, status, retry_after): # None — ответ окончательный, иначе пауза до повтора
+        keys = self.client.keys
+        if status in KEY_REJECTED_STATUSES and keys.reject(api_key, status):
+            return 0 # другой ключ пула — сразу, без паузы и без траты попытки
+        delay = backoff_delay(self.attempt, self.client.backoff, self.client.backoff_max, retry_after)
+        if status == 429: # пауза ключа не дольше этой задержки, если другого ключа нет
+            keys.throttle(api_key, retry_after, delay)
+        if status not in RETRY_STATUSES or self.attempt >= self.client.max_retries:
+            return None
+        logger.warning("API вернул %s для %s. Повтор через %.2f с", status, self.endpoint, delay)
+        return self._retry(delay)
+
+    def _retry(self, delay):
+        self.attempt += 1
+        RETRIES.labels(self.endpoint).inc()
+        return delay
+
+
+class PoiskKinoBase(abc.ABC): # настройки, кэш, предохранитель и цикл повторов, общие для sync и async клиентов
+    singleflight_class = SingleFlight
+
+    def __init__(self, api_key=None, base_url=None, pool_size=None, max_retries=None,
+                 backoff=None, backoff_max=None, connect_timeout=None, timeouts=None, cache=None, catalog=None,
+                 singleflight=None, title_index=None, breaker=None, keys=None):
+        if keys is None: # явно переданный ключ — пул из одного ключа без сохранения счетчиков
+            keys = ApiKeyPool([ApiKey(api_key)]) if api_key else get_key_pool()
+        self.keys = keys
+        self.base_url = base_url or config.POISKINO_API_URL
+        self.pool_size = pool_size
+        self.max_retries = config.POISKINO_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = config.POISKINO_BACKOFF if backoff is None else backoff
+        self.backoff_max = config.POISKINO_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.connect_timeout = connect_timeout or config.POISKINO_CONNECT_TIMEOUT
+        self.timeouts = { # таймауты чтения по эндпоинтам
+            SEARCH_ENDPOINT: config.POISKINO_SEARCH_TIMEOUT,
+            DISCOVER_ENDPOINT: config.POISKINO_DISCOVER_TIMEOUT,
+        }
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.headers = {"Accept": "application/json"} # X-API-KEY — в каждом запросе, из пула ключей
+
+        self.cache = cache if cache is not None else get_cache()
+        self.catalog = catalog if catalog is not None else get_catalog() # локальный каталог, если настроен
+        if singleflight is None and config.SINGLEFLIGHT_ENABLED: # одинаковые запросы в полете склеиваются в один
+            singleflight = self.singleflight_class(max_waiters=config.SINGLEFLIGHT_MAX_WAITERS)
+        self.singleflight = singleflight
+        self.title_index = title_index if title_index is not None else get_title_index()
+        self.breaker = breaker if breaker is not None else get_breaker()
+
+    def read_timeout(self, endpoint: str) -> float:
+        return self.timeouts.get(endpoint, config.POISKINO_DISCOVER_TIMEOUT)
+
+    def _ready(self, endpoint: str, params: dict): # (ключ кэша, (ответ, устаревший ли он) без запроса к API или None)
+        key = self._key(endpoint, params)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return key, (cached, False)
+        if self._breaker_open(endpoint, params, key):
+            return key, stale_response(self.cache, key, unavailable_error())
+        return key, None
+
+    def _key(self, endpoint: str, params: dict) -> str:
+        if self.keys is None:
+            raise ApiKeyMissingError("API ключ не найден")
+        return make_key(endpoint, params)
+
+    def _breaker_open(self, endpoint: str, params: dict, key: str) -> bool: # API недоступен: обработчик не ждет таймаутов
+        if not self.breaker or self.breaker.allow():
+            return False
+        if self.breaker.probe_due():
+            self._start_probe(endpoint, params, key)
+        return True
+
+    def _fallback(self, key: str, error: ApiError): # сохраненный ответ вместо ошибки, если она от API
+        if not can_serve_stale(error):
+            raise error
+        return stale_response(self.cache, key, error)
+
+    def _finished(self, endpoint: str, started, probe: bool, error=None): # метрики и предохранитель; ответ кэширует вызывающий
+        observe_request(endpoint, started, error)
+        record_outcome(self.breaker, started, error, probe)
+
+    @abc.abstractmethod
+    def _start_probe(self, endpoint: str, params: dict, key: str):
+        ...
+
+
+class PoiskKinoClient(PoiskKinoBase):
+    def __init__(self, api_key=None, base_url=None, pool_size=None, **options):
+        super().__init__(api_key, base_url, pool_size or config.POISKINO_POOL_SIZE, **options)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(self.headers)
+
+    def search(self, query: str, page: int = 1, limit: int = 10) -> MoviePage: # поиск по названию
+        result = self.catalog.search(query, page, limit) if self.catalog else None
+        if result is None:
+            result = to_page(*self._get(SEARCH_ENDPOINT, search_params(query, page, limit)))
+        return remember_titles(self.title_index, result)
+
+    def discover(self, filters: dict, page: int = 1, limit: int = 10,
+                 sort_field: str = None, sort_type: int = -1) -> MoviePage: # выборка по фильтрам (рейтинг, бюджет, ...)
+        result = self.catalog.discover(filters, page, limit, sort_field, sort_type) if self.catalog else None
+        if result is None:
+            result = to_page(*self._get(DISCOVER_ENDPOINT, discover_params(filters, page, limit, sort_field, sort_type)))
+        return remember_titles(self.title_index, result)
+
+    def close(self):
+        self.session.close()
+
+    def _get(self, endpoint: str, params: dict): # (ответ, устаревший ли он)
+        key, ready = self._ready(endpoint, params)
+        if ready is not None:
+            return ready
+        try:
+            if self.singleflight:
+                return self.singleflight.do(key, lambda: self._fetch_and_store(endpoint, params, key)), False
+            return self._fetch_and_store(endpoint, params, key), False
+        except ApiError as e:
+            return self._fallback(key, e)
+
+    def _start_probe(self, endpoint: str, params: dict, key: str):
+        threading.Thread(target=self._probe, args=(endpoint, params, key), name="poiskkino-probe", daemon=True).start()
+
+    def _probe(self, endpoint: str, params: dict, key: str): # пробный запрос полуоткрытого предохранителя
+        try:
+            self._fetch_and_store(endpoint, params, key, probe=True)
+        except ApiError as e:
+            logger.info("Пробный запрос к PoiskKino не удался: %s", e)
+
+    def _fetch_and_store(self, endpoint: str, params: dict, key: str, probe: bool = False) -> dict:
+        started = time.monotonic()
+        try:
+            data, size = self._fetch(endpoint, params)
+        except ApiError as e:
+            self._finished(endpoint, started, probe, error=e)
+            raise
+        self._finished(endpoint, started, probe)
+        if self.cache:
+            self.cache.set(key, endpoint, data, size)
+        return data
+
+    def _fetch(self, endpoint: str, params: dict):
+        url = self.base_url + endpoint
+        timeout = (self.connect_timeout, self.read_timeout(endpoint))
+        retries = RetryLoop(self, endpoint)
+        while True:
+            api_key = self.keys.acquire()
+            try:
+                response = self.session.get(url, params=params, headers={"X-API-KEY": api_key.value}, timeout=timeout)
+            except requests.exceptions.ConnectionError as e:
+                delay = retries.failed(ApiConnectionError(str(e)), e, "Ошибка соединения с")
+            except requests.exceptions.Timeout as e:
+                delay = retries.failed(ApiTimeoutError(str(e)), e, "Таймаут запроса к")
+            except requests.exceptions.RequestException as e:
+                raise ApiError(str(e)) from e
+            else:
+                delay = retries.answered(api_key, response.status_code, response.headers.get("Retry-After"))
+                if delay is None:
+                    return decode_response(response.status_code, response.content)
+                response.close()
+            if delay:
+                time.sleep(delay)
+
+
+_cache = None
+_breaker = None
+_client = None
+_client_lock = threading.Lock()
+
+def get_cache(): # общий кэш ответов для sync и async клиентов
+    global _cache
+    if _cache is None and config.CACHE_ENABLED:
+        with _client_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=config.CACHE_MAX_ENTRIES,
+                    max_bytes=config.CACHE_MAX_BYTES,
+                    ttls={SEARCH_ENDPOINT: config.CACHE_TTL_SEARCH, DISCOVER_ENDPOINT: config.CACHE_TTL_DISCOVER},
+                    disk_path=config.CACHE_DB_PATH or None,
+                    stale_ttl=config.CACHE_STALE_TTL,
+                )
+                metrics.collector("poiskkino_cache", _cache.stats)
+    return _cache
+
+def get_breaker(): # общий предохранитель для sync и async клиентов: API один
+    global _breaker
+    if _breaker is None and config.BREAKER_ENABLED:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    window=config.BREAKER_WINDOW,
+                    min_calls=config.BREAKER_MIN_CALLS,
+                    error_ratio=config.BREAKER_ERROR_RATIO,
+                    slow_call=config.BREAKER_SLOW_CALL,
+                    slow_ratio=config.BREAKER_SLOW_RATIO,
+                    open_seconds=config.BREAKER_OPEN_SECONDS,
+                )
+                metrics.collector("poiskkino_breaker", _breaker.stats)
+    return _breaker
+
+def get_catalog():
+    from api.catalog import get_catalog as get_local_catalog # api.catalog сам импортирует этот модуль
+    return get_local_catalog()
+
+def get_client() -> PoiskKinoClient: # общий клиент на весь процесс (один пул соединений)
+    global _client
+    if _client is None:
+        cache, breaker = get_cache(), get_breaker()
+        with _client_lock:
+            if _client is None:
+                _client = PoiskKinoClient(cache=cache, breaker=breaker)
+                if _client.singleflight:
+                    metrics.collector("poiskkino_singleflight", _client.singleflight.stats)
+    return _client
@@ -0,0 +1,145 @@
+import time
+import asyncio
+import logging
+
+import aiohttp
+
+import config
+from api.singleflight import AsyncSingleFlight
+from api.errors import ApiError, ApiConnectionError, ApiTimeoutError
+from services import metrics
+from api.poiskkino import (SEARCH_ENDPOINT, DISCOVER_ENDPOINT, MoviePage, PoiskKinoBase, RetryLoop,
+                           search_params, discover_params, to_page, remember_titles, decode_response,
+                           can_serve_stale, stale_or_raise, unavailable_error)
+
+logger = logging.getLogger(__name__)
+
+
+def _query_params(params: dict) -> list: # aiohttp, в отличие от requests, не разворачивает списки и не принимает float
+    items = []
+    for name, value in params.items():
+        for v in value if isinstance(value, (list, tuple)) else [value]:
+            items.append((name, str(v)))
+    return items
+
+
+class AsyncPoiskKinoClient(PoiskKinoBase): # решения — в PoiskKinoBase и RetryLoop, здесь только aiohttp
+    singleflight_class = AsyncSingleFlight
+
+    def __init__(self, api_key=None, base_url=None, pool_size=None, **options):
+        super().__init__(api_key, base_url, pool_size or config.POISKINO_ASYNC_POOL_SIZE, **options)
+        self._session = None
+        self._probe_task = None
+
+    async def search(self, query: str, page: int = 1, limit: int = 10) -> MoviePage:
+        result = None
+        if self.catalog: # запрос к SQLite — в потоке, чтобы не блокировать event loop
+            result = await asyncio.to_thread(self.catalog.search, query, page, limit)
+        if result is None:
+            result = to_page(*await self._get(SEARCH_ENDPOINT, search_params(query, page, limit)))
+        return remember_titles(self.title_index, result)
+
+    async def discover(self, filters: dict, page: int = 1, limit: int = 10,
+                       sort_field: str = None, sort_type: int = -1) -> MoviePage:
+        result = None
+        if self.catalog:
+            result = await asyncio.to_thread(self.catalog.discover, filters, page, limit, sort_field, sort_type)
+        if result is None:
+            result = to_page(*await self._get(DISCOVER_ENDPOINT, discover_params(filters, page, limit, sort_field, sort_type)))
+        return remember_titles(self.title_index, result)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _get_session(self) -> aiohttp.ClientSession: # сессия создается внутри запущенного event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self._session
+
+    async def _get(self, endpoint: str, params: dict): # (ответ, устаревший ли он)
+        key = self._key(endpoint, params)
+        if self.cache:
+            cached = await self._cache_call(self.cache.get, key)
+            if cached is not None:
+                return cached, False
+        if self._breaker_open(endpoint, params, key):
+            return await self._stale(key, unavailable_error())
+        try:
+            if self.singleflight:
+                return await self.singleflight.do(key, lambda: self._fetch_and_store(endpoint, params, key)), False
+            return await self._fetch_and_store(endpoint, params, key), False
+        except ApiError as e:
+            if not can_serve_stale(e):
+                raise
+            return await self._stale(key, e)
+
+    async def _cache_call(self, method, *args): # дисковый уровень кэша (SQLite) — в потоке, память — сразу
+        if self.cache.on_disk:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def _stale(self, key: str, error: ApiError):
+        return stale_or_raise(await self._cache_call(self.cache.get_stale, key) if self.cache else None, key, error)
+
+    def _start_probe(self, endpoint: str, params: dict, key: str): # ссылка на задачу, чтобы ее не собрал сборщик мусора
+        self._probe_task = asyncio.ensure_future(self._probe(endpoint, params, key))
+
+    async def _probe(self, endpoint: str, params: dict, key: str):
+        try:
+            await self._fetch_and_store(endpoint, params, key, probe=True)
+        except ApiError as e:
+            logger.info("Пробный запрос к PoiskKino не удался: %s", e)
+        except asyncio.CancelledError: # event loop останавливается — не оставляем предохранитель полуоткрытым
+            self.breaker.record(0, failed=True, probe=True)
+            raise
+
+    async def _fetch_and_store(self, endpoint: str, params: dict, key: str, probe: bool = False) -> dict:
+        started = time.monotonic()
+        try:
+            data, size = await self._fetch(endpoint, params)
+        except ApiError as e:
+            self._finished(endpoint, started, probe, error=e)
+            raise
+        self._finished(endpoint, started, probe)
+        if self.cache:
+            await self._cache_call(self.cache.set, key, endpoint, data, size)
+        return data
+
+    async def _fetch(self, endpoint: str, params: dict):
+        url = self.base_url + endpoint
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout(endpoint))
+        session = self._get_session()
+        retries = RetryLoop(self, endpoint)
+        while True:
+            api_key = self.keys.acquire()
+            try:
+                async with session.get(url, params=_query_params(params), headers={"X-API-KEY": api_key.value},
+                                       timeout=timeout) as response:
+                    body = await response.read()
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+            except asyncio.TimeoutError as e:
+                delay = retries.failed(ApiTimeoutError(str(e) or "timeout"), e, "Таймаут запроса к")
+            except aiohttp.ClientConnectionError as e:
+                delay = retries.failed(ApiConnectionError(str(e)), e, "Ошибка соединения с")
+            except aiohttp.ClientError as e:
+                raise ApiError(str(e)) from e
+            else:
+                delay = retries.answered(api_key, status, retry_after)
+                if delay is None:
+                    return decode_response(status, body)
+            if delay:
+                await asyncio.sleep(delay)
+
+
+_client = None
+
+def get_async_client() -> AsyncPoiskKinoClient: # один клиент на event loop процесса
+    global _client
+    if _client is None:
+        _client = AsyncPoiskKinoClient()
+        if _client.singleflight:
+            metrics.collector("poiskkino_singleflight", _client.singleflight.stats)
+    return _client
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+from api.errors import ApiOverloadedError
+
+# Одинаковые запросы, пришедшие, пока первый еще выполняется, не идут в API повторно:
+# они ждут ответ первого и получают тот же результат (или ту же ошибку).
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _Stats:
+    def __init__(self, max_waiters):
+        self.max_waiters = max_waiters # сколько запросов может ждать один ответ; 0 — без ограничения
+        self.calls = 0 # ушло в API
+        self.collapsed = 0 # получили чужой ответ
+        self.rejected = 0 # отклонено из-за max_waiters
+        self.peak_waiters = 0
+
+    def _join(self, key, waiters): # вызывается под блокировкой
+        if self.max_waiters and waiters >= self.max_waiters:
+            self.rejected += 1
+            raise ApiOverloadedError(f"Ответа на {key} уже ждут {waiters} запросов")
+        self.collapsed += 1
+        self.peak_waiters = max(self.peak_waiters, waiters + 1)
+
+    def stats(self, in_flight) -> dict:
+        requests = self.calls + self.collapsed
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "rejected": self.rejected,
+            "collapse_ratio": round(self.collapsed / requests, 4) if requests else 0.0,
+            "peak_waiters": self.peak_waiters,
+            "in_flight": in_flight,
+        }
+
+
+class SingleFlight(_Stats): # для потоков (TeleBot, webhook воркеры, предзагрузка)
+    def __init__(self, max_waiters=100):
+        super().__init__(max_waiters)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self._join(key, call.waiters)
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return super().stats(len(self._calls))
+
+
+class AsyncSingleFlight(_Stats): # для AsyncTeleBot: все в одном event loop, блокировка не нужна
+    def __init__(self, max_waiters=100):
+        super().__init__(max_waiters)
+        self._calls = {} # key -> (Task, [waiters])
+
+    async def do(self, key, coro_fn):
+        entry = self._calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(coro_fn())
+            entry = self._calls[key] = [task, 0]
+            self.calls += 1
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self._join(key, entry[1])
+            entry[1] += 1
+        # shield: отмена одного ожидающего (пользователь ушел) не отменяет общий запрос
+        return await asyncio.shield(entry[0])
+
+    def stats(self) -> dict:
+        return super().stats(len(self._calls))
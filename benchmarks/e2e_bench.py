@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stats import latency_summary
+
+# Сквозной прогон бота: настоящие обработчики (main.py: TeleBot или AsyncTeleBot, очередь отправки,
+# кэш, предзагрузка, история) против FakeTelegram и FakePoiskKino. Каждый пользователь проходит сессию
+# /start -> поиск по названию -> страницы рейтинга -> страницы бюджета -> популярное -> история. Задержка ответа —
+# время обработки одного обновления, включая все отправленные в ответ сообщения.
+#
+#   python -m benchmarks.e2e_bench --users 200 --concurrency 50 --api-latency 0.2 --output e2e.json
+#   python -m benchmarks.e2e_bench --engine async --compare e2e.json
+#
+# Остальные настройки бота (CACHE_*, PREFETCH_*, SENDER_WORKERS...) берутся из окружения, как в main.py.
+
+RATINGS = ["7", "7.5", "8", "8.5"]
+BUDGETS = ["50", "100", "150", "200"] # млн $, кратны шагу бюджетов в FakePoiskKino
+
+
+def _update(update_id, chat_id, text=None, data=None):
+    user = {"id": chat_id, "is_bot": False, "first_name": "Bench"}
+    chat = {"id": chat_id, "type": "private"}
+    if data is not None:
+        message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "text": "Листайте результаты:"}
+        if data.startswith("c:"): # карусель: кнопка на сообщении с постером
+            message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "caption": "Bench",
+                       "photo": [{"file_id": f"bench-{update_id}", "file_unique_id": f"b{update_id}", "width": 600, "height": 900}]}
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": "bench", "data": data, "from": user, "message": message}}
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": text}}
+
+
+def make_session(chat_id, rnd, titles):
+    # (шаг, update); популярные названия встречаются чаще — как в жизни, и так видна работа кэша
+    title = rnd.choices(titles, weights=[1 / (rank + 1) for rank in range(len(titles))])[0]
+    rating = float(rnd.choice(RATINGS))
+    budget_m = rnd.choice(BUDGETS)
+    budget_usd = int(float(budget_m) * 1_000_000)
+    import config
+    if config.CAROUSEL_ENABLED: # следующий фильм, затем переход на следующую страницу
+        from handlers.common import PAGE_LIMIT
+        from handlers.carousel import pack
+        rating_pages = [pack('rating', rating, 1, 0), pack('rating', rating, PAGE_LIMIT, 1)]
+        budget_pages = [pack('budget', budget_usd, 1, 0), pack('budget', budget_usd, PAGE_LIMIT, 1)]
+    else:
+        rating_pages = [f"rating_page:{rating}:2", f"rating_page:{rating}:3"]
+        budget_pages = [f"budget_page:{budget_usd}:2", f"budget_page:{budget_usd}:3"]
+    steps = [
+        ("start", "/start"),
+        ("menu", "Поиск фильма/сериала"),
+        ("menu", "По названию"),
+        ("name_search", title),
+        ("menu", "По рейтингу"),
+        ("rating_search", str(rating)),
+        ("rating_page", rating_pages[0]),
+        ("rating_page", rating_pages[1]),
+        ("menu", "По бюджету"),
+        ("budget_search", budget_m),
+        ("budget_page", budget_pages[0]),
+        ("budget_page", budget_pages[1]),
+        ("menu", "Назад"),
+        ("popular", "Популярное"),
+        ("history", "История запросов"),
+    ]
+    session = []
+    for index, (step, value) in enumerate(steps):
+        update_id = chat_id * 100 + index
+        if step.endswith("_page"):
+            session.append((step, _update(update_id, chat_id, data=value)))
+        else:
+            session.append((step, _update(update_id, chat_id, text=value)))
+    return session
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {} # шаг -> [секунды]
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds, error=None):
+        with self._lock:
+            self.latencies.setdefault(step, []).append(seconds)
+            if error is not None:
+                name = type(error).__name__
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    def all(self):
+        return [value for values in self.latencies.values() for value in values]
+
+
+def replay_sync(bot, sessions, concurrency, think, recorder):
+    from telebot import types
+
+    def run_session(session):
+        for step, update in session:
+            started = time.perf_counter()
+            error = None
+            try:
+                for future in bot.process_new_updates([types.Update.de_json(update)]) or []: # CHAT_POOL_ENABLED: ждем обработчик
+                    if future is not None:
+                        future.result()
+            except Exception as e:
+                error = e
+            recorder.add(step, time.perf_counter() - started, error)
+            if think:
+                time.sleep(think)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_session, sessions))
+
+
+async def replay_async(bot, sessions, concurrency, think, recorder):
+    from telebot import types
+    from api.poiskkino_async import get_async_client
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(session):
+        async with semaphore:
+            for step, update in session:
+                started = time.perf_counter()
+                error = None
+                try:
+                    for future in await bot.process_new_updates([types.Update.de_json(update)]) or []:
+                        if future is not None:
+                            await future
+                except Exception as e:
+                    error = e
+                recorder.add(step, time.perf_counter() - started, error)
+                if think:
+                    await asyncio.sleep(think)
+
+    try:
+        await asyncio.gather(*(run_session(session) for session in sessions))
+    finally:
+        await get_async_client().close()
+        await bot.close_session()
+
+
+def configure(args, workdir):
+    # до импорта main: database открывает HISTORY_DB_PATH, а main создает бота по BOT_ENGINE
+    import config
+    from telebot import apihelper, asyncio_helper
+    from benchmarks.fake_telegram import FakeTelegram
+    from benchmarks.fake_poiskkino import FakePoiskKino
+
+    if args.telegram_limits: # лимиты как у Telegram; очередь отправки работает с запасом
+        telegram = FakeTelegram(latency=args.telegram_latency, error_rate=args.telegram_error_rate,
+                                global_rate=30.0, chat_rate=1.0, chat_burst=config.SENDER_CHAT_BURST)
+        config.SENDER_GLOBAL_RATE = telegram.global_rate * args.headroom
+        config.SENDER_CHAT_RATE = telegram.chat_rate * args.headroom
+    else: # без лимитов: замеряется сам бот, а не скорость, которую разрешает Telegram
+        telegram = FakeTelegram(latency=args.telegram_latency, error_rate=args.telegram_error_rate,
+                                global_rate=1e9, chat_rate=1e9, chat_burst=1_000_000)
+        config.SENDER_GLOBAL_RATE = config.SENDER_CHAT_RATE = config.SENDER_GROUP_RATE = 1e9
+        config.SENDER_CHAT_BURST = 1_000_000
+    poiskkino = FakePoiskKino(movies=args.movies, latency=args.api_latency, jitter=args.api_jitter,
+                              error_rate=args.api_error_rate)
+
+    apihelper.API_URL = asyncio_helper.API_URL = telegram.api_url
+    config.BOT_TOKEN = "123:bench"
+    config.BOT_ENGINE = args.engine
+    config.BOT_INGESTION = "webhook" # TeleBot без своих потоков: обновление обрабатывается в вызывающем потоке
+    config.POISKINO_API_URL = poiskkino.base_url
+    config.POISKINO_API_KEY = "bench"
+    config.POISKINO_API_KEYS = ""
+    config.POISKINO_BACKOFF = min(config.POISKINO_BACKOFF, 0.05)
+    config.HISTORY_DB_PATH = os.path.join(workdir, "history.db")
+    config.STATE_DB_PATH = os.path.join(workdir, "state.db")
+    config.POISKINO_KEYS_DB_PATH = os.path.join(workdir, "keys.db")
+    config.CATALOG_DB_PATH = ""
+    config.CACHE_DB_PATH = ""
+    return telegram.start(), poiskkino.start()
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(result, baseline): # отношение к прошлому прогону: > 1 — больше, чем было
+    def ratio(new, old):
+        return round(new / old, 3) if old else None
+    return {
+        "baseline_version": baseline.get("version"),
+        "updates_per_s": ratio(result["updates_per_s"], baseline["updates_per_s"]),
+        "p50_ms": ratio(result["latency"]["p50_ms"], baseline["latency"]["p50_ms"]),
+        "p95_ms": ratio(result["latency"]["p95_ms"], baseline["latency"]["p95_ms"]),
+        "p99_ms": ratio(result["latency"]["p99_ms"], baseline["latency"]["p99_ms"]),
+        "upstream_calls": ratio(result["poiskkino"]["total"], baseline["poiskkino"]["total"]),
+        "upstream_bytes": ratio(result["poiskkino"].get("bytes", 0), baseline["poiskkino"].get("bytes", 0)),
+    }
+
+
+def run(args):
+    import logging
+    workdir = tempfile.mkdtemp(prefix="e2e_bench_")
+    telegram, poiskkino = configure(args, workdir)
+
+    import main
+    from services.sender import get_scheduler
+    from benchmarks.fake_poiskkino import TITLES
+    logging.getLogger().setLevel(args.log_level)
+
+    rnd = random.Random(args.seed)
+    sessions = [make_session(1_000_000 + user, rnd, TITLES) for user in range(args.users)]
+    recorder = Recorder()
+    started = time.perf_counter()
+    if args.engine == "async":
+        asyncio.run(replay_async(main.bot, sessions, args.concurrency, args.think, recorder))
+    else:
+        replay_sync(main.bot, sessions, args.concurrency, args.think, recorder)
+    duration = time.perf_counter() - started
+
+    import config
+    from api.poiskkino import get_cache
+    from services.poster_cache import get_poster_cache
+    sender = None
+    if config.SENDER_ENABLED:
+        sender = get_scheduler().stats()
+        get_scheduler().stop()
+    cache = get_cache()
+    chat_pool = None
+    if config.CHAT_POOL_ENABLED:
+        from services.chat_pool import get_chat_pool, get_async_chat_pool
+        chat_pool = (get_async_chat_pool() if args.engine == "async" else get_chat_pool()).stats()
+    updates = sum(len(session) for session in sessions)
+    result = {
+        "version": git_version(),
+        "engine": args.engine,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "updates": updates,
+        "duration_s": round(duration, 3),
+        "updates_per_s": round(updates / duration, 2) if duration else 0.0,
+        "latency": latency_summary(recorder.all()),
+        "latency_by_step": {step: latency_summary(values) for step, values in sorted(recorder.latencies.items())},
+        "failures": recorder.failures,
+        "poiskkino": poiskkino.stats(),
+        "telegram": telegram.stats(),
+        "response_cache": cache.stats() if cache else None,
+        "poster_cache": get_poster_cache().stats(),
+        "sender": sender,
+        "chat_pool": chat_pool,
+        "settings": {"api_latency": args.api_latency, "api_error_rate": args.api_error_rate,
+                     "telegram_latency": args.telegram_latency, "telegram_limits": args.telegram_limits,
+                     "cache": config.CACHE_ENABLED, "singleflight": config.SINGLEFLIGHT_ENABLED,
+                     "prefetch_depth": config.PREFETCH_DEPTH, "sender": config.SENDER_ENABLED,
+                     "chat_pool_workers": config.CHAT_POOL_WORKERS if config.CHAT_POOL_ENABLED else None},
+    }
+    telegram.stop()
+    poiskkino.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end bot benchmark against fake Telegram and PoiskKino servers")
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync")
+    parser.add_argument("--users", type=int, default=100, help="сколько сессий проиграть")
+    parser.add_argument("--concurrency", type=int, default=20, help="сессий одновременно")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между сообщениями, сек")
+    parser.add_argument("--movies", type=int, default=5000, help="размер каталога FakePoiskKino")
+    parser.add_argument("--api-latency", type=float, default=0.1)
+    parser.add_argument("--api-jitter", type=float, default=0.05)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-limits", action=argparse.BooleanOptionalAction, default=True,
+                        help="лимиты Telegram (30/с на бота, 1/с на чат); --no-telegram-limits — замерить только бота")
+    parser.add_argument("--headroom", type=float, default=0.9, help="доля лимитов Telegram, которую использует очередь отправки")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="сохранить результат в JSON файл")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr): # в stdout — только JSON результата
+        result = run(args)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
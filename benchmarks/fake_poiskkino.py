@@ -0,0 +1,212 @@
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Поддельный PoiskKino API для нагрузочных прогонов: /v1.4/movie (фильтры rating.kp и budget.value,
+# сортировка, страницы, selectFields) и /v1.4/movie/search. Каталог генерируется детерминированно из seed;
+# документы, как у настоящего API, содержат персоны, факты, видео и прочее, что бот не показывает.
+# Задержка и доля ошибок задаются параметрами, все вызовы и отданные байты считаются.
+#
+#   python -m benchmarks.fake_poiskkino --port 8082 --latency 0.2
+#   POISKINO_API_URL=http://127.0.0.1:8082
+
+TITLES = ["Матрица", "Интерстеллар", "Начало", "Бойцовский клуб", "Зеленая миля", "Форрест Гамп",
+          "Список Шиндлера", "Побег из Шоушенка", "Леон", "Титаник", "Аватар", "Брат", "Служебный роман",
+          "Властелин колец", "Гарри Поттер", "Назад в будущее", "Терминатор", "Чужой", "Крестный отец", "Джокер"]
+BUDGETS = [10_000_000 * i for i in range(1, 31)] # бюджеты кратны 10 млн, чтобы фильтр budget.value находил фильмы
+GENRES = ["драма", "комедия", "фантастика", "боевик", "триллер", "мелодрама", "криминал", "приключения"]
+COUNTRIES = ["США", "Россия", "Великобритания", "Франция", "Германия", "Япония"]
+PROFESSIONS = [("актеры", "actor"), ("режиссеры", "director"), ("продюсеры", "producer"), ("композиторы", "composer")]
+
+
+def make_persons(count, rnd): # общие для всех фильмов: JSON ответа полного размера, а память сервера не растет
+    return [{"id": 100_000 + i, "photo": f"https://image.example/person/{100_000 + i}.jpg",
+             "name": f"Персона {i}", "enName": f"Person {i}", "description": rnd.choice(["", "камео", "в титрах не указан"]),
+             "profession": PROFESSIONS[i % len(PROFESSIONS)][0], "enProfession": PROFESSIONS[i % len(PROFESSIONS)][1]}
+            for i in range(count)]
+
+
+def add_details(movie, rnd, persons): # поля, которые бот не использует
+    i = movie["id"]
+    movie["rating"].update({"filmCritics": round(rnd.uniform(3, 9.5), 1), "russianFilmCritics": 0, "await": None})
+    movie.update({
+        "type": "movie", "typeNumber": 1, "status": None, "movieLength": rnd.randint(80, 180),
+        "shortDescription": "Короткое описание фильма.", "slogan": "Слоган фильма",
+        "votes": {"kp": rnd.randint(100, 900_000), "imdb": rnd.randint(100, 2_000_000), "filmCritics": 0, "await": 0},
+        "backdrop": {"url": f"https://image.example/backdrop/{i}.jpg", "previewUrl": f"https://image.example/backdrop/{i}_small.jpg"},
+        "genres": [{"name": name} for name in rnd.sample(GENRES, 3)],
+        "countries": [{"name": name} for name in rnd.sample(COUNTRIES, 2)],
+        "names": [{"name": movie["name"]}, {"name": movie["alternativeName"], "language": "EN", "type": None}],
+        "persons": rnd.sample(persons, rnd.randint(15, 40)),
+        "facts": [{"value": "Интересный факт о съемках фильма. " * 3, "type": "FACT", "spoiler": False} for _ in range(rnd.randint(2, 8))],
+        "videos": {"trailers": [{"url": f"https://video.example/{i}/{n}", "name": "Трейлер", "site": "youtube", "type": "TRAILER"}
+                                for n in range(rnd.randint(1, 4))]},
+        "similarMovies": [{"id": rnd.randint(1, 1_000_000), "name": "Похожий фильм", "type": "movie"} for _ in range(5)],
+        "createdAt": "2020-01-01T00:00:00.000Z",
+    })
+
+
+def make_movies(count, seed=1, details=True):
+    rnd = random.Random(seed)
+    detail_rnd = random.Random(seed + 1) # отдельный генератор: основные поля не зависят от details
+    persons = make_persons(500, detail_rnd)
+    movies = []
+    for i in range(1, count + 1):
+        title = TITLES[i % len(TITLES)]
+        movie = {
+            "id": i,
+            "name": f"{title} {i // len(TITLES)}" if i >= len(TITLES) else title,
+            "alternativeName": f"Movie {i}",
+            "year": rnd.randint(1960, 2025),
+            "description": "Описание фильма. " * rnd.randint(5, 30),
+            "rating": {"kp": round(rnd.uniform(3, 9.5), 1), "imdb": round(rnd.uniform(3, 9.5), 1)},
+            "updatedAt": "2026-01-01T00:00:00.000Z",
+        }
+        if rnd.random() < 0.6:
+            movie["budget"] = {"value": rnd.choice(BUDGETS), "currency": "$"}
+        if rnd.random() < 0.8:
+            movie["poster"] = {"url": f"https://image.example/poster/{i}.jpg"}
+        if details:
+            add_details(movie, detail_rnd, persons)
+        movies.append(movie)
+    return movies
+
+
+def _field(movie, path):
+    value = movie
+    for part in path.split("."):
+        value = (value or {}).get(part)
+    return value
+
+
+def _matches(value, condition): # "7.5-10" — диапазон, иначе точное значение, как у API
+    if value is None:
+        return False
+    if "-" in condition.strip("-"):
+        low, high = condition.split("-", 1)
+        return float(low) <= value <= float(high)
+    return value == float(condition)
+
+
+class FakePoiskKino:
+    def __init__(self, host="127.0.0.1", port=0, movies=5000, latency=0.0, jitter=0.0, error_rate=0.0, seed=1, key_quota=0):
+        self.movies = make_movies(movies, seed)
+        self.latency = latency # секунд на запрос
+        self.jitter = jitter # случайная добавка к задержке, от 0 до jitter секунд
+        self.error_rate = error_rate # доля ответов 503 (клиент их повторяет)
+        self.key_quota = key_quota # запросов на один X-API-KEY, дальше 403 как при исчерпанном дневном лимите; 0 — без лимита
+        self.key_calls = {} # X-API-KEY -> число запросов
+        self.calls = {} # endpoint -> число запросов
+        self.errors = 0
+        self.bytes = 0 # отдано тел ответов
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self): # значение POISKINO_API_URL
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-poiskkino", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "total": sum(self.calls.values()), "errors": self.errors, "bytes": self.bytes,
+                    "keys": len(self.key_calls)}
+
+    def handle(self, path, params, api_key=None):
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+            key_calls = self.key_calls[api_key] = self.key_calls.get(api_key, 0) + 1
+        if self.key_quota and key_calls > self.key_quota:
+            return 403, {"statusCode": 403, "message": "Вы израсходовали дневной лимит запросов"}
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return 503, {"statusCode": 503, "message": "Service Unavailable"}
+        if path == "/v1.4/movie/search":
+            query = params.get("query", [""])[0].casefold()
+            docs = [m for m in self.movies if query in m["name"].casefold() or query in m["alternativeName"].casefold()]
+        elif path == "/v1.4/movie":
+            page, fields = self._page(self._discover(params), params), params.get("selectFields")
+            if fields: # как у API: только запрошенные поля
+                page["docs"] = [{name: m[name] for name in fields if name in m} for m in page["docs"]]
+            return 200, page
+        else:
+            return 404, {"statusCode": 404, "message": "Not Found"}
+        return 200, self._page(docs, params)
+
+    def _discover(self, params):
+        docs = self.movies
+        for name in ("rating.kp", "budget.value", "year"):
+            for condition in params.get(name, []):
+                docs = [m for m in docs if _matches(_field(m, name), condition)]
+        sort_field = params.get("sortField", [None])[0]
+        if sort_field:
+            reverse = params.get("sortType", ["-1"])[0] == "-1"
+            docs = sorted(docs, key=lambda m: _field(m, sort_field) or 0, reverse=reverse)
+        return docs
+
+    def _page(self, docs, params):
+        page = int(params.get("page", ["1"])[0])
+        limit = int(params.get("limit", ["10"])[0])
+        return {"docs": docs[(page - 1) * limit:page * limit], "total": len(docs),
+                "limit": limit, "page": page, "pages": (len(docs) + limit - 1) // limit}
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, как у настоящего API: пул соединений клиента переиспользуется
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, payload = fake.handle(url.path.rstrip("/"), parse_qs(url.query), self.headers.get("X-API-KEY"))
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                with fake._lock:
+                    fake.bytes += len(data)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake PoiskKino API with latency and error injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakePoiskKino(args.host, args.port, args.movies, args.latency, args.jitter, args.error_rate).start()
+    print(f"Fake PoiskKino: {fake.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from email.parser import BytesParser
+from urllib.parse import urlsplit, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from services.sender import TokenBucket
+
+# Поддельный Bot API для проверки очереди отправки и нагрузочных прогонов без настоящего Telegram.
+# Отвечает на send*/edit*/delete*, считает вызовы и, как Telegram, отдает 429 с retry_after
+# при превышении лимитов на чат и на бота (те же корзины токенов, что и в services.sender).
+#
+#   python -m benchmarks.fake_telegram --port 8081
+#   apihelper.API_URL = "http://127.0.0.1:8081/bot{0}/{1}"
+
+# в лимит чата идут новые сообщения (альбом — одно), правки и удаления — только в общий лимит бота
+CHAT_FREE_METHODS = {"editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup", "deleteMessage"}
+
+
+class FakeTelegram:
+    def __init__(self, host="127.0.0.1", port=0, chat_rate=1.0, chat_burst=5, global_rate=30.0,
+                 latency=0.0, error_rate=0.0):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_rate = global_rate
+        self.latency = latency # секунд на запрос
+        self.error_rate = error_rate # доля ответов 500
+        self.calls = {} # метод -> число вызовов
+        self.messages = [] # (chat_id, method, monotonic time) принятых отправок
+        self.flood_errors = 0
+        self._chat_buckets = {} # chat_id -> TokenBucket
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def api_url(self): # формат telebot.apihelper.API_URL
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "delivered": len(self.messages), "flood_errors": self.flood_errors}
+
+    def handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+        chat_id = params.get("chat_id")
+        count = len(json.loads(params["media"])) if method == "sendMediaGroup" else 1
+        chat_count = 0 if method in CHAT_FREE_METHODS else 1 # альбом в лимите чата — одно сообщение
+        now = time.monotonic()
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if chat_id is not None:
+                retry_after = self._flood_wait(chat_id, count, chat_count, now)
+                if retry_after:
+                    self.flood_errors += 1
+                    return 429, {"ok": False, "error_code": 429,
+                                 "description": f"Too Many Requests: retry after {retry_after}",
+                                 "parameters": {"retry_after": retry_after}}
+                for _ in range(count):
+                    self.messages.append((chat_id, method, now))
+        return 200, {"ok": True, "result": self._result(method, chat_id, count)}
+
+    def _flood_wait(self, chat_id, count, chat_count, now): # целые секунды до освобождения лимита, 0 — можно
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        chat_delay = bucket.delay(now)
+        delay = max(chat_delay if chat_count else 0.0, self._global_bucket.delay(now))
+        if delay:
+            return max(1, int(delay + 0.999))
+        bucket.take(chat_count)
+        self._global_bucket.take(count)
+        return 0
+
+    def _result(self, method, chat_id, count):
+        if method in ("deleteMessage", "answerCallbackQuery", "sendChatAction", "setWebhook", "deleteWebhook"):
+            return True
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        chat = {"id": int(chat_id or 0), "type": "private" if int(chat_id or 0) > 0 else "group"}
+        if method == "sendMediaGroup":
+            return [self._message(chat, photo=True) for _ in range(count)]
+        return self._message(chat, photo=method in ("sendPhoto", "editMessageMedia"))
+
+    def _message(self, chat, photo=False):
+        message_id = next(self._message_ids)
+        message = {"message_id": message_id, "date": int(time.time()), "chat": chat}
+        if photo:
+            message["photo"] = [{"file_id": f"fake-file-{message_id}", "file_unique_id": f"u{message_id}", "width": 600, "height": 900}]
+        return message
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self): # AsyncTeleBot (aiohttp) шлет параметры телом GET запроса
+                self.do_POST()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self._dispatch(self.rfile.read(length) if length else b"")
+
+            def _dispatch(self, body):
+                url = urlsplit(self.path)
+                parts = url.path.strip("/").split("/")
+                if len(parts) != 2 or not parts[0].startswith("bot"):
+                    return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                params = dict(parse_qsl(url.query))
+                params.update(self._body_params(body))
+                status, payload = fake.handle(parts[1], params)
+                self._reply(status, payload)
+
+            def _body_params(self, body):
+                content_type = self.headers.get("Content-Type", "")
+                if not body:
+                    return {}
+                if content_type.startswith("application/json"):
+                    return json.loads(body)
+                if content_type.startswith("multipart/form-data"):
+                    message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+                    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True).decode("utf-8", "replace")
+                            for part in message.get_payload() if not part.get_filename()}
+                return dict(parse_qsl(body.decode("utf-8")))
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API with flood control")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--chat-burst", type=int, default=5)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeTelegram(args.host, args.port, args.chat_rate, args.chat_burst, args.global_rate,
+                        args.latency, args.error_rate).start()
+    print(f"Fake Telegram: {fake.api_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
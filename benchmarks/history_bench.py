@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+import database
+from database import db, History
+from benchmarks.stats import latency_summary
+
+# Задержка запроса "История запросов" (get_history) в зависимости от размера таблицы.
+#
+#   python -m benchmarks.history_bench --sizes 10000,100000,1000000,10000000
+#
+# --no-index повторяет замер без индекса (user_id, timestamp) для сравнения.
+
+
+def populate(rows, users, start_rows=0): # дописываем таблицу до rows записей
+    now = datetime.datetime.now()
+    batch = []
+    with db.atomic():
+        for i in range(start_rows, rows):
+            batch.append((random.randrange(users), f"Рейтинг от {i % 10}", now - datetime.timedelta(seconds=rows - i)))
+            if len(batch) == 30_000:
+                History.insert_many(batch, fields=[History.user_id, History.query, History.timestamp]).execute()
+                batch = []
+        if batch:
+            History.insert_many(batch, fields=[History.user_id, History.query, History.timestamp]).execute()
+
+
+def measure(users, lookups):
+    latencies = []
+    for _ in range(lookups):
+        user_id = random.randrange(users)
+        started = time.perf_counter()
+        database.get_history(user_id, limit=7)
+        latencies.append(time.perf_counter() - started)
+    return latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_history latency vs. History table size")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--no-index", action="store_true", help="удалить индекс (user_id, timestamp) перед замером")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="history-bench-"), "history.db")
+    db.init(path, pragmas=database.PRAGMAS)
+    database.create_tables()
+    if args.no_index:
+        db.execute_sql('DROP INDEX IF EXISTS "history_user_id_timestamp"')
+
+    results = []
+    rows = 0
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        populate(size, args.users, rows)
+        rows = size
+        db.execute_sql("ANALYZE")
+        results.append(dict(rows=size, index=not args.no_index, **measure(args.users, args.lookups)))
+        print(json.dumps(results[-1]))
+
+    db.close()
+    print(json.dumps({"database": path, "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import json
+import time
+import random
+import argparse
+
+from benchmarks.stats import latency_summary
+from benchmarks.fake_poiskkino import TITLES, make_movies
+
+# Ответ на inline-запрос из индекса названий: поиск в TitleIndex и сборка результатов для answerInlineQuery,
+# без сети. Запросы — как при наборе: "М", "Ма", "Мат"... для популярных названий, иногда с номером фильма
+# и листанием (next_offset). Цель — p95 меньше 50 мс при полном индексе.
+#
+#   python -m benchmarks.inline_bench --movies 20000 --queries 20000
+
+
+def make_queries(count, rnd):
+    queries = []
+    while len(queries) < count:
+        title = rnd.choice(TITLES)
+        if rnd.random() < 0.3:
+            title = f"{title} {rnd.randrange(1000)}"
+        for length in range(1, len(title) + 1): # каждое нажатие клавиши — отдельный запрос
+            queries.append((title[:length], 0))
+        queries.append((title, 20)) # следующая страница
+    return queries[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inline answers served from the in-memory title index")
+    parser.add_argument("--movies", type=int, default=20_000, help="фильмов в индексе")
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import config
+    from services.title_index import TitleIndex
+    from handlers.inline_handler import lookup, answer_kwargs
+
+    rnd = random.Random(args.seed)
+    index = TitleIndex(max_entries=args.movies)
+    movies = make_movies(args.movies, seed=args.seed)
+    started = time.perf_counter()
+    for start in range(0, len(movies), 250): # страницами, как приходят ответы PoiskKino
+        index.add(movies[start:start + 250])
+    build = time.perf_counter() - started
+
+    latencies, results = [], 0
+    for text, offset in make_queries(args.queries, rnd):
+        started = time.perf_counter()
+        found, total, _ = lookup(index, text, offset)
+        answer = answer_kwargs(found, total, offset, complete=len(found) == config.INLINE_RESULTS)
+        latencies.append(time.perf_counter() - started)
+        results += len(answer["results"])
+
+    print(json.dumps({
+        "movies": args.movies,
+        "build_s": round(build, 3),
+        "index": index.stats(),
+        "results_per_answer": round(results / len(latencies), 2),
+        "latency": latency_summary(latencies),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import io
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+from benchmarks.stats import latency_summary
+from benchmarks.fake_poiskkino import TITLES
+
+# Сколько логирование добавляет к обработке одного обновления в потоке обработчика.
+# before — как было: basicConfig с записью в поток прямо из обработчика, f-строки, полное тело ответа API с ошибкой.
+# after — services.logs: очередь и поток записи, %-стиль, JSON с chat_id/update_id, выборка частых событий,
+# обрезанное тело ответа. На каждое обновление — четыре INFO о поиске по названию, на каждое error_every-е —
+# ошибка HTTP с телом body_kb КБ. Медленный stderr (терминал, journald) имитируется задержкой на каждую запись,
+# остальная работа обработчика — паузой io_ms между обновлениями; замеряются только вызовы логгера.
+#
+#   python -m benchmarks.logging_bench --updates 20000 --threads 8 --sample 0.1 --write-delay-ms 0.05
+
+
+class SlowStream(io.TextIOBase): # файл с задержкой на каждую запись
+    def __init__(self, path, delay):
+        self.file = open(path, "w", encoding="utf-8")
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.lines += text.count("\n")
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+
+def before_update(logger, uid, update_id, query, body, error):
+    logger.info(f'User {uid} выбрал поиск по названию')
+    logger.info(f'User {uid} ищет фильм: {query}')
+    logger.info(f"Найдено точное совпадение для '{query}': {query}")
+    logger.info(f"Отправлено фото и информация для '{query}'")
+    if error:
+        logger.error(f"HTTP ошибка запроса для '{query}': 500 - {body}")
+
+
+def make_after_update(): # импорт services.logs — после настройки окружения
+    from services.logs import SAMPLED, clip, log_context
+
+    def after_update(logger, uid, update_id, query, body, error):
+        with log_context(update_id=update_id, chat_id=uid, handler="handle_movie_name"):
+            logger.info('User %s выбрал поиск по названию', uid, extra=SAMPLED)
+            logger.info('User %s ищет фильм: %s', uid, query, extra=SAMPLED)
+            logger.info("Найдено точное совпадение для '%s': %s", query, query, extra=SAMPLED)
+            logger.info("Отправлено фото и информация для '%s'", query, extra=SAMPLED)
+            if error:
+                logger.error("HTTP ошибка запроса для '%s': %s - %s", query, 500, clip(body))
+    return after_update
+
+
+def run(update, args, body):
+    logger = logging.getLogger("bench.handlers")
+    timings = [[] for _ in range(args.threads)]
+
+    def worker(index):
+        for n in range(index, args.updates, args.threads):
+            started = time.perf_counter()
+            update(logger, 100_000 + n % 5000, n, TITLES[n % len(TITLES)], body, n % args.error_every == 0)
+            timings[index].append(time.perf_counter() - started)
+            time.sleep(args.io_ms / 1000) # остальная работа обработчика — ожидание API и Telegram
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handlers_s = time.perf_counter() - started
+    values = [value for part in timings for value in part]
+    return values, handlers_s, started
+
+
+def summary(values, handlers_s, total_s, stream):
+    stream.flush()
+    return dict(latency_summary(values), mean_us=round(sum(values) / len(values) * 1e6, 1),
+                handlers_s=round(handlers_s, 3), total_s=round(total_s, 3), lines=stream.lines,
+                log_bytes=os.path.getsize(stream.file.name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-update logging overhead: sync f-string logging vs. queued JSON logging")
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--threads", type=int, default=8, help="потоков обработчиков")
+    parser.add_argument("--sample", type=float, default=0.1, help="LOG_SAMPLE для after")
+    parser.add_argument("--error-every", type=int, default=50, help="каждое N-е обновление пишет ошибку HTTP")
+    parser.add_argument("--body-kb", type=int, default=20, help="размер тела ответа API с ошибкой")
+    parser.add_argument("--write-delay-ms", type=float, default=0.05, help="задержка записи одной строки в stderr")
+    parser.add_argument("--io-ms", type=float, default=2.0, help="ожидание ввода-вывода обработчиком на обновление, вне замера")
+    args = parser.parse_args()
+
+    os.environ["LOG_SAMPLE"] = str(args.sample) # до импорта config
+    os.environ["LOG_FORMAT"] = "json"
+    from services.logs import DROPPED, setup_logging, stop_logging
+
+    workdir = tempfile.mkdtemp(prefix="logging-bench-")
+    body = json.dumps({"error": "Bad Request", "message": ["x" * 64] * (args.body_kb * 16)})
+    root = logging.getLogger()
+
+    stream = SlowStream(os.path.join(workdir, "before.log"), args.write_delay_ms / 1000)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=stream)
+    values, handlers_s, started = run(before_update, args, body)
+    before = summary(values, handlers_s, time.perf_counter() - started, stream)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    stream = SlowStream(os.path.join(workdir, "after.log"), args.write_delay_ms / 1000)
+    setup_logging(level="INFO", stream=stream)
+    values, handlers_s, started = run(make_after_update(), args, body)
+    stop_logging() # дожидаемся записи всей очереди
+    after = summary(values, handlers_s, time.perf_counter() - started, stream)
+    after["dropped"] = {reason: DROPPED.labels(reason).value for reason in ("sampled", "queue")}
+
+    print(json.dumps({
+        "updates": args.updates,
+        "threads": args.threads,
+        "sample": args.sample,
+        "before": before,
+        "after": after,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
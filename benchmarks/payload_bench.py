@@ -0,0 +1,68 @@
+import json
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.stats import latency_summary
+from benchmarks.fake_poiskkino import make_movies
+
+# Размер ответа PoiskKino и память на его разбор: полный документ и json.loads (как было) против
+# selectFields и разбора в записи Movie. Отдельно — /movie/search: там выбора полей нет,
+# урезается только при разборе. Память: пик во время разбора и сколько остается занято результатом
+# (столько держит кэш ответов на каждую страницу).
+#
+#   python -m benchmarks.payload_bench --limit 250 --rounds 50
+
+
+def page_body(docs, fields=None):
+    if fields:
+        docs = [{name: doc[name] for name in fields if name in doc} for doc in docs]
+    return json.dumps({"docs": docs, "total": 1000, "limit": len(docs), "page": 1, "pages": 1},
+                      ensure_ascii=False).encode("utf-8")
+
+
+def measure(body, decode, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        decode(body)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = decode(body)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {
+        "bytes": len(body),
+        "decode": latency_summary(timings),
+        "peak_kb": round((peak - before) / 1024, 1),
+        "retained_kb": round((retained - before) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PoiskKino payload size and decode memory: full documents vs. projection")
+    parser.add_argument("--limit", type=int, default=250, help="фильмов на странице")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    from api.movie import SELECT_FIELDS, decode_page
+
+    docs = make_movies(args.limit)
+    full, projected = page_body(docs), page_body(docs, SELECT_FIELDS)
+    results = {
+        "full_json": measure(full, json.loads, args.rounds), # прежний разбор: response.json()
+        "search_records": measure(full, decode_page, args.rounds), # /movie/search: полный ответ, записи Movie
+        "select_fields_records": measure(projected, decode_page, args.rounds), # /movie с selectFields
+    }
+    baseline = results["full_json"]
+    for name, result in results.items():
+        result["bytes_ratio"] = round(result["bytes"] / baseline["bytes"], 3)
+        result["retained_ratio"] = round(result["retained_kb"] / baseline["retained_kb"], 3) if baseline["retained_kb"] else None
+    print(json.dumps({"limit": args.limit, "results": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
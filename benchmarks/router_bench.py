@@ -0,0 +1,99 @@
+import json
+import time
+import random
+import argparse
+
+import telebot
+from telebot import types
+
+from handlers.router import Router
+from handlers.common import WAITING_FOR_MOVIE_NAME, WAITING_FOR_MIN_RATING, WAITING_FOR_MIN_BUDGET
+
+# Стоимость разбора одного обновления: прежняя цепочка @bot.message_handler(func=lambda ...)
+# против Router. Обработчики пустые, замеряется только выбор обработчика внутри TeleBot.
+#
+#   python -m benchmarks.router_bench --updates 200000
+
+BUTTONS = ["Назад", "История запросов", "Поиск фильма/сериала", "По названию", "По рейтингу", "По бюджету"]
+STATES = [WAITING_FOR_MOVIE_NAME, WAITING_FOR_MIN_RATING, WAITING_FOR_MIN_BUDGET]
+
+
+def noop(update):
+    pass
+
+
+def lambda_chain_bot(user_states): # порядок и предикаты как до Router, включая дублирующийся "Поиск фильма/сериала"
+    bot = telebot.TeleBot("123:bench", threaded=False)
+    bot.message_handler(commands=['start'])(noop)
+    for text in BUTTONS[:3]:
+        bot.message_handler(func=lambda m, text=text: m.text == text, chat_types=['private'])(noop)
+    for text in ["Поиск фильма/сериала", "По названию"]:
+        bot.message_handler(func=lambda m, text=text: m.text == text)(noop)
+    bot.message_handler(func=lambda m: user_states.get(m.chat.id) == WAITING_FOR_MOVIE_NAME)(noop)
+    for text, state in [("По рейтингу", WAITING_FOR_MIN_RATING), ("По бюджету", WAITING_FOR_MIN_BUDGET)]:
+        bot.message_handler(func=lambda m, text=text: m.text == text)(noop)
+        bot.message_handler(func=lambda m, state=state: user_states.get(m.chat.id) == state)(noop)
+    bot.callback_query_handler(func=lambda call: call.data.startswith('rating_page:'))(noop)
+    bot.callback_query_handler(func=lambda call: call.data.startswith('budget_page:'))(noop)
+    return bot
+
+
+def router_bot(user_states):
+    bot = telebot.TeleBot("123:bench", threaded=False)
+    router = Router(user_states.get)
+    router.command('start')(noop)
+    for text in BUTTONS:
+        router.text(text, chat_types=['private'] if text in BUTTONS[:2] else None)(noop)
+    for state in STATES:
+        router.state(state)(noop)
+    router.callback('rating_page:')(noop)
+    router.callback('budget_page:')(noop)
+    router.install(bot)
+    return bot
+
+
+def make_updates(count, user_states, users=1000):
+    updates = []
+    for i in range(count):
+        chat_id = random.randrange(users)
+        kind = random.random()
+        if kind < 0.2:
+            updates.append(types.Update.de_json({"update_id": i, "callback_query": {
+                "id": str(i), "chat_instance": "x", "data": random.choice(["rating_page:7.5:2", "budget_page:50000000:3"]),
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+                "message": {"message_id": i, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "k"}}}))
+            continue
+        if kind < 0.6:
+            text = random.choice(BUTTONS)
+        else: # ввод в состоянии ожидания: проходит мимо всех кнопок
+            user_states[chat_id] = random.choice(STATES)
+            text = random.choice(["7.5", "50", "Матрица"])
+        updates.append(types.Update.de_json({"update_id": i, "message": {
+            "message_id": i, "date": 0, "text": text, "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"}}}))
+    return updates
+
+
+def measure(bot, updates):
+    started = time.perf_counter()
+    for update in updates:
+        bot.process_new_updates([update])
+    elapsed = time.perf_counter() - started
+    return {"updates": len(updates), "us_per_update": round(elapsed / len(updates) * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatch cost per update: lambda filters vs. Router")
+    parser.add_argument("--updates", type=int, default=100_000)
+    args = parser.parse_args()
+    user_states = {}
+    updates = make_updates(args.updates, user_states)
+    results = {
+        "lambda_chain": measure(lambda_chain_bot(user_states), updates),
+        "router": measure(router_bot(user_states), updates),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
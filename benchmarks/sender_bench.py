@@ -0,0 +1,87 @@
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from telebot import apihelper
+from telebot.types import InputMediaPhoto
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.stats import latency_summary
+from services.sender import SendScheduler, ScheduledBot, bulk_priority
+
+# Отправка страниц результатов многим пользователям сразу: напрямую через TeleBot
+# и через SendScheduler. Telegram заменен на FakeTelegram с такими же лимитами.
+#
+#   python -m benchmarks.sender_bench --users 50 --pages 3
+
+
+def send_pages(bot, chat_id, pages, latencies, failures, lock):
+    for page in range(pages):
+        started = time.perf_counter()
+        try:
+            bot.send_message(chat_id, "Загружаю страницу...") # интерактивный ответ
+            with lock:
+                latencies["interactive"].append(time.perf_counter() - started)
+            with bulk_priority():
+                bot.send_media_group(chat_id, [InputMediaPhoto(f"https://img/{page}-{i}.jpg", caption=f"Movie {i}") for i in range(5)])
+                bot.send_message(chat_id, "Листайте результаты:")
+            with lock:
+                latencies["page"].append(time.perf_counter() - started)
+        except Exception as e:
+            with lock:
+                failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+
+
+def run(mode, users, pages, fake_options, headroom=0.9):
+    fake = FakeTelegram(**fake_options).start()
+    apihelper.API_URL = fake.api_url
+    bot = telebot.TeleBot("123:bench", threaded=False)
+    scheduler = None
+    if mode == "scheduled":
+        # запас по скорости: задержка сети сдвигает момент, когда Telegram списывает токен
+        scheduler = SendScheduler(global_rate=fake.global_rate * headroom, chat_rate=fake.chat_rate * headroom,
+                                  chat_burst=fake.chat_burst)
+        bot = ScheduledBot(bot, scheduler)
+    latencies = {"interactive": [], "page": []}
+    failures = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for user in range(users):
+            executor.submit(send_pages, bot, 1_000_000 + user, pages, latencies, failures, lock)
+    duration = time.perf_counter() - started
+    if scheduler is not None:
+        scheduler.stop()
+    fake.stop()
+    return {
+        "mode": mode,
+        "users": users,
+        "pages_per_user": pages,
+        "duration_s": round(duration, 3),
+        "failures": failures,
+        "telegram": fake.stats(),
+        "interactive_latency": latency_summary(latencies["interactive"]),
+        "page_latency": latency_summary(latencies["page"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Direct sends vs. SendScheduler against a rate-limited fake Telegram")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа поддельного Telegram, сек")
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--chat-burst", type=int, default=5)
+    parser.add_argument("--headroom", type=float, default=0.9, help="доля лимитов Telegram, которую использует очередь")
+    args = parser.parse_args()
+    fake_options = dict(latency=args.latency, global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_burst)
+    results = [run(mode, args.users, args.pages, fake_options, args.headroom) for mode in ("direct", "scheduled")]
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
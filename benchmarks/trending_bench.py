@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+from benchmarks.stats import latency_summary
+from benchmarks.fake_poiskkino import TITLES
+
+# "Популярное": топ прямым GROUP BY по таблице History (как считалось бы на каждый запрос) против готового
+# топа из TrendRollup. Отдельно — сколько добавляет обновление счетчиков к записи пачки истории
+# и сколько занимает пересчет trend_bucket по всей истории.
+#
+#   python -m benchmarks.trending_bench --rows 200000 --requests 200
+
+
+def make_rows(count, rnd, days=30):
+    now = datetime.datetime.now()
+    weights = [1 / (rank + 1) for rank in range(len(TITLES))]
+    rows = []
+    for _ in range(count):
+        roll = rnd.random()
+        if roll < 0.6:
+            query = f"Поиск по названию: '{rnd.choices(TITLES, weights=weights)[0]}'"
+        elif roll < 0.8:
+            query = f"Рейтинг от {rnd.choice([6.0, 7.0, 7.5, 8.0, 8.5])}"
+        else:
+            query = f"Бюджет от ${rnd.choice([50.0, 100.0, 150.0])} млн."
+        rows.append({'user_id': rnd.randrange(10_000), 'query': query,
+                     'timestamp': now - datetime.timedelta(seconds=rnd.uniform(0, days * 86400))})
+    return rows
+
+
+def timed(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return latency_summary(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trending top-N: GROUP BY over history vs. incremental rollups")
+    parser.add_argument("--rows", type=int, default=200_000, help="записей в истории")
+    parser.add_argument("--requests", type=int, default=200, help="запросов топа")
+    parser.add_argument("--batches", type=int, default=200, help="пачек истории по 100 записей")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="trending-bench-")
+    os.environ["HISTORY_DB_PATH"] = os.path.join(workdir, "history.db") # до импорта database
+    from peewee import fn
+    from database import db, History, create_tables
+    from services.trending import TrendRollup, rebuild
+
+    rnd = random.Random(args.seed)
+    create_tables()
+    with db.atomic():
+        rows = make_rows(args.rows, rnd)
+        for start in range(0, len(rows), 300):
+            History.insert_many(rows[start:start + 300]).execute()
+
+    def group_by():
+        return list(History.select(History.query, fn.COUNT(History.id).alias('n'))
+                    .group_by(History.query).order_by(fn.COUNT(History.id).desc()).limit(10).tuples())
+
+    started = time.perf_counter()
+    rebuild()
+    rebuild_s = time.perf_counter() - started
+    rollup = TrendRollup()
+    rollup.load()
+
+    def write(batch, observe):
+        with db.atomic():
+            History.insert_many(batch).execute()
+            if observe:
+                rollup.record(batch)
+
+    batches = [make_rows(100, rnd, days=0.01) for _ in range(args.batches)]
+    plain = timed(lambda: write(batches.pop(), False), args.batches // 2)
+    observed = timed(lambda: write(batches.pop(), True), args.batches // 2)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "group_by_top": timed(group_by, args.requests),
+        "rollup_top": timed(lambda: rollup.top('name'), args.requests),
+        "history_batch_write": plain,
+        "history_batch_write_with_rollups": observed,
+        "rebuild_s": round(rebuild_s, 3),
+        "rollup": rollup.stats(),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import json
+import time
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stats import latency_summary
+
+# Нагрузочный прогон webhook режима: POST записанных (или синтетических) обновлений
+# на локальный WebhookServer.
+#
+#   BOT_INGESTION=webhook python main.py
+#   python -m benchmarks.webhook_replay --url http://127.0.0.1:8080/telegram/webhook --updates updates.jsonl
+
+SYNTHETIC_TEXTS = ["/start", "Поиск фильма/сериала", "По рейтингу", "7.5", "Назад", "История запросов"]
+
+
+def synthetic_updates(count, users=100):
+    for i in range(count):
+        user_id = 1_000_000 + i % users
+        yield {
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": int(time.time()),
+                "text": SYNTHETIC_TEXTS[i % len(SYNTHETIC_TEXTS)],
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            },
+        }
+
+
+def load_updates(path): # JSONL: по одному объекту Update в строке
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(url, updates, secret="", concurrency=16):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def post(update):
+        body = json.dumps(update, ensure_ascii=False).encode("utf-8")
+        started = time.perf_counter()
+        try:
+            status = session.post(url, data=body, headers=headers, timeout=10).status_code
+        except requests.exceptions.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(post, updates))
+    duration = time.perf_counter() - started
+
+    return {
+        "updates": len(updates),
+        "concurrency": concurrency,
+        "duration_s": round(duration, 3),
+        "updates_per_s": round(len(updates) / duration, 1) if duration else 0.0,
+        "statuses": statuses,
+        "latency": latency_summary(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Telegram updates against the webhook server")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/telegram/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--updates", help="JSONL файл с записанными обновлениями")
+    parser.add_argument("--count", type=int, default=5000, help="число синтетических обновлений, если --updates не задан")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    base = load_updates(args.updates) if args.updates else list(synthetic_updates(args.count))
+    update_ids = itertools.count(1)
+    updates = [dict(update, update_id=next(update_ids)) for _ in range(args.repeat) for update in base]
+    print(json.dumps(replay(args.url, updates, args.secret, args.concurrency), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
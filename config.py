@@ -0,0 +1,141 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# PoiskKino API
+POISKINO_API_KEY = os.getenv("POISKINO_API_KEY")
+POISKINO_API_KEYS = os.getenv("POISKINO_API_KEYS", "") # пул ключей: ключ[:бюджет[:вес]] через запятую; пусто — один POISKINO_API_KEY
+POISKINO_DAILY_BUDGET = int(os.getenv("POISKINO_DAILY_BUDGET", "0")) # запросов в сутки на ключ, если бюджет не указан у ключа; 0 — без ограничения
+POISKINO_KEY_STRATEGY = os.getenv("POISKINO_KEY_STRATEGY", "least_used") # least_used или weighted
+POISKINO_KEY_COOLDOWN = float(os.getenv("POISKINO_KEY_COOLDOWN", "60")) # пауза для ключа после 429, сек
+POISKINO_QUOTA_UTC_OFFSET = float(os.getenv("POISKINO_QUOTA_UTC_OFFSET", "3")) # часовой пояс сброса дневной квоты (Москва)
+POISKINO_KEYS_DB_PATH = os.getenv("POISKINO_KEYS_DB_PATH", "keys.db") # счетчики ключей переживают рестарт; пусто — только в памяти
+POISKINO_API_URL = os.getenv("POISKINO_API_URL", "https://api.poiskkino.dev").rstrip('/')
+POISKINO_POOL_SIZE = int(os.getenv("POISKINO_POOL_SIZE", "10")) # максимум соединений в пуле
+POISKINO_MAX_RETRIES = int(os.getenv("POISKINO_MAX_RETRIES", "3")) # повторы при 429/5xx и обрывах соединения
+POISKINO_BACKOFF = float(os.getenv("POISKINO_BACKOFF", "0.5")) # базовая задержка между повторами, сек
+POISKINO_BACKOFF_MAX = float(os.getenv("POISKINO_BACKOFF_MAX", "8"))
+POISKINO_CONNECT_TIMEOUT = float(os.getenv("POISKINO_CONNECT_TIMEOUT", "3.05"))
+POISKINO_SEARCH_TIMEOUT = float(os.getenv("POISKINO_SEARCH_TIMEOUT", "10")) # таймаут чтения для /movie/search
+POISKINO_DISCOVER_TIMEOUT = float(os.getenv("POISKINO_DISCOVER_TIMEOUT", "15")) # таймаут чтения для /movie
+POISKINO_SELECT_FIELDS = os.getenv("POISKINO_SELECT_FIELDS", "1") == "1" # запрашивать у /movie только поля, которые показывает бот
+
+# Кэш ответов PoiskKino
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SEARCH = float(os.getenv("CACHE_TTL_SEARCH", "3600")) # поиск по названию, сек
+CACHE_TTL_DISCOVER = float(os.getenv("CACHE_TTL_DISCOVER", "900")) # страницы рейтинга/бюджета, сек
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "") # например cache.db; пусто — только память
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "86400")) # сколько хранить просроченный ответ на случай недоступности API, сек
+
+# Склейка одинаковых запросов к API, пока первый из них еще выполняется
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+SINGLEFLIGHT_MAX_WAITERS = int(os.getenv("SINGLEFLIGHT_MAX_WAITERS", "100")) # сколько запросов может ждать один ответ; остальным — ошибка
+
+# Предохранитель: при сбоях PoiskKino не ждем таймаутов, а отвечаем сохраненными результатами из кэша
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "1") == "1"
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20")) # по скольким последним запросам судить о состоянии API
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10")) # меньше запросов в окне — не размыкаем
+BREAKER_ERROR_RATIO = float(os.getenv("BREAKER_ERROR_RATIO", "0.5")) # доля ошибок (5xx, 429, таймауты, обрывы), при которой размыкаем
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", "5")) # ответ дольше стольких секунд считается медленным; 0 — не учитывать
+BREAKER_SLOW_RATIO = float(os.getenv("BREAKER_SLOW_RATIO", "0.5")) # доля медленных ответов, при которой размыкаем
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30")) # через сколько секунд пробовать API снова (пробный запрос в фоне)
+
+# Локальный каталог фильмов (SQLite + FTS5): поиск и выборки без запросов к API
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "") # например catalog.db; пусто — каталог выключен
+CATALOG_SYNC_PAGE_SIZE = int(os.getenv("CATALOG_SYNC_PAGE_SIZE", "250")) # фильмов в одном запросе синхронизации
+CATALOG_SYNC_MAX_PAGES = int(os.getenv("CATALOG_SYNC_MAX_PAGES", "100")) # страниц первичной загрузки за один проход фонового потока
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "3600")) # как часто догружать изменения, сек; 0 — только вручную
+
+# Предзагрузка следующих страниц рейтинга/бюджета
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "1")) # сколько страниц вперёд загружать; 0 — выключено
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "120")) # сколько хранить загруженную страницу, сек
+
+# Кэш file_id постеров: Telegram скачивает постер с CDN только при первой отправке
+POSTER_CACHE_ENABLED = os.getenv("POSTER_CACHE_ENABLED", "1") == "1"
+
+# 1 — результаты рейтинга/бюджета одним сообщением-каруселью, которое листается правкой; по умолчанию — страницами по PAGE_LIMIT
+CAROUSEL_ENABLED = os.getenv("CAROUSEL_ENABLED", "0") == "1"
+
+# Inline-режим (@бот название в любом чате); в BotFather нужно включить /setinline
+INLINE_ENABLED = os.getenv("INLINE_ENABLED", "1") == "1"
+INLINE_INDEX_MAX_ENTRIES = int(os.getenv("INLINE_INDEX_MAX_ENTRIES", "20000")) # фильмов в индексе названий в памяти
+INLINE_RESULTS = int(os.getenv("INLINE_RESULTS", "20")) # результатов в одном ответе (Telegram допускает до 50)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300")) # сколько Telegram кэширует полный ответ на тот же запрос, сек
+INLINE_PARTIAL_CACHE_TIME = int(os.getenv("INLINE_PARTIAL_CACHE_TIME", "5")) # для неполного ответа из индекса: он скоро дополнится из API
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.35")) # пауза перед запросом к API: пока пользователь печатает, запросы заменяют друг друга
+INLINE_MIN_API_QUERY = int(os.getenv("INLINE_MIN_API_QUERY", "3")) # запросы короче отвечаются только из индекса
+INLINE_WORKERS = int(os.getenv("INLINE_WORKERS", "4")) # потоков для запросов к API после паузы (sync режим)
+INLINE_WARMUP_PAGES = int(os.getenv("INLINE_WARMUP_PAGES", "2")) # страниц по 250 популярных фильмов для индекса при старте; 0 — без прогрева
+
+# Режим работы бота: sync — TeleBot и потоки, async — AsyncTeleBot и aiohttp
+BOT_ENGINE = os.getenv("BOT_ENGINE", "sync")
+POISKINO_ASYNC_POOL_SIZE = int(os.getenv("POISKINO_ASYNC_POOL_SIZE", "100")) # соединений к API в async режиме
+
+# Исходящие сообщения: очередь с ограничением скорости (лимиты Telegram ~30 сообщений/с на бота, ~1/с на чат)
+SENDER_ENABLED = os.getenv("SENDER_ENABLED", "1") == "1"
+SENDER_GLOBAL_RATE = float(os.getenv("SENDER_GLOBAL_RATE", "30")) # сообщений в секунду на бота
+SENDER_CHAT_RATE = float(os.getenv("SENDER_CHAT_RATE", "1")) # сообщений в секунду в личный чат
+SENDER_CHAT_BURST = int(os.getenv("SENDER_CHAT_BURST", "8")) # сколько сообщений в чат можно отправить подряд без ожидания
+SENDER_GROUP_RATE = float(os.getenv("SENDER_GROUP_RATE", str(20 / 60))) # сообщений в секунду в группу
+SENDER_WORKERS = int(os.getenv("SENDER_WORKERS", "8")) # одновременных запросов к Telegram
+SENDER_MAX_RETRIES = int(os.getenv("SENDER_MAX_RETRIES", "3")) # повторов после 429
+
+# Очереди обновлений по чатам: обновления одного чата по порядку, чаты обслуживаются рабочими по кругу
+CHAT_POOL_ENABLED = os.getenv("CHAT_POOL_ENABLED", "1") == "1"
+CHAT_POOL_WORKERS = int(os.getenv("CHAT_POOL_WORKERS", "8")) # одновременно выполняемых обработчиков
+CHAT_POOL_PER_CHAT = int(os.getenv("CHAT_POOL_PER_CHAT", "1")) # обработчиков одного чата одновременно; 1 — строго по порядку
+CHAT_POOL_MAX_CHAT_QUEUE = int(os.getenv("CHAT_POOL_MAX_CHAT_QUEUE", "5")) # дальше обновления чата отбрасываются с ответом "бот занят"
+CHAT_POOL_MAX_QUEUE = int(os.getenv("CHAT_POOL_MAX_QUEUE", "1000")) # всего обновлений в очередях
+
+# Прием обновлений: polling — getUpdates, webhook — встроенный HTTP сервер
+BOT_INGESTION = os.getenv("BOT_INGESTION", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "") # внешний https адрес; если задан, вебхук регистрируется при старте
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "") # сверяется с заголовком X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+
+# Состояние диалога (какой ввод бот ждет от пользователя)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory") # memory или sqlite — переживает рестарт, общий для нескольких процессов
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+STATE_TTL = float(os.getenv("STATE_TTL", "900")) # через сколько секунд забыть незавершенный ввод
+STATE_TTLS = {name: float(ttl) for name, ttl in # отдельные сроки, например waiting_for_movie_name=300,waiting_for_min_rating=600
+              (item.split("=") for item in os.getenv("STATE_TTLS", "").split(",") if item.strip())}
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "100000")) # для memory: больше чатов не храним, вытесняются самые старые
+
+# Популярное: счетчики запросов по часам и дням, обновляются при записи истории
+TRENDING_TOP_N = int(os.getenv("TRENDING_TOP_N", "10")) # сколько названий показывать
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24")) # через сколько часов запрос весит вдвое меньше
+TRENDING_HOURLY_HOURS = int(os.getenv("TRENDING_HOURLY_HOURS", "48")) # сколько хранить почасовые счетчики, дальше — по дням
+TRENDING_RETENTION_DAYS = int(os.getenv("TRENDING_RETENTION_DAYS", "30")) # более старые запросы в популярном не учитываются
+
+# Логи: пишутся в stderr отдельным потоком через очередь
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json") # json — строка JSON с chat_id и update_id, text — как раньше
+LOG_SAMPLE = float(os.getenv("LOG_SAMPLE", "1")) # доля чатов, для которых пишутся частые события (выбор раздела, запрос); от 0 до 1
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000")) # записей в очереди; при переполнении новые отбрасываются
+LOG_BODY_LIMIT = int(os.getenv("LOG_BODY_LIMIT", "500")) # сколько символов ответа API с ошибкой писать в лог и показывать
+
+# Метрики (Prometheus) и трассировка обработки обновлений
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1") # только локально: Prometheus или curl на той же машине
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108")) # /metrics и /traces; 0 — сервер метрик не запускается
+METRICS_TRACE_SAMPLE = float(os.getenv("METRICS_TRACE_SAMPLE", "0")) # доля обновлений с трассой по этапам, от 0 до 1
+METRICS_TRACE_KEEP = int(os.getenv("METRICS_TRACE_KEEP", "200")) # сколько последних трасс отдавать на /traces
+
+# История запросов (SQLite)
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.db")
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100")) # записей в одной пачке INSERT
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0")) # максимум секунд до записи на диск
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "1000")) # больше несохраненных записей не копим: столько можно потерять при падении
+HISTORY_MAX_PER_USER = int(os.getenv("HISTORY_MAX_PER_USER", "100")) # сколько последних запросов хранить на пользователя; 0 — без ограничения
+HISTORY_MAX_AGE_DAYS = int(os.getenv("HISTORY_MAX_AGE_DAYS", "180")) # более старые записи удаляются; 0 — без ограничения
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "3600")) # как часто чистить историю, сек
+HISTORY_VACUUM_MAX_MB = float(os.getenv("HISTORY_VACUUM_MAX_MB", "64")) # база больше — VACUUM при запуске откладывается до python database.py --vacuum
@@ -1,8 +1,23 @@
 from peewee import *
 import datetime
-import os
+import atexit
+import logging
+import threading
+import time
+import config
+from services import metrics
 
-db = SqliteDatabase('history.db')
+logger = logging.getLogger(__name__)
+
+PRAGMAS = {
+    'journal_mode': 'wal', # читатели не блокируют писателя
+    'synchronous': 'normal', # в WAL режиме fsync только на checkpoint
+    'cache_size': -16 * 1024, # 16 МБ
+    'temp_store': 'memory',
+    'busy_timeout': 5000,
+}
+
+db = SqliteDatabase(config.HISTORY_DB_PATH, pragmas=PRAGMAS)
 
 class History(Model):
     user_id = IntegerField()
@@ -11,24 +26,243 @@ class History(Model):
 
     class Meta:
         database = db
+        indexes = (
+            (('user_id', 'timestamp'), False), # для get_history: WHERE user_id = ? ORDER BY timestamp DESC
+        )
+
+class PosterFile(Model): # file_id постера, уже загруженного в Telegram, чтобы не скачивать его с CDN повторно
+    movie_id = IntegerField(primary_key=True)
+    file_id = TextField()
+    updated = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        database = db
+        table_name = 'poster_file'
+
+class TrendBucket(Model): # сколько раз искали запрос за час или за сутки — для "Популярное" (services/trending.py)
+    period = TextField() # 'hour' или 'day'
+    kind = TextField() # name, rating, budget
+    value = TextField() # нормализованный запрос
+    start = IntegerField() # unix-время начала часа/суток
+    count = IntegerField(default=0)
+    label = TextField() # запрос в том виде, в каком его последний раз ввели
+
+    class Meta:
+        database = db
+        table_name = 'trend_bucket'
+        primary_key = CompositeKey('period', 'kind', 'value', 'start')
+
+def _migration_history_index():
+    db.execute_sql('CREATE INDEX IF NOT EXISTS "history_user_id_timestamp" ON "history" ("user_id", "timestamp")')
+
+def enable_incremental_vacuum(max_bytes=None) -> bool: # True — режим INCREMENTAL включен; max_bytes=None — без ограничения
+    if db.execute_sql('PRAGMA auto_vacuum').fetchone()[0] == 2: # уже INCREMENTAL
+        return True
+    size = db.execute_sql('PRAGMA page_count').fetchone()[0] * db.execute_sql('PRAGMA page_size').fetchone()[0]
+    if max_bytes is not None and size > max_bytes: # VACUUM переписывает весь файл и на это время блокирует запись
+        logger.warning("VACUUM истории (%.0f МБ) отложен, чтобы не задерживать запуск: место после очистки "
+                       "не возвращается на диск. Выполните python database.py --vacuum при обслуживании.", size / 2**20)
+        return False
+    started = time.monotonic()
+    db.execute_sql('PRAGMA auto_vacuum = INCREMENTAL')
+    db.execute_sql('VACUUM') # режим auto_vacuum меняется только через VACUUM
+    logger.info("История переведена в режим incremental_vacuum за %.1f с (%.0f МБ).", time.monotonic() - started, size / 2**20)
+    return True
+
+def _migration_incremental_vacuum(): # чтобы compact_history мог возвращать место без полного VACUUM
+    enable_incremental_vacuum(config.HISTORY_VACUUM_MAX_MB * 2**20)
+
+MIGRATIONS = [ # (версия схемы, функция); версия хранится в PRAGMA user_version
+    (1, _migration_history_index),
+    (2, _migration_incremental_vacuum),
+]
+
+def migrate(): # применяем недостающие миграции по порядку
+    version = db.execute_sql('PRAGMA user_version').fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if target > version:
+            migration()
+            db.execute_sql(f'PRAGMA user_version = {target}')
+            logger.info("Применена миграция схемы истории до версии %s.", target)
 
-def create_tables(): # создаем таблицу History
+def trim_user_history(user_ids, max_per_user): # оставляем только max_per_user последних запросов пользователя
+    if max_per_user <= 0:
+        return 0
+    deleted = 0
+    for user_id in user_ids:
+        # граница — первая лишняя запись по (timestamp, id): у запросов из одного пакета время может совпадать
+        cutoff = (History.select(History.timestamp, History.id)
+                  .where(History.user_id == user_id)
+                  .order_by(History.timestamp.desc(), History.id.desc())
+                  .offset(max_per_user).limit(1).tuples().first())
+        if cutoff is not None:
+            timestamp, row_id = cutoff
+            older = (History.timestamp < timestamp) | ((History.timestamp == timestamp) & (History.id <= row_id))
+            deleted += History.delete().where((History.user_id == user_id) & older).execute()
+    return deleted
+
+def compact_history(max_age_days, chunk_size=5000): # удаление старых записей и возврат места на диске
+    deleted = 0
+    if max_age_days > 0:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=max_age_days)
+        while True: # небольшими транзакциями, чтобы не держать блокировку записи
+            old_ids = History.select(History.id).where(History.timestamp < cutoff).limit(chunk_size)
+            with db.atomic():
+                count = History.delete().where(History.id.in_(old_ids)).execute()
+            deleted += count
+            if count < chunk_size:
+                break
+    db.execute_sql('PRAGMA incremental_vacuum')
+    return deleted
+
+FLUSH_SECONDS = metrics.histogram("history_flush_seconds", "Запись пачки истории в SQLite")
+
+class HistoryWriter: # отложенная запись истории: копим запросы в памяти и пишем пачками
+    def __init__(self, batch_size=100, flush_interval=1.0, max_pending=1000,
+                 max_per_user=0, max_age_days=0, compact_interval=3600):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self.max_age_days = max_age_days
+        self.compact_interval = compact_interval
+        self._last_compaction = time.monotonic()
+        self.observers = [] # fn(batch) в той же транзакции, что и запись пачки (счетчики "Популярное")
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def enqueue(self, user_id, query): # не ждет диска, пока буфер не переполнен
+        row = {'user_id': user_id, 'query': query, 'timestamp': datetime.datetime.now()}
+        with self._cond:
+            if self._stopped:
+                return self._write([row])
+            self._ensure_started()
+            while len(self._pending) >= self.max_pending: # ограничиваем, сколько записей может потеряться при падении
+                self._cond.notify_all()
+                self._cond.wait(self.flush_interval)
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def pending_for(self, user_id): # еще не записанные запросы пользователя, новые первыми
+        with self._cond:
+            rows = [row for row in self._pending if row['user_id'] == user_id]
+        return [History(**row) for row in reversed(rows)]
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending": len(self._pending), "max_pending": self.max_pending}
+
+    def flush(self):
+        with self._cond:
+            batch, self._pending = self._pending, []
+            self._cond.notify_all()
+        self._write(batch)
+
+    def stop(self): # вызывается при завершении процесса
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _ensure_started(self): # вызывается под self._cond
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopped and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                stopped = self._stopped
+                self._cond.notify_all()
+            self._write(batch)
+            if stopped:
+                return
+            if self.max_age_days > 0 and time.monotonic() - self._last_compaction >= self.compact_interval:
+                self._compact()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        started = time.monotonic()
+        try:
+            with db.atomic():
+                for start in range(0, len(batch), 300): # ограничение SQLite на число параметров в запросе
+                    History.insert_many(batch[start:start + 300]).execute()
+                trim_user_history({row['user_id'] for row in batch}, self.max_per_user)
+                for observer in self.observers:
+                    try:
+                        with db.atomic(): # savepoint: ошибка наблюдателя не отменяет запись истории
+                            observer(batch)
+                    except Exception as e:
+                        logger.error("Ошибка при обработке пачки истории наблюдателем: %s", e)
+        except Exception as e:
+            logger.error("Ошибка при сохранении %s запросов: %s", len(batch), e)
+        FLUSH_SECONDS.observe(time.monotonic() - started)
+
+    def _compact(self): # в потоке записи, чтобы не конкурировать с ним за блокировку
+        self._last_compaction = time.monotonic()
+        try:
+            deleted = compact_history(self.max_age_days)
+            if deleted:
+                logger.info("Удалено %s записей истории старше %s дн.", deleted, self.max_age_days)
+        except Exception as e:
+            logger.error("Ошибка при очистке истории: %s", e)
+
+history_writer = HistoryWriter(
+    batch_size=config.HISTORY_BATCH_SIZE,
+    flush_interval=config.HISTORY_FLUSH_INTERVAL,
+    max_pending=config.HISTORY_MAX_PENDING,
+    max_per_user=config.HISTORY_MAX_PER_USER,
+    max_age_days=config.HISTORY_MAX_AGE_DAYS,
+    compact_interval=config.HISTORY_COMPACT_INTERVAL,
+)
+atexit.register(history_writer.stop)
+metrics.collector("history", history_writer.stats)
+
+def create_tables(): # создаем таблицы History, PosterFile, TrendBucket и применяем миграции
     with db:
-        db.create_tables([History])
-    print("Таблица History создана или уже существует.") # Для отладки
+        db.create_tables([History, PosterFile, TrendBucket])
+    with db.connection_context(): # VACUUM в миграциях нельзя выполнять внутри транзакции
+        migrate()
+    logger.info("Таблицы History, PosterFile и TrendBucket созданы или уже существуют.")
 
-def save_query(user_id, query): # сохранение запросов в таблицу History
+def save_query(user_id, query): # сохранение запросов в таблицу History (в фоне, пачками)
     try:
-        History.create(user_id=user_id, query=query[:255])
+        history_writer.enqueue(user_id, query[:255])
     except Exception as e:
-        print(f"Ошибка при сохранении запроса: {e}")
+        logger.error("Ошибка при сохранении запроса: %s", e)
 
 def get_history(user_id, limit=5): # извлечение сохраненных запросов из таблицы History
     try:
-        return History.select().where(History.user_id == user_id).order_by(History.timestamp.desc()).limit(limit)
+        records = history_writer.pending_for(user_id)[:limit]
+        if len(records) < limit:
+            records += list(History.select().where(History.user_id == user_id).order_by(History.timestamp.desc()).limit(limit - len(records)))
+        return records
     except Exception as e:
-        print(f"Ошибка при получении истории: {e}")
+        logger.error("Ошибка при получении истории: %s", e)
         return []
 
 if __name__ == '__main__':
+    import argparse
+    from services.logs import setup_logging
+
+    parser = argparse.ArgumentParser(description="History database maintenance")
+    parser.add_argument("--vacuum", action="store_true", help="включить incremental_vacuum полным VACUUM, даже для большой базы")
+    args = parser.parse_args()
+    setup_logging()
     create_tables()
+    if args.vacuum:
+        with db.connection_context():
+            enable_incremental_vacuum()
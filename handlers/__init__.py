@@ -3,62 +3,88 @@ import logging
 from telebot import TeleBot
 from keyboards.my_keyboard import main_keyboard, search_subkeyboard
 from database import create_tables, get_history # <-- ИМПОРТ
+from api.poiskkino import get_client
+from services.prefetch import get_prefetcher
+from services.poster_cache import get_poster_cache
+from services.state_store import StateStore, create_state_store
+from services.metrics import span
+from services.logs import SAMPLED
+from services.trending import get_trending
+from handlers.common import START_TEXT, POPULAR_EMPTY_TEXT, format_history, format_trending
+from handlers.router import Router
+from handlers.flow import Engine, Call, Prefetch, Blocking
 
 from handlers.movie_name_search_handler import register_movie_name_handlers
-from handlers.movie_rating_search_handler import register_movie_rating_handlers
-from handlers.movie_budget_search_handler import register_movie_budget_handlers
+from handlers.movie_rating_search_handler import register_movie_rating_handlers, RATING
+from handlers.movie_budget_search_handler import register_movie_budget_handlers, BUDGET
+from handlers.results import register_page_handlers
+from handlers.carousel import register_carousel_handlers
+from handlers.inline_handler import register_inline_handlers
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-user_states = {}
+user_states = create_state_store() # chat_id -> waiting_for_*, с TTL; STATE_BACKEND=sqlite — общий для процессов
 
-def register_handlers(bot: TeleBot):
+def build_router(user_states: StateStore) -> Router: # обработчики — генераторы handlers.flow, общие для sync и async
     create_tables()
+    get_poster_cache().load() # file_id постеров — в память сейчас, а не в обработчике внутри event loop
+    trending = get_trending() # счетчики популярного обновляются при каждой записи истории
+    router = Router(user_states.get)
 
-    @bot.message_handler(commands=['start']) # обработчик команды /start
+    @router.command('start') # обработчик команды /start
     def start(message):
-        logger.info(f'User {message.from_user.id} started the bot')
-        bot.send_message(
+        logger.info('User %s started the bot', message.from_user.id, extra=SAMPLED)
+        yield Call('send_message',
             message.chat.id,
-            f"Привет, {message.from_user.first_name}! Меня зовут TeleBot. Я умею искать информацию о фильмах или сериалах, а также предоставлю историю твоих запросов!",
+            START_TEXT.format(first_name=message.from_user.first_name),
             reply_markup=main_keyboard()
         )
 
-    @bot.message_handler(func=lambda m: m.text == "Назад", chat_types=['private']) # обработчик кнопки "Назад"
+    @router.text("Назад", chat_types=['private']) # обработчик кнопки "Назад"
     def back_to_main(message):
-        logger.info(f'User {message.from_user.id} ({message.from_user.first_name}) вернулся в основное меню')
-        if message.chat.id in user_states:
-            del user_states[message.chat.id]
-        bot.send_message(message.chat.id, "С чего начнем?", reply_markup=main_keyboard())
+        logger.info('User %s (%s) вернулся в основное меню', message.from_user.id, message.from_user.first_name, extra=SAMPLED)
+        yield Blocking(user_states.pop, message.chat.id, None)
+        yield Prefetch('cancel', message.chat.id)
+        yield Call('send_message', message.chat.id, "С чего начнем?", reply_markup=main_keyboard())
 
-    @bot.message_handler(func=lambda m: m.text == "История запросов", chat_types=['private']) # обработчик кнопки "История запросов"
+    @router.text("История запросов", chat_types=['private']) # обработчик кнопки "История запросов"
     def history_command(message):
-        logger.info(f'User {message.from_user.id} ({message.from_user.first_name}) запросил историю')
+        logger.info('User %s (%s) запросил историю', message.from_user.id, message.from_user.first_name, extra=SAMPLED)
         user_id = message.from_user.id
-        history_records = get_history(user_id, limit=7)
+        with span("history_read"):
+            history_records = yield Blocking(lambda: list(get_history(user_id, limit=7)))
 
-        if history_records:
-            response_text = "Ваши последние запросы:\n\n"
-            for i, record in enumerate(history_records, 1):
-                formatted_time = record.timestamp.strftime('%d.%m.%Y %H:%M')
-                response_text += f"*{i}.* `{record.query}` (_{formatted_time}_)\n"
-            bot.send_message(message.chat.id, response_text, parse_mode='Markdown')
+        response_text = format_history(history_records)
+        if response_text:
+            yield Call('send_message', message.chat.id, response_text, parse_mode='Markdown')
         else:
-            bot.send_message(message.chat.id, "История запросов пуста.")
+            yield Call('send_message', message.chat.id, "История запросов пуста.")
 
+    @router.text("Популярное") # готовый топ из счетчиков, без запросов к истории
+    def popular_command(message):
+        logger.info('User %s (%s) открыл популярное', message.from_user.id, message.from_user.first_name, extra=SAMPLED)
+        response_text = format_trending(trending.top('name'), trending.top('rating', 5), trending.top('budget', 5))
+        if response_text:
+            yield Call('send_message', message.chat.id, response_text, parse_mode='Markdown')
+        else:
+            yield Call('send_message', message.chat.id, POPULAR_EMPTY_TEXT)
 
-    @bot.message_handler(func=lambda m: m.text == "Поиск фильма/сериала", chat_types=['private']) # обработчик кнопки "Поиск фильма/сериала"
+    @router.text("Поиск фильма/сериала") # обработчик кнопки "Поиск фильма/сериала"
     def search_menu(message):
-        logger.info(f'User {message.from_user.id} ({message.from_user.first_name}) выбрал поиск фильма/сериала')
-        bot.send_message(message.chat.id, "Выберите способ поиска:", reply_markup=search_subkeyboard())
+        logger.info('User %s (%s) выбрал поиск фильма/сериала', message.from_user.id, message.from_user.first_name, extra=SAMPLED)
+        yield Call('send_message', message.chat.id, "Выберите способ поиска:", reply_markup=search_subkeyboard())
 
 
-    register_movie_name_handlers(bot, user_states)
-    register_movie_rating_handlers(bot, user_states)
-    register_movie_budget_handlers(bot, user_states)
+    register_movie_name_handlers(router, user_states)
+    register_movie_rating_handlers(router, user_states)
+    register_movie_budget_handlers(router, user_states)
+    register_page_handlers(router, [RATING, BUDGET])
+    register_carousel_handlers(router, {kind.kind: (kind.fetch, kind.format_card, kind.keep) for kind in (RATING, BUDGET)})
+    return router
+
+def register_handlers(bot: TeleBot):
+    router = build_router(user_states)
+    router.install(bot, Engine(bot, get_client, get_prefetcher).run)
+    register_inline_handlers(bot) # подсказки "@бот название" из индекса названий
 
     logger.info("All handlers registered successfully.")#
@@ -0,0 +1,20 @@
+import logging
+from telebot.async_telebot import AsyncTeleBot
+from api.poiskkino_async import get_async_client
+from services.prefetch import get_async_prefetcher
+from services.state_store import StateStore
+from handlers import build_router
+from handlers.flow import AsyncEngine
+from handlers.inline_handler import register_async_inline_handlers
+
+# Те же обработчики, что и для TeleBot (handlers.build_router), выполняет AsyncEngine:
+# вызовы бота и API через await, запросы к API — через aiohttp, SQLite — в потоках.
+
+logger = logging.getLogger(__name__)
+
+
+def register_async_handlers(bot: AsyncTeleBot, user_states: StateStore):
+    router = build_router(user_states)
+    router.install_async(bot, AsyncEngine(bot, get_async_client, get_async_prefetcher).run)
+    register_async_inline_handlers(bot)
+    logger.info("All async handlers registered successfully.")
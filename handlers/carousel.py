@@ -0,0 +1,325 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from telebot import apihelper, asyncio_helper
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+from keyboards.my_keyboard import search_subkeyboard
+from handlers.common import PAGE_LIMIT, PAGE_SWITCH_ERROR_TEXT, total_pages, movie_title, poster_url, api_error_text
+from handlers.page_renderer import CAPTION_LIMIT, MESSAGE_LIMIT, truncate, is_stale_file_id
+from services.poster_cache import get_poster_cache
+from handlers.flow import Call, Blocking, Prefetch, Schedule
+from services.metrics import span
+from services import metrics
+
+# Карусель результатов рейтинга/бюджета: одно сообщение на весь список, которое редактируется на месте.
+# ◀️/▶️ — соседний фильм, «Стр.» — первый фильм соседней, первой или последней страницы (по PAGE_LIMIT).
+# Позиция хранится в самой кнопке: c:<r|b>:<значение>:<куда>:<откуда>, числа в base36 — влезает
+# в 64 байта callback_data. Нажатие на текущую позицию и повторное нажатие той же кнопки не доходят до Telegram:
+# позиция запоминается до запроса страницы и правки, а при ошибке возвращается прежняя. Ответ Telegram
+# "message is not modified" не считается ошибкой.
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_PREFIX = 'c:'
+KIND_CODES = {'rating': 'r', 'budget': 'b'}
+KINDS = {code: kind for kind, code in KIND_CODES.items()}
+SEARCH_LABELS = {'rating': " по рейтингу", 'budget': " по бюджету"}
+STALE_NOTE = "⚠️ _Сервер поиска недоступен, данные могут быть устаревшими_\n\n"
+SHOWN_MAX = 10_000 # сколько сообщений-каруселей помним для отсечения повторных нажатий
+
+
+def _b36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while True:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+        if not number:
+            return text
+
+
+def pack(kind, value, target: int, current: int) -> str: # callback_data кнопки карусели
+    value_text = _b36(value) if kind == 'budget' else str(value)
+    return f"c:{KIND_CODES[kind]}:{value_text}:{_b36(target)}:{_b36(current)}"
+
+
+def unpack(data: str): # -> (kind, value, target, current); ValueError для чужих данных
+    _, code, value_text, target, current = data.split(':')
+    kind = KINDS.get(code)
+    if kind is None:
+        raise ValueError(f"Неизвестный вид карусели: {code}")
+    value = int(value_text, 36) if kind == 'budget' else float(value_text)
+    return kind, value, int(target, 36), int(current, 36)
+
+
+def page_of(index: int) -> int:
+    return index // PAGE_LIMIT + 1
+
+
+def carousel_markup(kind, value, index: int, total: int, on_page: int = PAGE_LIMIT) -> InlineKeyboardMarkup:
+    # on_page — сколько фильмов показывается на странице index: после фильтра их может быть меньше PAGE_LIMIT
+    keyboard = InlineKeyboardMarkup()
+    page, pages = page_of(index), total_pages(total)
+    steps = []
+    if index > 0:
+        steps.append(InlineKeyboardButton("◀️", callback_data=pack(kind, value, index - 1, index)))
+    steps.append(InlineKeyboardButton(f"{index + 1} из {total}", callback_data=pack(kind, value, index, index)))
+    following = index + 1 if index + 1 - (page - 1) * PAGE_LIMIT < on_page else page * PAGE_LIMIT # последний на странице — к следующей
+    if following < total:
+        steps.append(InlineKeyboardButton("▶️", callback_data=pack(kind, value, following, index)))
+    keyboard.row(*steps)
+
+    jumps = []
+    if page > 2:
+        jumps.append(InlineKeyboardButton("⏮ 1", callback_data=pack(kind, value, 0, index)))
+    if page > 1:
+        jumps.append(InlineKeyboardButton(f"« Стр. {page - 1}", callback_data=pack(kind, value, (page - 2) * PAGE_LIMIT, index)))
+    if page < pages:
+        jumps.append(InlineKeyboardButton(f"Стр. {page + 1} »", callback_data=pack(kind, value, page * PAGE_LIMIT, index)))
+    if page < pages - 1:
+        jumps.append(InlineKeyboardButton(f"{pages} ⏭", callback_data=pack(kind, value, (pages - 1) * PAGE_LIMIT, index)))
+    if jumps:
+        keyboard.row(*jumps)
+    return keyboard
+
+
+@dataclass
+class Slide:
+    movie_id: int
+    text: str # подпись к постеру или текст сообщения
+    url: str = None # None — фильм без постера, слайд текстовый
+    file_id: str = None
+
+    @property
+    def photo(self):
+        return self.file_id or self.url
+
+
+def kept(result, keep): # страница только с фильмами, которые показываем
+    return replace(result, docs=[movie for movie in result.docs if keep(movie)])
+
+
+def make_slide(result, index: int, format_card):
+    # (фильм на позиции index или последний на его странице, если API вернул меньше, Slide)
+    offset = min(index - (page_of(index) - 1) * PAGE_LIMIT, len(result.docs) - 1)
+    index = (page_of(index) - 1) * PAGE_LIMIT + offset
+    movie = result.docs[offset]
+    try:
+        text = format_card(movie)
+    except Exception as e:
+        logger.exception("Ошибка при обработке фильма '%s': %s", movie_title(movie), e)
+        text = f"*{movie_title(movie)}*"
+    if result.stale:
+        text = STALE_NOTE + text
+    url = poster_url(movie)
+    if url:
+        return index, Slide(movie.get("id"), truncate(text, CAPTION_LIMIT), url, get_poster_cache().get(movie.get("id")))
+    return index, Slide(movie.get("id"), truncate(text, MESSAGE_LIMIT))
+
+
+def is_not_modified(error) -> bool: # правка не меняет сообщение — для нас это успех
+    if not isinstance(error, (apihelper.ApiTelegramException, asyncio_helper.ApiTelegramException)):
+        return False
+    return error.error_code == 400 and "message is not modified" in str(error.description).lower()
+
+
+def same_poster(slide: Slide, message) -> bool: # постер не меняется — достаточно поправить подпись
+    return bool(slide.file_id and message.photo and message.photo[-1].file_id == slide.file_id)
+
+
+def remember_poster(slide: Slide, message):
+    if slide.movie_id is not None and message is not None and message is not True and message.photo:
+        get_poster_cache().put(slide.movie_id, message.photo[-1].file_id)
+
+
+def forget_poster(slide: Slide):
+    get_poster_cache().invalidate(slide.movie_id)
+    slide.file_id = None
+
+
+class ShownSlides: # (chat_id, message_id) -> позиция, которую показывает сообщение
+    def __init__(self, max_entries=SHOWN_MAX):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.edits = 0
+        self.skipped = 0
+
+    def claim(self, message, index): # -> (False, None), если позиция уже показана или правится, иначе (True, прежняя)
+        key = (message.chat.id, message.message_id)
+        with self._lock:
+            previous = self._items.get(key)
+            if previous == index:
+                self.skipped += 1
+                return False, None
+            self._put(key, index)
+            return True, previous
+
+    def unclaim(self, message, index, previous): # правка не удалась — сообщение показывает прежнюю позицию
+        key = (message.chat.id, message.message_id)
+        with self._lock:
+            if self._items.get(key) != index:
+                return
+            if previous is None:
+                del self._items[key]
+            else:
+                self._items[key] = previous
+
+    def set(self, chat_id, message_id, index, edited=False):
+        with self._lock:
+            self.edits += edited
+            self._put((chat_id, message_id), index)
+
+    def _put(self, key, index):
+        self._items[key] = index
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def skip(self): # нажата кнопка текущей позиции
+        with self._lock:
+            self.skipped += 1
+
+    def discard(self, chat_id, message_id):
+        with self._lock:
+            self._items.pop((chat_id, message_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"messages": len(self._items), "edits": self.edits, "skipped": self.skipped}
+
+
+shown = ShownSlides()
+
+
+def send_slide(chat_id, slide: Slide, markup): # шаги для handlers.flow
+    if slide.photo:
+        try:
+            sent = yield Call('send_photo', chat_id=chat_id, photo=slide.photo, caption=slide.text, parse_mode='Markdown', reply_markup=markup)
+        except Exception as e:
+            if not (slide.file_id and is_stale_file_id(e)):
+                raise
+            logger.warning("Telegram отверг сохраненный file_id (chat_id: %s): %s. Повторяем по URL.", chat_id, e)
+            yield Blocking(forget_poster, slide)
+            sent = yield Call('send_photo', chat_id=chat_id, photo=slide.url, caption=slide.text, parse_mode='Markdown', reply_markup=markup)
+        yield Blocking(remember_poster, slide, sent)
+    else:
+        sent = yield Call('send_message', chat_id=chat_id, text=slide.text, parse_mode='Markdown', reply_markup=markup)
+    return sent
+
+
+def send_carousel(chat_id, kind, value, result, index: int, format_card): # первое сообщение карусели
+    index, slide = make_slide(result, index, format_card)
+    markup = carousel_markup(kind, value, index, result.total, len(result.docs))
+    try:
+        sent = yield from send_slide(chat_id, slide, markup)
+    except Exception as e:
+        if not slide.photo:
+            raise
+        logger.error("Ошибка при отправке постера (chat_id: %s): %s. Отправляем только текст.", chat_id, e)
+        sent = yield from send_slide(chat_id, Slide(slide.movie_id, slide.text), markup)
+    shown.set(chat_id, sent.message_id, index)
+
+
+def edit_carousel(message, kind, value, result, index: int, current: int, format_card): # переход внутри карусели
+    index, slide = make_slide(result, index, format_card)
+    if index == current: # API вернул меньше фильмов, и позиция совпала с текущей
+        shown.set(message.chat.id, message.message_id, index)
+        return
+    markup = carousel_markup(kind, value, index, result.total, len(result.docs))
+    chat_id, message_id = message.chat.id, message.message_id
+    try:
+        if slide.photo and message.photo:
+            if same_poster(slide, message):
+                yield Call('edit_message_caption', slide.text, chat_id=chat_id, message_id=message_id, parse_mode='Markdown', reply_markup=markup)
+            else:
+                yield from _edit_media(message, slide, markup)
+        elif not slide.photo and not message.photo:
+            yield Call('edit_message_text', slide.text, chat_id=chat_id, message_id=message_id, parse_mode='Markdown', reply_markup=markup)
+        else: # фото нельзя превратить в текст и наоборот — заменяем сообщение
+            yield from _replace(message, slide, markup, index)
+            return
+    except Exception as e:
+        if not is_not_modified(e):
+            if not slide.photo:
+                raise
+            logger.error("Ошибка при смене постера (chat_id: %s): %s. Заменяем сообщение текстом.", chat_id, e)
+            yield from _replace(message, Slide(slide.movie_id, slide.text), markup, index)
+            return
+    shown.set(chat_id, message_id, index, edited=True)
+
+
+def _edit_media(message, slide: Slide, markup):
+    chat_id, message_id = message.chat.id, message.message_id
+    try:
+        edited = yield Call('edit_message_media', InputMediaPhoto(slide.photo, caption=slide.text, parse_mode='Markdown'),
+                            chat_id=chat_id, message_id=message_id, reply_markup=markup)
+    except Exception as e:
+        if not (slide.file_id and is_stale_file_id(e)):
+            raise
+        logger.warning("Telegram отверг сохраненный file_id (chat_id: %s): %s. Повторяем по URL.", chat_id, e)
+        yield Blocking(forget_poster, slide)
+        edited = yield Call('edit_message_media', InputMediaPhoto(slide.url, caption=slide.text, parse_mode='Markdown'),
+                            chat_id=chat_id, message_id=message_id, reply_markup=markup)
+    yield Blocking(remember_poster, slide, edited)
+
+
+def _replace(message, slide: Slide, markup, index):
+    sent = yield from send_slide(message.chat.id, slide, markup)
+    shown.discard(message.chat.id, message.message_id)
+    shown.set(message.chat.id, sent.message_id, index)
+    try:
+        yield Call('delete_message', message.chat.id, message.message_id)
+    except Exception as e:
+        logger.warning("Не удалось удалить прежнее сообщение карусели: %s", e)
+
+
+def register_carousel_handlers(router, sources): # sources: вид -> (fetch(value, page) — шаги flow, format_card, keep)
+    metrics.collector("carousel", shown.stats)
+
+    @router.callback(CALLBACK_PREFIX)
+    def carousel_callback(call):
+        yield Call('answer_callback_query', call.id)
+        try:
+            kind, value, target, current = unpack(call.data)
+        except ValueError as e:
+            logger.warning("Некорректные данные кнопки карусели '%s': %s", call.data, e)
+            return
+        if target == current: # кнопка текущей позиции
+            shown.skip()
+            return
+        claimed, previous = shown.claim(call.message, target) # повторные нажатия, пока идет правка, отсекаются
+        if not claimed:
+            return
+        edited = False
+        try:
+            edited = yield from _navigate(call, sources[kind], kind, value, target, current)
+        finally:
+            if not edited:
+                shown.unclaim(call.message, target, previous)
+
+
+def _navigate(call, source, kind, value, target, current): # True — сообщение показывает новую позицию
+    fetch, format_card, keep = source
+    chat_id = call.message.chat.id
+    page = page_of(target)
+    try:
+        yield Prefetch('navigate', chat_id, kind, value, page)
+        with span("api"): # на другой странице — готовая страница из предзагрузки
+            result = (page != page_of(current) and (yield Prefetch('take', chat_id, kind, value, page))) or (yield from fetch(value, page))
+    except Exception as e:
+        yield Call('send_message', chat_id, api_error_text(e, f"{kind} '{value}' (page {page})", SEARCH_LABELS[kind]), reply_markup=search_subkeyboard())
+        return False
+    try:
+        result = kept(result, keep)
+        if not result.docs:
+            return False
+        with span("send_page"):
+            yield from edit_carousel(call.message, kind, value, result, target, current, format_card)
+        yield Schedule(chat_id, kind, value, page, total_pages(result.total), lambda p: fetch(value, p))
+    except Exception as e:
+        logger.error("Ошибка при обработке callback '%s': %s", call.data, e)
+        yield Call('send_message', chat_id, PAGE_SWITCH_ERROR_TEXT, reply_markup=search_subkeyboard())
+        return False
+    return True
@@ -0,0 +1,199 @@
+import logging
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from api.errors import (ApiError, ApiKeyMissingError, ApiHTTPError, ApiConnectionError,
+                        ApiTimeoutError, ApiResponseError, ApiOverloadedError, ApiUnavailableError,
+                        ApiQuotaExhaustedError)
+from services.logs import SAMPLED
+
+# Логика, общая для sync (TeleBot) и async (AsyncTeleBot) обработчиков:
+# разбор ввода, подготовка текстов и клавиатур, тексты ошибок API.
+
+logger = logging.getLogger(__name__)
+
+NAME_LIMIT = 10 # результатов поиска по названию
+PAGE_LIMIT = 5 # фильмов на странице рейтинга/бюджета
+
+WAITING_FOR_MOVIE_NAME = 'waiting_for_movie_name'
+WAITING_FOR_MIN_RATING = 'waiting_for_min_rating'
+WAITING_FOR_MIN_BUDGET = 'waiting_for_min_budget'
+
+UNEXPECTED_ERROR_TEXT = "Произошла непредвиденная ошибка. Пожалуйста, попробуйте еще раз."
+START_TEXT = "Привет, {first_name}! Меня зовут TeleBot. Я умею искать информацию о фильмах или сериалах, а также предоставлю историю твоих запросов!"
+PAGE_SWITCH_ERROR_TEXT = "Произошла ошибка при переходе на другую страницу."
+BUSY_TEXT = "⏳ Бот сейчас занят, попробуйте еще раз через несколько секунд."
+POPULAR_EMPTY_TEXT = "Пока нечего показать: популярное появится, когда пользователи начнут искать фильмы."
+STALE_TEXT = "⚠️ Сервер поиска фильмов сейчас недоступен, показываю сохраненные результаты — они могут быть устаревшими."
+
+
+def rating_filters(min_rating) -> dict:
+    return {"rating.kp": f"{min_rating}-10"}
+
+def budget_filters(min_budget_usd) -> dict:
+    return {"budget.value": [min_budget_usd]}
+
+def parse_min_rating(text: str) -> float: # ValueError при некорректном вводе
+    min_rating = float(text.replace(',', '.'))
+    if not 0 <= min_rating <= 10:
+        raise ValueError("Рейтинг должен быть от 0 до 10.")
+    return min_rating
+
+def parse_min_budget(text: str): # возвращает (бюджет в млн, бюджет в долларах)
+    min_budget_input = float(text.replace(',', '.'))
+    if min_budget_input < 0:
+        raise ValueError("Бюджет не может быть отрицательным.")
+    return min_budget_input, int(min_budget_input * 1_000_000)
+
+def total_pages(total_movies: int, limit: int = PAGE_LIMIT) -> int:
+    return (total_movies + limit - 1) // limit
+
+
+def movie_title(movie: dict) -> str:
+    return movie.get("name", movie.get("alternativeName", "Название неизвестно"))
+
+def poster_url(movie: dict):
+    return (movie.get("poster") or {}).get("url")
+
+def pick_movie(results: list, query: str): # точное совпадение названия или первый результат
+    processed_query = query.lower().strip()
+    for item_candidate in results:
+        title_candidate = item_candidate.get("name") or item_candidate.get("alternativeName") or ""
+        if title_candidate.lower().strip() == processed_query:
+            logger.info("Найдено точное совпадение для '%s': %s", query, title_candidate, extra=SAMPLED)
+            return item_candidate
+    found_item = results[0]
+    logger.info("Для '%s' точное совпадение не найдено. Возвращаем первый результат: %s", query, movie_title(found_item), extra=SAMPLED)
+    return found_item
+
+def format_movie_card(movie: dict) -> str: # карточка фильма для поиска по названию
+    title = movie_title(movie)
+    year = movie.get("year", "Год неизвестен")
+    description = movie.get("description", "Описание отсутствует")
+    rating_kp = movie.get("rating", {}).get("kp", "Неизвестен")
+    rating_imdb = movie.get("rating", {}).get("imdb", "Неизвестен")
+
+    budget_data = movie.get("budget")
+    budget_display = "Бюджет неизвестен"
+    if budget_data and budget_data.get("value") is not None:
+        budget_value = budget_data["value"]
+        budget_currency = budget_data.get("currency", "")
+        budget_display = f"{budget_value:,.0f} {budget_currency}".replace(",", " ")
+
+    message_text = f"🎬 *{title}* ({year})\n"
+    message_text += f"⭐ Рейтинг Кинопоиска: {rating_kp}\n"
+    if rating_imdb != "Неизвестен": # только если IMDb доступен
+        message_text += f"IMDb: {rating_imdb}\n"
+    message_text += f"💰 Бюджет: {budget_display}\n\n"
+    message_text += f"{description}"
+    return message_text
+
+def format_rating_card(movie: dict) -> str:
+    title = movie_title(movie)
+    year = movie.get("year", "Год неизвестен")
+    rating_kp = movie.get("rating", {}).get("kp", "Неизвестен")
+    description = movie.get("description", "Описание отсутствует")
+    return f"🎬 *{title}* ({year})\n⭐ Рейтинг Кинопоиска: {rating_kp}\n\n{description}"
+
+def has_budget(movie: dict) -> bool:
+    return bool(movie.get("budget")) and movie["budget"].get("value") is not None
+
+def format_budget(budget_value, budget_currency) -> str:
+    if budget_value is None:
+        return "Неизвестен"
+    if budget_currency == "USD":
+        return f"${budget_value:,}"
+    if budget_currency == "RUB":
+        return f"₽{budget_value:,}"
+    if budget_currency == "EUR":
+        return f"€{budget_value:,}"
+    return f"{budget_value:,} {budget_currency if budget_currency else ''}".strip()
+
+def format_budget_card(movie: dict) -> str:
+    title = movie_title(movie)
+    year = movie.get("year", "Год неизвестен")
+    budget_obj = movie.get("budget", {})
+    formatted_budget = format_budget(budget_obj.get("value"), budget_obj.get("currency"))
+    description = movie.get("description", "Описание отсутствует")
+    return f"🎬 *{title}* ({year})\n💰 Бюджет: {formatted_budget}\n\n{description}"
+
+
+def pagination_markup(prefix: str, value, current_page: int, pages: int) -> InlineKeyboardMarkup: # InLine клавиатура для листания результатов
+    keyboard = InlineKeyboardMarkup()
+    buttons = []
+    if current_page > 1:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f'{prefix}:{value}:{current_page - 1}'))
+    buttons.append(InlineKeyboardButton(f"Стр. {current_page}/{pages}", callback_data="ignore_me"))
+    if current_page < pages:
+        buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data=f'{prefix}:{value}:{current_page + 1}'))
+    keyboard.add(*buttons)
+    return keyboard
+
+def format_history(history_records) -> str: # пустая строка, если истории нет
+    if not history_records:
+        return ""
+    response_text = "Ваши последние запросы:\n\n"
+    for i, record in enumerate(history_records, 1):
+        formatted_time = record.timestamp.strftime('%d.%m.%Y %H:%M')
+        response_text += f"*{i}.* `{record.query}` (_{formatted_time}_)\n"
+    return response_text
+
+
+def escape_markdown(text: str) -> str: # ввод пользователя внутри разметки Markdown
+    for char in ('_', '*', '`', '['):
+        text = text.replace(char, '\\' + char)
+    return text
+
+def format_trending(names, ratings, budgets) -> str: # списки [(подпись, вес)] из services.trending; пустая строка, если нечего показать
+    if not (names or ratings or budgets):
+        return ""
+    response_text = "🔥 *Популярное* — что чаще всего ищут в последние дни:\n"
+    if names:
+        response_text += "\n*Фильмы и сериалы:*\n"
+        for i, (label, _) in enumerate(names, 1):
+            response_text += f"{i}. {escape_markdown(label)}\n"
+    if ratings:
+        response_text += "\n*Рейтинг от:* " + ", ".join(label for label, _ in ratings) + "\n"
+    if budgets:
+        response_text += "\n*Бюджет от:* " + ", ".join(f"${label} млн" for label, _ in budgets) + "\n"
+    return response_text
+
+
+def api_error_text(error: Exception, context: str, search_label: str = "", bad_request_hint: str = None) -> str:
+    # логирует ошибку поиска и возвращает текст для пользователя; context — что искали, для лога
+    if isinstance(error, ApiKeyMissingError):
+        logger.error("API ключ не найден")
+        return "Ошибка: API ключ не настроен. Обратитесь к администратору."
+    if isinstance(error, ApiHTTPError):
+        status_code = error.status_code
+        logger.error("HTTP ошибка запроса для %s: %s - %s", context, status_code, error.text)
+        if status_code == 400 and bad_request_hint:
+            return f"Ошибка запроса к API (Код 400): {bad_request_hint} Ответ API: {error.text}"
+        if status_code == 401:
+            return "Ошибка авторизации: проверьте API ключ."
+        if status_code == 404:
+            return "Ресурс API не найден. Возможно, изменена структура URL."
+        if status_code == 429:
+            return "Слишком много запросов к серверу поиска фильмов. Пожалуйста, попробуйте через несколько секунд."
+        return f"Ошибка сервера ({status_code}) при поиске{search_label}. Попробуйте ещё раз."
+    if isinstance(error, ApiConnectionError):
+        logger.error("Ошибка соединения с API для %s: %s", context, error)
+        return "Не удалось подключиться к серверу поиска фильмов. Проверьте ваше интернет-соединение или попробуйте позже."
+    if isinstance(error, ApiTimeoutError):
+        logger.error("Таймаут запроса к API для %s: %s", context, error)
+        return "Сервер поиска фильмов слишком долго не отвечал. Пожалуйста, попробуйте ещё раз."
+    if isinstance(error, ApiQuotaExhaustedError):
+        logger.error("Запрос для %s не выполнен: %s", context, error)
+        return "Лимит запросов к серверу поиска фильмов на сегодня исчерпан. Пожалуйста, попробуйте позже."
+    if isinstance(error, ApiUnavailableError):
+        logger.warning("Запрос для %s не выполнен: %s", context, error)
+        return "Сервер поиска фильмов сейчас недоступен. Пожалуйста, попробуйте через минуту."
+    if isinstance(error, ApiOverloadedError):
+        logger.warning("Запрос для %s отклонен: %s", context, error)
+        return "Сейчас слишком много одинаковых запросов. Пожалуйста, попробуйте через несколько секунд."
+    if isinstance(error, (ApiResponseError, ValueError)):
+        logger.error("Ошибка обработки данных от API для %s: %s", context, error)
+        return f"Произошла ошибка при обработке данных от сервера: {error}."
+    if isinstance(error, ApiError):
+        logger.error("Общая ошибка запроса к API для %s: %s", context, error)
+        return "Произошла ошибка при обращении к серверу поиска фильмов. Пожалуйста, попробуйте ещё раз."
+    logger.exception("Неизвестная ошибка при поиске для %s: %s", context, error)
+    return UNEXPECTED_ERROR_TEXT
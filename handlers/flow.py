@@ -0,0 +1,94 @@
+import asyncio
+import inspect
+
+# Обработчики написаны один раз — генераторами, общими для TeleBot и AsyncTeleBot. Вместо вызова бота,
+# API или блокирующей функции генератор отдает операцию (yield Call(...)), движок выполняет ее и возвращает
+# результат в генератор или бросает в него исключение. Engine выполняет операции прямо в потоке обработчика,
+# AsyncEngine — через await, блокирующие — в asyncio.to_thread. Вложенные шаги — через yield from.
+
+
+class Call: # метод бота: send_message, edit_message_media, ...
+    def __init__(self, method, *args, **kwargs):
+        self.method, self.args, self.kwargs = method, args, kwargs
+
+    def target(self, engine):
+        return engine.bot
+
+    def run(self, engine):
+        return getattr(self.target(engine), self.method)(*self.args, **self.kwargs)
+
+    async def run_async(self, engine):
+        return await getattr(self.target(engine), self.method)(*self.args, **self.kwargs)
+
+
+class Api(Call): # метод клиента PoiskKino: search, discover
+    def target(self, engine):
+        return engine.client()
+
+
+class Prefetch(Call): # метод предзагрузки страниц: take, navigate, cancel
+    def target(self, engine):
+        return engine.prefetcher()
+
+    async def run_async(self, engine):
+        result = getattr(self.target(engine), self.method)(*self.args, **self.kwargs)
+        return await result if inspect.isawaitable(result) else result
+
+
+class Schedule: # предзагрузка следующих страниц; fetch(page) — генератор, его выполняет тот же движок
+    def __init__(self, chat_id, kind, value, page, pages, fetch):
+        self.args, self.fetch = (chat_id, kind, value, page, pages), fetch
+
+    def run(self, engine):
+        engine.prefetcher().schedule(*self.args, lambda page: engine.run(self.fetch(page)))
+
+    async def run_async(self, engine):
+        self.run(engine)
+
+
+class Blocking: # SQLite и прочий синхронный ввод-вывод: в async режиме — в потоке, не в event loop
+    def __init__(self, fn, *args):
+        self.fn, self.args = fn, args
+
+    def run(self, engine):
+        return self.fn(*self.args)
+
+    async def run_async(self, engine):
+        return await asyncio.to_thread(self.fn, *self.args)
+
+
+class Engine: # TeleBot: операции выполняются прямо в потоке обработчика
+    def __init__(self, bot, client, prefetcher):
+        self.bot = bot
+        self.client = client # get_client: клиент создается при первом запросе, а не при регистрации
+        self.prefetcher = prefetcher
+
+    def run(self, flow):
+        if not inspect.isgenerator(flow): # обычная функция — ее результат
+            return flow
+        value, error = None, None
+        while True:
+            try:
+                op = flow.send(value) if error is None else flow.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value, error = op.run(self), None
+            except Exception as e:
+                value, error = None, e
+
+
+class AsyncEngine(Engine): # AsyncTeleBot: те же генераторы, операции через await
+    async def run(self, flow):
+        if not inspect.isgenerator(flow):
+            return await flow if inspect.isawaitable(flow) else flow
+        value, error = None, None
+        while True:
+            try:
+                op = flow.send(value) if error is None else flow.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value, error = await op.run_async(self), None
+            except Exception as e:
+                value, error = None, e
@@ -0,0 +1,149 @@
+import time
+import logging
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+
+import config
+from services import metrics
+from services.logs import SAMPLED
+from services.title_index import get_title_index, normalize
+from services.debounce import Debouncer, AsyncDebouncer
+from services.poster_cache import get_poster_cache
+from api.poiskkino import get_client
+from api.poiskkino_async import get_async_client
+from handlers.common import movie_title, poster_url, format_movie_card
+from handlers.flow import Engine, AsyncEngine, Call, Api
+
+# Inline-режим: "@бот матр" в любом чате. Запросы приходят на каждое нажатие клавиши, поэтому
+# отвечаем из индекса названий в памяти, а в API идем только после паузы в наборе (INLINE_DEBOUNCE)
+# и только последним запросом пользователя — промежуточные заменяются или отменяются.
+
+logger = logging.getLogger(__name__)
+
+ANSWER_SECONDS = metrics.histogram("inline_answer_seconds", "От inline-запроса до ответа", ("source",))
+
+CAPTION_LIMIT = 1024 # ограничение Telegram на подпись к фото
+DESCRIPTION_LIMIT = 600
+
+
+def parse_offset(offset) -> int:
+    try:
+        return max(0, int(offset or 0))
+    except ValueError:
+        return 0
+
+def inline_card(movie: dict) -> str: # карточка как в поиске по названию, с укороченным описанием
+    description = movie.get("description") or "Описание отсутствует"
+    if len(description) > DESCRIPTION_LIMIT:
+        description = description[:DESCRIPTION_LIMIT].rsplit(" ", 1)[0] + "…"
+    return format_movie_card(dict(movie, description=description))[:CAPTION_LIMIT]
+
+def inline_results(movies: list) -> list: # постер из кэша file_id, по URL или статья без фото
+    results = []
+    for movie in movies:
+        result_id, title, card = str(movie["id"]), movie_title(movie), inline_card(movie)
+        description = f"{movie.get('year', 'Год неизвестен')}, ⭐ {(movie.get('rating') or {}).get('kp', '—')}"
+        file_id, url = get_poster_cache().get(movie["id"]), poster_url(movie)
+        if file_id:
+            results.append(types.InlineQueryResultCachedPhoto(result_id, file_id, title=title, description=description,
+                                                               caption=card, parse_mode='Markdown'))
+        elif url:
+            results.append(types.InlineQueryResultPhoto(result_id, url, url, title=title, description=description,
+                                                         caption=card, parse_mode='Markdown'))
+        else:
+            results.append(types.InlineQueryResultArticle(result_id, title, types.InputTextMessageContent(card, parse_mode='Markdown'),
+                                                           description=description))
+    return results
+
+def lookup(index, text: str, offset: int): # (фильмы, всего, нужен ли запрос к API)
+    movies, total = index.search(text, offset, config.INLINE_RESULTS)
+    need_api = offset == 0 and total < config.INLINE_RESULTS and len(normalize(text)) >= config.INLINE_MIN_API_QUERY
+    return movies, total, need_api
+
+def merge(index_movies: list, api_movies: list) -> list: # API ищет не только по префиксам — добавляем то, чего нет в индексе
+    seen = {movie["id"] for movie in index_movies}
+    merged = list(index_movies)
+    merged.extend(movie for movie in api_movies if movie.get("id") is not None and movie["id"] not in seen)
+    return merged[:config.INLINE_RESULTS]
+
+def answer_kwargs(movies: list, total: int, offset: int, complete: bool) -> dict:
+    total = max(total, offset + len(movies))
+    return {
+        "results": inline_results(movies),
+        "cache_time": config.INLINE_CACHE_TIME if complete else config.INLINE_PARTIAL_CACHE_TIME,
+        "is_personal": False, # подсказки одинаковы для всех: Telegram может отдать кэш другому пользователю
+        "next_offset": str(offset + len(movies)) if offset + len(movies) < total else "",
+    }
+
+def observe(source, started):
+    ANSWER_SECONDS.labels(source).observe(time.perf_counter() - started)
+
+
+def answer(query, movies, total, offset, complete): # шаги handlers.flow
+    try:
+        yield Call('answer_inline_query', query.id, **answer_kwargs(movies, total, offset, complete))
+    except (ApiTelegramException, AsyncApiTelegramException) as e: # пользователь ушел, запрос устарел
+        logger.info("Inline-ответ на '%s' не принят: %s", query.query, e, extra=SAMPLED)
+
+
+def inline_search(index, query, debounce): # debounce(user_id, steps) — отложить steps(current) до паузы в наборе
+    started = time.perf_counter()
+    text, offset = query.query.strip(), parse_offset(query.offset)
+    movies, total, need_api = lookup(index, text, offset)
+    if movies or not need_api: # отвечаем сразу; неполный ответ Telegram кэширует недолго — индекс пополняется
+        yield from answer(query, movies, total, offset, complete=len(movies) == config.INLINE_RESULTS)
+        observe("index" if movies else "empty", started)
+        if not need_api:
+            return
+    answered = bool(movies)
+    debounce(query.from_user.id, lambda current: search_api(index, query, text, answered, started, current))
+
+
+def search_api(index, query, text, answered, started, current): # ответ нужен, только если индекс ничего не дал
+    # current() — False, если пользователь уже отправил более новый запрос
+    if not current(): # пока вызов ждал свободного потока, запрос устарел — не тратим на него запрос к API
+        return
+    try:
+        api_movies = (yield Api('search', text, page=1, limit=config.INLINE_RESULTS)).docs
+    except Exception as e:
+        logger.warning("Inline-поиск '%s' в API не удался: %s", text, e)
+        api_movies = []
+    if answered or not current():
+        return
+    index_movies, index_total = index.search(text, 0, config.INLINE_RESULTS)
+    merged = merge(index_movies, api_movies)
+    yield from answer(query, merged, max(index_total, len(merged)), 0, complete=bool(api_movies))
+    observe("api", started)
+
+
+def register_inline_handlers(bot):
+    index = get_title_index()
+    if index is None:
+        return
+    engine = Engine(bot, get_client, None)
+    debouncer = Debouncer(config.INLINE_DEBOUNCE, workers=config.INLINE_WORKERS)
+    metrics.collector("inline_debounce", debouncer.stats)
+
+    def debounce(user_id, steps): # выполнится в пуле debouncer, если пользователь не набрал новый запрос
+        debouncer.submit(user_id, lambda seq: engine.run(steps(lambda: debouncer.is_current(user_id, seq))))
+
+    @bot.inline_handler(func=lambda query: True)
+    def on_inline_query(query):
+        engine.run(inline_search(index, query, debounce))
+
+
+def register_async_inline_handlers(bot):
+    index = get_title_index()
+    if index is None:
+        return
+    engine = AsyncEngine(bot, get_async_client, None)
+    debouncer = AsyncDebouncer(config.INLINE_DEBOUNCE)
+    metrics.collector("inline_debounce", debouncer.stats)
+
+    def debounce(user_id, steps): # новый запрос того же пользователя отменяет задачу; общий запрос к API защищен singleflight
+        debouncer.submit(user_id, lambda: engine.run(steps(lambda: True)))
+
+    @bot.inline_handler(func=lambda query: True)
+    async def on_inline_query(query):
+        await engine.run(inline_search(index, query, debounce))
@@ -0,0 +1,184 @@
+import logging
+from dataclasses import dataclass, field
+from telebot.types import InputMediaPhoto
+from telebot import apihelper, asyncio_helper
+from handlers.common import movie_title, poster_url
+from services.poster_cache import get_poster_cache
+from services.sender import bulk_priority
+from handlers.flow import Call, Blocking
+
+# Страница результатов (рейтинг/бюджет) одним альбомом send_media_group вместо send_photo на каждый фильм.
+# Фильмы без постера собираются в одно текстовое сообщение, к нему же крепится клавиатура пагинации.
+# Постер, который уже отправлялся, уходит по file_id из кэша: Telegram не скачивает его с CDN заново.
+# Отправка — генераторы для handlers.flow, одни и те же для TeleBot и AsyncTeleBot.
+
+logger = logging.getLogger(__name__)
+
+CAPTION_LIMIT = 1024 # лимит Telegram на подпись к фото
+MESSAGE_LIMIT = 4096 # лимит Telegram на текст сообщения
+MEDIA_GROUP_MAX = 10
+PAGINATION_FOOTER = "Листайте результаты:"
+
+
+def truncate(text: str, limit: int) -> str: # разметка (*название*) в начале карточки, режем описание в конце
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1]
+    start = open_entity(cut)
+    if start is not None: # граница попала внутрь *…*, _…_, `…` или […](…): Telegram отверг бы весь альбом
+        cut = cut[:start]
+    return cut.rstrip() + "…"
+
+
+def open_entity(text: str): # начало незакрытой сущности Markdown (legacy) или None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\': # экранированный символ
+            i += 2
+            continue
+        if text.startswith('```', i):
+            end = text.find('```', i + 3)
+            if end < 0:
+                return i
+            i = end + 3
+            continue
+        if char in '*_`':
+            end = text.find(char, i + 1)
+            if end < 0:
+                return i
+            i = end + 1
+            continue
+        if char == '[':
+            label_end = text.find('](', i + 1)
+            end = text.find(')', label_end + 2) if label_end >= 0 else -1
+            if end < 0:
+                return i
+            i = end + 1
+            continue
+        i += 1
+    return None
+
+
+@dataclass
+class Poster:
+    movie_id: int
+    url: str
+    file_id: str = None # из кэша; None — отправляем по URL
+
+
+@dataclass
+class PagePlan:
+    media: list = field(default_factory=list) # InputMediaPhoto для альбома
+    media_texts: list = field(default_factory=list) # тексты тех же фильмов на случай отказа альбома
+    posters: list = field(default_factory=list) # Poster для каждого элемента media
+    texts: list = field(default_factory=list) # фильмы без постера
+
+    def add_photo(self, movie, url, caption, text):
+        poster = Poster(movie.get("id"), url, get_poster_cache().get(movie.get("id")))
+        self.media.append(InputMediaPhoto(poster.file_id or url, caption=caption, parse_mode='Markdown'))
+        self.media_texts.append(text)
+        self.posters.append(poster)
+
+
+def build_page(movies, format_card) -> PagePlan:
+    plan = PagePlan()
+    for movie in movies:
+        try:
+            message_text = format_card(movie)
+        except Exception as e:
+            logger.exception("Ошибка при обработке фильма '%s': %s", movie_title(movie), e)
+            continue
+        poster = poster_url(movie)
+        if poster and len(plan.media) < MEDIA_GROUP_MAX:
+            plan.add_photo(movie, poster, truncate(message_text, CAPTION_LIMIT), message_text)
+        else:
+            plan.texts.append(message_text)
+    return plan
+
+
+def join_texts(texts) -> list: # склеиваем карточки в сообщения не длиннее MESSAGE_LIMIT
+    chunks, current = [], ""
+    for text in texts:
+        text = truncate(text, MESSAGE_LIMIT)
+        if current and len(current) + 2 + len(text) > MESSAGE_LIMIT:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{text}" if current else text
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def is_stale_file_id(error) -> bool: # Telegram не принимает сохраненный file_id
+    if not isinstance(error, (apihelper.ApiTelegramException, asyncio_helper.ApiTelegramException)):
+        return False
+    return error.error_code == 400 and "file" in str(error.description).lower()
+
+
+def invalidate_stale(plan: PagePlan, error) -> bool: # True — стоит повторить отправку по URL
+    cached = [poster for poster in plan.posters if poster.file_id]
+    if not cached or not is_stale_file_id(error):
+        return False
+    for poster in cached:
+        get_poster_cache().invalidate(poster.movie_id)
+        poster.file_id = None
+    plan.media = [InputMediaPhoto(poster.url, caption=media.caption, parse_mode='Markdown')
+                  for media, poster in zip(plan.media, plan.posters)]
+    return True
+
+
+def remember_posters(plan: PagePlan, messages): # file_id берем из ответа send_photo/send_media_group
+    for poster, message in zip(plan.posters, messages):
+        if poster.movie_id is not None and message is not None and message.photo:
+            get_poster_cache().put(poster.movie_id, message.photo[-1].file_id)
+
+
+def send_media(chat_id, plan: PagePlan, reply_markup=None): # шаги для handlers.flow
+    try:
+        messages = yield from _send_media_once(chat_id, plan, reply_markup)
+    except Exception as e:
+        if not (yield Blocking(invalidate_stale, plan, e)):
+            raise
+        logger.warning("Telegram отверг сохраненный file_id (chat_id: %s): %s. Повторяем по URL.", chat_id, e)
+        messages = yield from _send_media_once(chat_id, plan, reply_markup)
+    yield Blocking(remember_posters, plan, messages)
+
+
+def _send_media_once(chat_id, plan: PagePlan, reply_markup=None):
+    if len(plan.media) == 1:
+        photo = plan.media[0]
+        return [(yield Call('send_photo', chat_id=chat_id, photo=photo.media, caption=photo.caption, parse_mode='Markdown', reply_markup=reply_markup))]
+    return (yield Call('send_media_group', chat_id, plan.media))
+
+
+def send_movie_photo(chat_id, movie, caption, reply_markup=None): # один фильм с постером (поиск по названию)
+    plan = PagePlan()
+    plan.add_photo(movie, poster_url(movie), caption, caption)
+    yield from send_media(chat_id, plan, reply_markup)
+
+
+def send_page(chat_id, plan: PagePlan, reply_markup=None, footer=PAGINATION_FOOTER):
+    # 1 вызов, если есть только альбом или только текст без клавиатуры; 2 — альбом + текст/клавиатура
+    with bulk_priority(): # страница результатов уступает интерактивным ответам других пользователей
+        texts = list(plan.texts)
+        if plan.media:
+            try:
+                yield from send_media(chat_id, plan)
+            except Exception as e:
+                logger.error("Ошибка при отправке %s фото (chat_id: %s): %s. Отправляем только текст.", len(plan.media), chat_id, e)
+                texts = plan.media_texts + texts
+
+        chunks = join_texts(texts)
+        if reply_markup is not None and not chunks:
+            chunks = [footer]
+        for i, chunk in enumerate(chunks):
+            markup = reply_markup if i == len(chunks) - 1 else None
+            yield Call('send_message', chat_id=chat_id, text=chunk, parse_mode='Markdown', reply_markup=markup)
+
+
+def release_keyboard(message): # убираем старую клавиатуру пагинации после нажатия
+    if message.text == PAGINATION_FOOTER: # отдельное сообщение только с клавиатурой — удаляем целиком
+        yield Call('delete_message', message.chat.id, message.message_id)
+    else: # клавиатура висит на карточках фильмов — снимаем только ее
+        yield Call('edit_message_reply_markup', message.chat.id, message.message_id, reply_markup=None)
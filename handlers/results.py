@@ -0,0 +1,83 @@
+import logging
+import config
+from keyboards.my_keyboard import search_subkeyboard
+from services.metrics import span
+from handlers.flow import Call, Prefetch, Schedule
+from handlers.page_renderer import build_page, send_page, release_keyboard
+from handlers.carousel import send_carousel, kept
+from handlers.common import PAGE_LIMIT, PAGE_SWITCH_ERROR_TEXT, STALE_TEXT, total_pages, pagination_markup, api_error_text
+
+# Страница результатов рейтинга или бюджета и листание кнопками пагинации — общие шаги для обоих поисков.
+# Чем поиски отличаются (запрос к API, карточка, тексты), описывает ResultKind в модуле поиска.
+
+logger = logging.getLogger(__name__)
+
+
+class ResultKind:
+    def __init__(self, kind, prefix, fetch, format_card, parse_value, subject, context, empty_text,
+                 search_label="", bad_request_hint=None, keep=None):
+        self.kind = kind # 'rating' / 'budget': ключ предзагрузки и карусели
+        self.prefix = prefix # callback_data кнопок пагинации
+        self.fetch = fetch # (value, page) -> шаги flow, возвращает MoviePage
+        self.format_card = format_card
+        self.parse_value = parse_value # значение из callback_data
+        self.subject = subject # "рейтинга {}" — для "Загружаю страницу..."
+        self.context = context # "рейтинга '{}'" — что искали, для лога ошибок
+        self.empty_text = empty_text
+        self.search_label = search_label
+        self.bad_request_hint = bad_request_hint
+        self.keep = keep or (lambda movie: True) # какие фильмы из ответа показывать
+
+
+def show_results(chat_id, kind: ResultKind, value, page):
+    try:
+        with span("api"): # готовая страница из предзагрузки или запрос к API
+            result = (yield Prefetch('take', chat_id, kind.kind, value, page)) or (yield from kind.fetch(value, page))
+        shown_page = kept(result, kind.keep)
+        movies = shown_page.docs
+        if not movies:
+            yield Call('send_message', chat_id, kind.empty_text.format(value), reply_markup=search_subkeyboard())
+            return
+        pages = total_pages(result.total)
+        if config.CAROUSEL_ENABLED: # одно сообщение, дальше листается правкой
+            with span("send_page"):
+                yield from send_carousel(chat_id, kind.kind, value, shown_page, (page - 1) * PAGE_LIMIT, kind.format_card)
+            yield Schedule(chat_id, kind.kind, value, page, pages, lambda p: kind.fetch(value, p))
+            return
+        if result.stale:
+            yield Call('send_message', chat_id, STALE_TEXT)
+
+        keyboard = None
+        if result.total > PAGE_LIMIT:
+            keyboard = pagination_markup(kind.prefix, value, page, pages)
+        with span("send_page"):
+            yield from send_page(chat_id, build_page(movies, kind.format_card), reply_markup=keyboard) # альбом + текст/клавиатура
+        if keyboard is not None:
+            yield Schedule(chat_id, kind.kind, value, page, pages, lambda p: kind.fetch(value, p))
+    except Exception as e:
+        error_text = api_error_text(e, f"{kind.context.format(value)} (page {page})", kind.search_label,
+                                    bad_request_hint=kind.bad_request_hint)
+        yield Call('send_message', chat_id, error_text, reply_markup=search_subkeyboard())
+
+
+def register_page_handlers(router, kinds): # кнопки пагинации всех видов результатов
+    by_prefix = {kind.prefix: kind for kind in kinds}
+
+    @router.callback(*(f"{prefix}:" for prefix in by_prefix))
+    def page_callback(call): # реализация InLine клавиатуры
+        yield Call('answer_callback_query', call.id)
+        chat_id = call.message.chat.id
+        try:
+            prefix, value_text, page_text = call.data.split(':')
+            kind = by_prefix[prefix]
+            value, page = kind.parse_value(value_text), int(page_text)
+            try:
+                yield from release_keyboard(call.message)
+            except Exception as delete_err:
+                logger.warning("Не удалось убрать клавиатуру пагинации: %s", delete_err)
+            yield Call('send_message', chat_id, f"Загружаю страницу {page} для {kind.subject.format(value)}...", reply_markup=search_subkeyboard())
+            yield Prefetch('navigate', chat_id, kind.kind, value, page)
+            yield from show_results(chat_id, kind, value, page)
+        except Exception as e:
+            logger.error("Ошибка при обработке callback '%s': %s", call.data, e)
+            yield Call('send_message', chat_id, PAGE_SWITCH_ERROR_TEXT, reply_markup=search_subkeyboard())
@@ -0,0 +1,166 @@
+import time
+import asyncio
+import logging
+import contextlib
+from telebot import util
+
+from services import metrics
+from services.logs import log_context
+
+# Один обработчик сообщений и один обработчик callback вместо цепочки @bot.message_handler(func=lambda ...):
+# команда и текст кнопки ищутся в словаре, состояние пользователя — в таблице состояний,
+# callback_data — в префиксном дереве. Команды и кнопки всегда проверяются раньше состояния: "Назад" во время
+# ввода рейтинга возвращает в меню, а не ищет фильм "Назад". Это изменение порядка: прежде обработчик ввода
+# названия был зарегистрирован раньше кнопок "По рейтингу"/"По бюджету" (и ввод рейтинга — раньше "По бюджету"),
+# и во время ввода названия они искались как название фильма; теперь они переключают поиск.
+
+logger = logging.getLogger(__name__)
+
+UPDATES = metrics.counter("bot_updates_total", "Обработанные обновления по обработчикам", ("handler",))
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Время обработчика целиком, включая ответы", ("handler",))
+HANDLER_ERRORS = metrics.counter("bot_handler_errors_total", "Исключения, вышедшие из обработчика", ("handler",))
+ACTIVE_HANDLERS = metrics.gauge("bot_active_handlers", "Обработчики, которые выполняются прямо сейчас")
+
+
+@contextlib.contextmanager
+def _observed(handler, chat_id): # метрики и трасса одного обновления
+    name = handler.__name__ if handler is not None else "unrouted"
+    UPDATES.labels(name).inc()
+    if handler is None:
+        yield
+        return
+    token = metrics.start_trace(name, chat_id)
+    ACTIVE_HANDLERS.inc()
+    started = time.perf_counter()
+    error = None
+    try:
+        with log_context(chat_id=chat_id, handler=name): # поля записей лога из обработчика
+            yield
+    except Exception as e:
+        error = e
+        HANDLER_ERRORS.labels(name).inc()
+        raise
+    finally:
+        ACTIVE_HANDLERS.dec()
+        HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+        metrics.finish_trace(token, error)
+
+
+class PrefixTrie: # callback_data -> обработчик по самому длинному зарегистрированному префиксу
+    def __init__(self):
+        self._root = {}
+
+    def add(self, prefix, value):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if None in node:
+            raise ValueError(f"Префикс '{prefix}' уже зарегистрирован")
+        node[None] = value # None не бывает символом строки — ключ для значения
+
+    def match(self, text):
+        node, found = self._root, self._root.get(None)
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+
+class Router:
+    def __init__(self, get_state):
+        self.get_state = get_state # chat_id -> состояние пользователя или None
+        self.commands = {}
+        self.texts = {} # текст кнопки -> (обработчик, допустимые типы чата или None)
+        self.states = {}
+        self.callbacks = PrefixTrie()
+
+    def command(self, name):
+        return self._register(self.commands, name, lambda handler: handler)
+
+    def text(self, text, chat_types=None):
+        return self._register(self.texts, text, lambda handler: (handler, frozenset(chat_types) if chat_types else None))
+
+    def state(self, state):
+        return self._register(self.states, state, lambda handler: handler)
+
+    def callback(self, *prefixes):
+        def decorator(handler):
+            for prefix in prefixes:
+                self.callbacks.add(prefix, handler)
+            return handler
+        return decorator
+
+    def resolve_message(self, message): # обработчик для текстового сообщения или None
+        if message.text is None:
+            return None
+        handler = self._fixed_route(message)
+        if handler is not None:
+            return handler
+        return self._state_route(self.get_state(message.chat.id))
+
+    async def resolve_message_async(self, message): # то же в event loop: состояние может лежать в SQLite — читаем в потоке
+        if message.text is None:
+            return None
+        handler = self._fixed_route(message)
+        if handler is not None:
+            return handler
+        return self._state_route(await asyncio.to_thread(self.get_state, message.chat.id))
+
+    def resolve_callback(self, call):
+        return self.callbacks.match(call.data or "")
+
+    def install(self, bot, run=None): # TeleBot: регистрируем по одному обработчику на сообщения и callback
+        run = run or (lambda result: result) # Engine.run выполняет обработчики-генераторы (handlers.flow)
+
+        @bot.message_handler(content_types=['text'])
+        def route_message(message):
+            handler = self.resolve_message(message)
+            with _observed(handler, message.chat.id):
+                if handler is not None:
+                    run(handler(message))
+
+        @bot.callback_query_handler(func=lambda call: True)
+        def route_callback(call):
+            handler = self.resolve_callback(call)
+            with _observed(handler, call.message.chat.id if call.message else None):
+                if handler is not None:
+                    run(handler(call))
+
+    def install_async(self, bot, run): # то же для AsyncTeleBot; run — AsyncEngine.run
+        @bot.message_handler(content_types=['text'])
+        async def route_message(message):
+            handler = await self.resolve_message_async(message)
+            with _observed(handler, message.chat.id):
+                if handler is not None:
+                    await run(handler(message))
+
+        @bot.callback_query_handler(func=lambda call: True)
+        async def route_callback(call):
+            handler = self.resolve_callback(call)
+            with _observed(handler, call.message.chat.id if call.message else None):
+                if handler is not None:
+                    await run(handler(call))
+
+    def _fixed_route(self, message): # команда или кнопка; без обращения к состоянию пользователя
+        text = message.text
+        if text.startswith('/'):
+            handler = self.commands.get(util.extract_command(text))
+            if handler is not None:
+                return handler
+        route = self.texts.get(text)
+        if route is not None and (route[1] is None or message.chat.type in route[1]):
+            return route[0]
+        return None
+
+    def _state_route(self, state):
+        return self.states.get(state) if state is not None else None
+
+    def _register(self, table, key, make_route):
+        def decorator(handler):
+            if key in table:
+                raise ValueError(f"Обработчик для '{key}' уже зарегистрирован")
+            table[key] = make_route(handler)
+            return handler
+        return decorator
@@ -3,6 +3,7 @@ from telebot import types
 def main_keyboard(): # Reply клавиатура основного меню
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(types.KeyboardButton('Поиск фильма/сериала'),
+                 types.KeyboardButton('Популярное'),
                  types.KeyboardButton('История запросов'))
     return keyboard
 
@@ -1,16 +1,136 @@
-import os
-from dotenv import load_dotenv
+import asyncio
 import telebot
-from handlers.__init__ import register_handlers
+import config
+from handlers.__init__ import register_handlers, user_states
+from services.webhook import WebhookServer
+from services.sender import ScheduledBot, AsyncScheduledBot, get_scheduler
+from services import metrics
+from api.catalog import start_background_sync
+from services.title_index import start_index_warmup
+from services.chat_pool import get_chat_pool, get_async_chat_pool, update_key
+from handlers.common import BUSY_TEXT
+from services.logs import setup_logging, log_context
 
+setup_logging() # одна настройка логов для всех модулей: очередь, JSON, выборка частых событий
 
-load_dotenv()
-TOKEN = os.getenv("BOT_TOKEN")
-bot = telebot.TeleBot(TOKEN)
 
-register_handlers(bot)
+class PooledTeleBot(telebot.TeleBot): # обновления — в очереди чатов (services/chat_pool.py), а не в пул потоков TeleBot
+    def process_new_updates(self, updates): # Future на каждое обновление, None — отброшено
+        pool = get_chat_pool()
+        futures = []
+        for update in updates:
+            self.last_update_id = max(self.last_update_id, update.update_id) # polling запросит следующие сразу
+            key = update_key(update)
+            future = pool.submit(key, lambda update=update: self.process_update(update))
+            if future is None and pool.claim_busy_notice(key):
+                self.reply_busy(update)
+            futures.append(future)
+        return futures
+
+    def process_update(self, update): # в потоке рабочего очереди
+        with log_context(update_id=update.update_id):
+            telebot.TeleBot.process_new_updates(self, [update])
+
+    def reply_busy(self, update): # через очередь отправки, не задерживая прием обновлений
+        if update.callback_query is not None:
+            call = lambda: self.answer_callback_query(update.callback_query.id, BUSY_TEXT)
+        elif update.message is not None:
+            call = lambda: self.send_message(update.message.chat.id, BUSY_TEXT)
+        else:
+            return
+        if config.SENDER_ENABLED:
+            get_scheduler().submit(update_key(update), call)
+        else:
+            call()
+
+
+if config.BOT_ENGINE == 'async': # один event loop вместо пула потоков
+    from telebot.async_telebot import AsyncTeleBot
+    from handlers.async_handlers import register_async_handlers
+    from api.poiskkino_async import get_async_client
+
+    class PooledAsyncTeleBot(AsyncTeleBot): # то же для AsyncTeleBot: рабочие очередей — задачи event loop
+        reply_bot = None # бот обработчиков, с очередью отправки
+
+        async def process_new_updates(self, updates):
+            pool = get_async_chat_pool()
+            futures = []
+            for update in updates:
+                key = update_key(update)
+                future = pool.submit(key, lambda update=update: self.process_update(update))
+                if future is None and pool.claim_busy_notice(key):
+                    self.reply_busy(update)
+                futures.append(future)
+            return futures
+
+        async def process_update(self, update):
+            with log_context(update_id=update.update_id):
+                await AsyncTeleBot.process_new_updates(self, [update])
+
+        def reply_busy(self, update):
+            if update.callback_query is not None:
+                reply = self.reply_bot.answer_callback_query(update.callback_query.id, BUSY_TEXT)
+            elif update.message is not None:
+                reply = self.reply_bot.send_message(update.message.chat.id, BUSY_TEXT)
+            else:
+                return
+            task = asyncio.ensure_future(reply)
+            _busy_replies.add(task) # ссылка, пока ответ отправляется
+            task.add_done_callback(_busy_replies.discard)
+
+    _busy_replies = set()
+    bot = PooledAsyncTeleBot(config.BOT_TOKEN) if config.CHAT_POOL_ENABLED else AsyncTeleBot(config.BOT_TOKEN)
+    handler_bot = AsyncScheduledBot(bot, get_scheduler()) if config.SENDER_ENABLED else bot
+    bot.reply_bot = handler_bot
+    register_async_handlers(handler_bot, user_states)
+elif config.CHAT_POOL_ENABLED: # обработчики выполняют рабочие очередей чатов, WebhookServer и polling только принимают
+    bot = PooledTeleBot(config.BOT_TOKEN, threaded=False)
+    register_handlers(ScheduledBot(bot, get_scheduler()) if config.SENDER_ENABLED else bot)
+else:
+    # в режиме webhook обновления уже разбирают рабочие потоки WebhookServer
+    bot = telebot.TeleBot(config.BOT_TOKEN, threaded=config.BOT_INGESTION != 'webhook')
+    register_handlers(ScheduledBot(bot, get_scheduler()) if config.SENDER_ENABLED else bot) # обработчики отправляют через общую очередь
+    if bot.threaded: # очередь обновлений перед пулом потоков TeleBot (polling)
+        metrics.collector("telebot", lambda: {"queue_depth": bot.worker_pool.tasks.qsize()})
+
+
+def run_webhook():
+    server = WebhookServer(bot.process_new_updates)
+    if config.WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=config.WEBHOOK_URL + config.WEBHOOK_PATH, secret_token=config.WEBHOOK_SECRET or None)
+    server.serve_forever()
+
+
+async def run_async_polling():
+    try:
+        await bot.polling(non_stop=True)
+    finally:
+        await get_async_client().close()
+
+
+async def run_async_webhook():
+    loop = asyncio.get_running_loop()
+    server = WebhookServer(lambda updates: asyncio.run_coroutine_threadsafe(bot.process_new_updates(updates), loop))
+    if config.WEBHOOK_URL:
+        await bot.remove_webhook()
+        await bot.set_webhook(url=config.WEBHOOK_URL + config.WEBHOOK_PATH, secret_token=config.WEBHOOK_SECRET or None)
+    server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        await get_async_client().close()
 
 
 if __name__ == '__main__':
-    print("Бот запущен...")
-    bot.polling(none_stop=True)
\ No newline at end of file
+    print(f"Бот запущен ({config.BOT_ENGINE}, {config.BOT_INGESTION})...")
+    start_background_sync() # догрузка локального каталога, если задан CATALOG_DB_PATH
+    metrics.start_metrics_server() # /metrics и /traces на METRICS_HOST:METRICS_PORT
+    start_index_warmup() # популярные фильмы в индекс inline-подсказок
+    if config.BOT_ENGINE == 'async':
+        asyncio.run(run_async_webhook() if config.BOT_INGESTION == 'webhook' else run_async_polling())
+    elif config.BOT_INGESTION == 'webhook':
+        run_webhook()
+    else:
+        bot.polling(none_stop=True)
\ No newline at end of file
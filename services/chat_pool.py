@@ -0,0 +1,225 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Очереди обновлений по чатам перед обработчиками. У каждого чата своя очередь: его обновления обрабатываются
+# по порядку и не больше per_chat одновременно (1 — строго по одному, без гонок за состояние диалога).
+# Рабочие берут чаты по кругу: чат, у которого в очереди еще есть обновления, встает в конец, поэтому
+# пользователь, который часто нажимает кнопки, не занимает все потоки, пока остальные ждут.
+# Если очередь чата длиннее max_chat_queue или всего в очередях больше max_queue, обновление отбрасывается,
+# а пользователь получает ответ "бот занят" (не чаще раза в BUSY_INTERVAL секунд на чат).
+
+BUSY_INTERVAL = 10.0
+
+QUEUE_WAIT_SECONDS = metrics.histogram("chat_pool_queue_wait_seconds", "Ожидание обновления в очереди чата до обработчика")
+SHED = metrics.counter("chat_pool_shed_total", "Отброшенные обновления: chat — длинная очередь чата, total — общая", ("reason",))
+
+
+def update_key(update): # очередь, в которую попадает обновление
+    if update.message is not None:
+        return update.message.chat.id
+    if update.edited_message is not None:
+        return update.edited_message.chat.id
+    if update.callback_query is not None:
+        message = update.callback_query.message
+        return message.chat.id if message is not None else update.callback_query.from_user.id
+    if update.inline_query is not None: # подсказки — отдельно от диалога того же пользователя
+        return ("inline", update.inline_query.from_user.id)
+    return "other" # остальное — общая очередь
+
+
+class _Chat:
+    __slots__ = ("jobs", "running", "ready")
+
+    def __init__(self):
+        self.jobs = deque() # (time.monotonic() постановки, fn, future)
+        self.running = 0
+        self.ready = False # стоит в очереди рабочих
+
+
+class ChatWorkerPool:
+    def __init__(self, workers=8, per_chat=1, max_chat_queue=5, max_queue=1000):
+        self.workers_count = workers
+        self.per_chat = per_chat
+        self.max_chat_queue = max_chat_queue
+        self.max_queue = max_queue
+        self._chats = {} # key -> _Chat, только чаты с очередью или обработчиком в работе
+        self._ready = self._make_ready()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._busy_notified = {} # key -> time.monotonic() последнего ответа "бот занят"
+        self.queued = 0
+        self.processed = 0
+        self.shed = 0
+
+    def submit(self, key, fn): # Future с результатом fn() или None, если обновление отброшено
+        with self._lock:
+            chat = self._chats.get(key)
+            reason = None
+            if chat is not None and len(chat.jobs) >= self.max_chat_queue:
+                reason = "chat"
+            elif self.queued >= self.max_queue:
+                reason = "total"
+            if reason is not None:
+                self.shed += 1
+                SHED.labels(reason).inc()
+                return None
+            if chat is None:
+                chat = self._chats[key] = _Chat()
+            future = self._make_future()
+            chat.jobs.append((time.monotonic(), fn, future))
+            self.queued += 1
+            self._schedule(key, chat)
+            self._ensure_started()
+        return future
+
+    def claim_busy_notice(self, key) -> bool: # True — пора ответить "бот занят"
+        now = time.monotonic()
+        with self._lock:
+            if now - self._busy_notified.get(key, 0.0) < BUSY_INTERVAL:
+                return False
+            if len(self._busy_notified) > 10_000:
+                self._busy_notified = {k: t for k, t in self._busy_notified.items() if now - t < BUSY_INTERVAL}
+            self._busy_notified[key] = now
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            depths = [len(chat.jobs) for chat in self._chats.values()]
+            return {
+                "queue_depth": self.queued,
+                "chats": len(self._chats),
+                "running": sum(chat.running for chat in self._chats.values()),
+                "max_chat_depth": max(depths, default=0),
+                "processed": self.processed,
+                "shed": self.shed,
+            }
+
+    def stop(self, timeout=10): # дорабатываем очереди
+        for _ in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def _make_ready(self):
+        return queue.Queue()
+
+    def _make_future(self):
+        return Future()
+
+    def _ensure_started(self): # вызывается под self._lock
+        if self._workers:
+            return
+        for i in range(self.workers_count):
+            worker = threading.Thread(target=self._work, name=f"chat-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _schedule(self, key, chat): # вызывается под self._lock; чат в конец очереди рабочих
+        if chat.jobs and not chat.ready and chat.running < self.per_chat:
+            chat.ready = True
+            self._ready.put_nowait(key)
+
+    def _take(self, key): # вызывается под self._lock; следующее обновление чата
+        chat = self._chats[key]
+        chat.ready = False
+        queued_at, fn, future = chat.jobs.popleft()
+        chat.running += 1
+        self.queued -= 1
+        self._schedule(key, chat) # еще одно обновление того же чата, если per_chat > 1
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - queued_at)
+        return fn, future
+
+    def _done(self, key): # вызывается под self._lock
+        chat = self._chats[key]
+        chat.running -= 1
+        self.processed += 1
+        if not chat.jobs and not chat.running:
+            del self._chats[key]
+        else:
+            self._schedule(key, chat)
+
+    def _work(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                break
+            with self._lock:
+                fn, future = self._take(key)
+            try:
+                future.set_result(fn())
+            except Exception as e: # ошибка уже посчитана в метриках обработчика
+                logger.exception("Ошибка обработки обновления (очередь %s): %s", key, e)
+                future.set_result(None)
+            finally:
+                with self._lock:
+                    self._done(key)
+
+
+class AsyncChatWorkerPool(ChatWorkerPool): # для async режима: рабочие — задачи event loop, fn — корутина
+    def stop(self, timeout=10):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def _make_ready(self):
+        return asyncio.Queue()
+
+    def _make_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    def _ensure_started(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.workers_count)]
+
+    async def _work(self):
+        while True:
+            key = await self._ready.get()
+            with self._lock: # stats() читает очереди из потока сервера метрик
+                fn, future = self._take(key)
+            try:
+                result = await fn()
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                logger.exception("Ошибка обработки обновления (очередь %s): %s", key, e)
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                with self._lock:
+                    self._done(key)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_chat_pool() -> ChatWorkerPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ChatWorkerPool(workers=config.CHAT_POOL_WORKERS, per_chat=config.CHAT_POOL_PER_CHAT,
+                                       max_chat_queue=config.CHAT_POOL_MAX_CHAT_QUEUE, max_queue=config.CHAT_POOL_MAX_QUEUE)
+                metrics.collector("chat_pool", _pool.stats)
+    return _pool
+
+_async_pool = None
+
+def get_async_chat_pool() -> AsyncChatWorkerPool:
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncChatWorkerPool(workers=config.CHAT_POOL_WORKERS, per_chat=config.CHAT_POOL_PER_CHAT,
+                                          max_chat_queue=config.CHAT_POOL_MAX_CHAT_QUEUE, max_queue=config.CHAT_POOL_MAX_QUEUE)
+        metrics.collector("chat_pool", _async_pool.stats)
+    return _async_pool
@@ -0,0 +1,106 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Отложенный вызов "по последнему": пока по ключу (пользователю) приходят новые вызовы,
+# предыдущие заменяются и не выполняются. Выполняется только тот, после которого delay секунд было тихо.
+# Вызов, уже переданный в пул Debouncer, отменить нельзя: перед дорогой работой (запросом к API) он сам
+# проверяет is_current() и, если пользователь успел набрать новый запрос, ничего не делает.
+
+
+class Debouncer: # для потоков: один поток ждет сроков, вызовы выполняются в пуле
+    def __init__(self, delay, workers=4):
+        self.delay = delay
+        self._pending = {} # key -> (срок, seq, fn)
+        self._latest = {} # key -> seq последнего submit
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="debounce")
+        self._thread = None
+        self.submitted = 0
+        self.superseded = 0
+        self.executed = 0
+
+    def submit(self, key, fn): # fn(seq) выполнится через delay, если не придет новый вызов с тем же key
+        with self._cond:
+            self._seq += 1
+            self.submitted += 1
+            if key in self._pending:
+                self.superseded += 1
+            self._pending[key] = (time.monotonic() + self.delay, self._seq, fn)
+            self._latest[key] = self._seq
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="debouncer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return self._seq
+
+    def is_current(self, key, seq) -> bool: # False — пользователь уже отправил более новый запрос
+        with self._cond:
+            return self._latest.get(key) == seq
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending": len(self._pending), "submitted": self.submitted,
+                    "superseded": self.superseded, "executed": self.executed}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [(key, entry) for key, entry in self._pending.items() if entry[0] <= now]
+                if not due:
+                    self._cond.wait(min(entry[0] for entry in self._pending.values()) - now if self._pending else None)
+                    continue
+                for key, _ in due:
+                    del self._pending[key]
+                self.executed += len(due)
+            for key, (_, seq, fn) in due:
+                self._executor.submit(self._execute, key, seq, fn)
+
+    def _execute(self, key, seq, fn):
+        try:
+            fn(seq)
+        except Exception as e:
+            logger.exception("Ошибка отложенного вызова для %s: %s", key, e)
+        finally:
+            with self._cond:
+                if self._latest.get(key) == seq: # новых вызовов не было — ключ больше не нужен
+                    del self._latest[key]
+
+
+class AsyncDebouncer: # для event loop: новый вызов отменяет задачу предыдущего, даже если она уже выполняется
+    def __init__(self, delay):
+        self.delay = delay
+        self._tasks = {} # key -> Task
+        self.submitted = 0
+        self.superseded = 0
+        self.executed = 0
+
+    def submit(self, key, coro_fn):
+        self.submitted += 1
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            task.cancel()
+            self.superseded += 1
+        task = self._tasks[key] = asyncio.ensure_future(self._later(coro_fn))
+        task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        return task
+
+    def stats(self) -> dict:
+        return {"pending": len(self._tasks), "submitted": self.submitted,
+                "superseded": self.superseded, "executed": self.executed}
+
+    async def _later(self, coro_fn):
+        await asyncio.sleep(self.delay)
+        self.executed += 1
+        try:
+            await coro_fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Ошибка отложенного вызова: %s", e)
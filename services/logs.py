@@ -0,0 +1,156 @@
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextlib
+import contextvars
+import logging.handlers
+
+import config
+from services import metrics
+
+# Единая настройка логов: setup_logging() вызывается один раз при запуске (main.py, CLI модулей).
+# Потоки обработчиков только кладут запись в очередь (QueueHandler), в stderr ее пишет отдельный поток
+# QueueListener: медленный терминал или диск не задерживает ответы. Если очередь переполнена, запись ниже
+# WARNING отбрасывается и считается в log_records_dropped_total, а предупреждение или ошибка ждет места
+# в очереди до block_seconds и, если его так и нет, пишется прямо из потока обработчика.
+# Сообщения — в %-стиле: строка собирается, только если уровень включен и запись не отброшена выборкой.
+# В формате json к записи добавляются chat_id, update_id и handler обновления, в котором она написана
+# (log_context, contextvar — как трассы в metrics). Частые события на каждое сообщение пишутся с extra=SAMPLED:
+# из них остается доля LOG_SAMPLE чатов, зато все события выбранного чата. Предупреждения и ошибки не отбрасываются.
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ("chat_id", "update_id", "handler")
+SAMPLED = {"sampled": True} # extra для частых событий
+
+DROPPED = metrics.counter("log_records_dropped_total", "Отброшенные записи лога: queue — очередь полна, sampled — выборка", ("reason",))
+
+_context = contextvars.ContextVar("log_context", default={})
+
+
+@contextlib.contextmanager
+def log_context(**fields): # поля добавляются ко всем записям внутри блока
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def clip(text, limit=None) -> str: # тело ответа API для лога и сообщения: не длиннее limit символов
+    limit = config.LOG_BODY_LIMIT if limit is None else limit
+    text = text or ""
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [+{len(text) - limit} симв.]"
+
+
+class ContextFilter(logging.Filter): # в потоке обработчика: поля контекста и выборка частых событий
+    def __init__(self, sample=1.0):
+        super().__init__()
+        self.sample = sample
+
+    def filter(self, record):
+        context = _context.get()
+        for field, value in context.items():
+            setattr(record, field, value)
+        if self.sample < 1.0 and getattr(record, "sampled", False) and record.levelno < logging.WARNING:
+            if not self.keep(context.get("chat_id")):
+                DROPPED.labels("sampled").inc()
+                return False
+        return True
+
+    def keep(self, chat_id) -> bool: # один и тот же чат либо всегда в выборке, либо нет
+        if chat_id is None:
+            return random.random() < self.sample
+        return (hash(chat_id) * 2654435761) % 2**32 < self.sample * 2**32
+
+
+class QueuedHandler(logging.handlers.QueueHandler):
+    _formatter = logging.Formatter()
+    block_seconds = 0.1 # сколько предупреждение ждет места в полной очереди
+
+    def __init__(self, queue, fallback=None):
+        super().__init__(queue)
+        self.fallback = fallback # куда писать предупреждения и ошибки, если очередь так и не освободилась
+
+    def prepare(self, record): # только подставить аргументы; форматирование строки лога — в потоке записи
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                DROPPED.labels("queue").inc()
+                return
+        try:
+            self.queue.put(record, timeout=self.block_seconds)
+        except queue.Full:
+            if self.fallback is None:
+                DROPPED.labels("queue").inc()
+            else:
+                self.fallback.handle(record)
+
+
+class JsonFormatter(logging.Formatter): # одна запись — одна строка JSON
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name, "msg": record.getMessage()}
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def make_formatter(fmt) -> logging.Formatter:
+    if fmt == "json":
+        return JsonFormatter()
+    if fmt == "text":
+        return logging.Formatter(TEXT_FORMAT)
+    raise ValueError(f"Неизвестный формат логов: {fmt}")
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+def setup_logging(level=None, fmt=None, stream=None) -> logging.handlers.QueueListener: # повторный вызов ничего не меняет
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        output = logging.StreamHandler(stream) # stderr по умолчанию
+        output.setFormatter(make_formatter(fmt or config.LOG_FORMAT))
+        handler = QueuedHandler(queue.Queue(config.LOG_QUEUE_SIZE), fallback=output)
+        handler.addFilter(ContextFilter(config.LOG_SAMPLE))
+        root = logging.getLogger()
+        for previous in root.handlers[:]:
+            root.removeHandler(previous)
+        root.addHandler(handler)
+        root.setLevel(level or config.LOG_LEVEL)
+        _listener = logging.handlers.QueueListener(handler.queue, output)
+        _listener.start()
+        atexit.register(stop_logging) # дописываем очередь при выходе
+        metrics.collector("log", lambda: {"queue_depth": handler.queue.qsize()})
+        return _listener
+
+
+def stop_logging(): # дописать очередь и остановить поток записи; setup_logging() после этого настраивает заново
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,329 @@
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Метрики процесса в формате Prometheus: счетчики, gauge и гистограммы задержек по этапам обработки
+# (PoiskKino, отправка в Telegram, SQLite, очереди). Для части обновлений (METRICS_TRACE_SAMPLE)
+# пишется трасса: какие этапы прошло обновление и сколько занял каждый.
+#
+#   curl http://127.0.0.1:9108/metrics
+#   curl http://127.0.0.1:9108/traces
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {} # значения меток -> значение
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name}: ожидаются метки {self.label_names}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_labels(self.label_names, values)} {_number(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1): # для метрики без меток
+        self.labels().inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.bounds = tuple(sorted(buckets)) + (float("inf"),)
+
+    def _new_child(self):
+        return _Buckets(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines, cumulative = [], 0
+        for bound, bucket in zip(self.bounds, counts):
+            cumulative += bucket
+            le = 'le="%s"' % _number(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+        labels = _labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {} # префикс -> функция, возвращающая dict чисел (stats() компонентов)
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def collector(self, prefix, stats): # stats() вызывается при каждом чтении /metrics
+        with self._lock:
+            self._collectors[prefix] = stats
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, stats in collectors:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                logger.warning("Не удалось собрать метрики %s: %s", prefix, e)
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)): # bool тоже: 1/0
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {_number(int(value) if isinstance(value, bool) else value)}")
+        return "\n".join(lines) + "\n"
+
+    def _get(self, cls, name, help, labels, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, *args)
+            elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+                raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом или метками")
+        return metric
+
+
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+collector = registry.collector
+
+STAGE_SECONDS = histogram("bot_stage_seconds", "Время этапа обработки обновления", ("handler", "stage"))
+
+
+# Трассы: контекст текущего обновления хранится в contextvar — в потоке обработчика
+# или в задаче event loop, поэтому span() внутри обработчика знает, к какому обновлению относится.
+
+class _Trace:
+    __slots__ = ("handler", "chat_id", "started", "spans")
+
+    def __init__(self, handler, chat_id, sampled):
+        self.handler = handler
+        self.chat_id = chat_id
+        self.started = time.perf_counter()
+        self.spans = [] if sampled else None # (этап, начало от старта обновления, длительность), только для выбранных
+
+
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+_traces = deque(maxlen=config.METRICS_TRACE_KEEP) # последние выбранные трассы для /traces
+_traces_lock = threading.Lock()
+
+
+class span: # with span("api"): ... — время этапа в bot_stage_seconds и в трассе обновления
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        finished = time.perf_counter()
+        trace = _trace.get()
+        STAGE_SECONDS.labels(trace.handler if trace else "background", self.stage).observe(finished - self.started)
+        if trace is not None and trace.spans is not None:
+            trace.spans.append((self.stage, self.started - trace.started, finished - self.started))
+        return False
+
+
+def start_trace(handler, chat_id=None): # вызывается Router перед обработчиком; возвращает токен для finish_trace
+    sampled = config.METRICS_TRACE_SAMPLE > 0 and random.random() < config.METRICS_TRACE_SAMPLE
+    return _trace.set(_Trace(handler, chat_id, sampled))
+
+
+def finish_trace(token, error=None):
+    trace = _trace.get()
+    _trace.reset(token)
+    if trace is None or trace.spans is None:
+        return
+    record = {
+        "chat_id": trace.chat_id,
+        "handler": trace.handler,
+        "duration_ms": round((time.perf_counter() - trace.started) * 1000, 3),
+        "error": type(error).__name__ if error is not None else None,
+        "spans": [{"stage": stage, "start_ms": round(start * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                  for stage, start, duration in trace.spans],
+    }
+    with _traces_lock:
+        _traces.append(record)
+    if logger.isEnabledFor(logging.DEBUG): # json.dumps — только если трассы пишутся в лог
+        logger.debug("Трасса обновления: %s", json.dumps(record, ensure_ascii=False))
+
+
+def recent_traces() -> list:
+    with _traces_lock:
+        return list(_traces)
+
+
+class MetricsServer: # /metrics — Prometheus, /traces — последние трассы в JSON
+    def __init__(self, host=None, port=None):
+        self.host = host or config.METRICS_HOST
+        self.port = config.METRICS_PORT if port is None else port
+        self._server = None
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else (self.host, self.port)
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Метрики доступны на http://%s:%s/metrics", self.address[0], self.address[1])
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _make_handler(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    return self._reply(200, registry.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+                if self.path == "/traces":
+                    return self._reply(200, json.dumps(recent_traces(), ensure_ascii=False).encode("utf-8"), "application/json")
+                self._reply(404, b"", "text/plain")
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def start_metrics_server(): # None, если METRICS_PORT = 0
+    if not config.METRICS_PORT:
+        return None
+    try:
+        return MetricsServer().start()
+    except OSError as e:
+        logger.error("Не удалось запустить сервер метрик на %s:%s: %s", config.METRICS_HOST, config.METRICS_PORT, e)
+        return None
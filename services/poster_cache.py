@@ -0,0 +1,100 @@
+import logging
+import datetime
+import threading
+
+import config
+from services import metrics
+from database import PosterFile
+
+logger = logging.getLogger(__name__)
+
+
+class PosterCache:
+    # id фильма -> file_id фото в Telegram. Таблица poster_file целиком читается в память при старте
+    # (load() из build_router: get() вызывается и из event loop), дальше get() не ходит в базу; put/invalidate пишут сразу.
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._file_ids = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.invalidated = 0
+
+    def get(self, movie_id):
+        if not self.enabled or movie_id is None:
+            return None
+        with self._lock:
+            file_id = self._loaded().get(movie_id)
+            if file_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return file_id
+
+    def put(self, movie_id, file_id):
+        if not self.enabled or movie_id is None or not file_id:
+            return
+        with self._lock:
+            if self._loaded().get(movie_id) == file_id:
+                return
+            self._file_ids[movie_id] = file_id
+            self.stored += 1
+        try:
+            PosterFile.replace(movie_id=movie_id, file_id=file_id, updated=datetime.datetime.now()).execute()
+        except Exception as e:
+            logger.error("Ошибка при сохранении file_id постера фильма %s: %s", movie_id, e)
+
+    def invalidate(self, movie_id): # Telegram отверг file_id — в следующий раз отправим по URL
+        with self._lock:
+            if self._loaded().pop(movie_id, None) is None:
+                return
+            self.invalidated += 1
+        logger.warning("file_id постера фильма %s устарел, удаляем из кэша", movie_id)
+        try:
+            PosterFile.delete().where(PosterFile.movie_id == movie_id).execute()
+        except Exception as e:
+            logger.error("Ошибка при удалении file_id постера фильма %s: %s", movie_id, e)
+
+    def load(self): # чтение таблицы до первого обновления, а не внутри обработчика
+        if not self.enabled:
+            return
+        with self._lock:
+            self._loaded()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = len(self._file_ids or {})
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stored": self.stored,
+            "invalidated": self.invalidated,
+            "entries": entries,
+        }
+
+    def _loaded(self) -> dict: # вызывается под self._lock
+        if self._file_ids is None:
+            self._file_ids = {}
+            try:
+                for movie_id, file_id in PosterFile.select(PosterFile.movie_id, PosterFile.file_id).tuples():
+                    self._file_ids[movie_id] = file_id
+            except Exception as e:
+                logger.error("Ошибка при загрузке кэша постеров: %s", e)
+            logger.info("Загружено %s file_id постеров", len(self._file_ids))
+        return self._file_ids
+
+
+_poster_cache = None
+_poster_cache_lock = threading.Lock()
+
+def get_poster_cache() -> PosterCache:
+    global _poster_cache
+    if _poster_cache is None:
+        with _poster_cache_lock:
+            if _poster_cache is None:
+                _poster_cache = PosterCache(enabled=config.POSTER_CACHE_ENABLED)
+                metrics.collector("poster_cache", _poster_cache.stats)
+    return _poster_cache
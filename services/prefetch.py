@@ -0,0 +1,153 @@
+import abc
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from services import metrics
+from services.logs import SAMPLED
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetcherBase(abc.ABC): # общий учет предзагрузок; как грузить страницу (поток или задача loop) — в _submit
+    def __init__(self, depth=1, ttl=120):
+        self.depth = depth
+        self.ttl = ttl
+        self._store = {} # (chat_id, kind, value, page) -> (expires_at, Future)
+        self._positions = {} # chat_id -> (expires_at, (kind, value, page)), последняя показанная страница
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, chat_id, kind, value, page, total_pages, fetch): # после показа страницы page грузим следующие
+        if self.depth <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._positions[chat_id] = (now + self.ttl, (kind, value, page))
+            self._purge(now)
+            for next_page in range(page + 1, min(page + self.depth, total_pages) + 1):
+                key = (chat_id, kind, value, next_page)
+                if key in self._store:
+                    continue
+                future = self._submit(fetch, next_page)
+                self._store[key] = (now + self.ttl, future)
+                logger.info("Предзагрузка страницы %s (%s %s) для chat_id %s", next_page, kind, value, chat_id, extra=SAMPLED)
+
+    def navigate(self, chat_id, kind, value, page): # вызывается при переходе по страницам
+        with self._lock:
+            entry = self._positions.get(chat_id)
+        if entry is None or entry[0] < time.time(): # позиция устарела вместе с ее страницами
+            return
+        last_kind, last_value, last_page = entry[1]
+        if (last_kind, last_value) != (kind, value) or page < last_page:
+            self.cancel(chat_id)
+
+    def cancel(self, chat_id): # отменяем предзагрузку пользователя: ушел назад или в меню
+        with self._lock:
+            self._positions.pop(chat_id, None)
+            keys = [key for key in self._store if key[0] == chat_id]
+            for key in keys:
+                _, future = self._store.pop(key)
+                future.cancel() # уже запущенный запрос доработает, но результат будет отброшен
+        if keys:
+            logger.info("Предзагрузка отменена для chat_id %s (%s стр.)", chat_id, len(keys), extra=SAMPLED)
+
+    @abc.abstractmethod
+    def _submit(self, fetch, page):
+        ...
+
+    def _pop(self, chat_id, kind, value, page):
+        with self._lock:
+            entry = self._store.pop((chat_id, kind, value, page), None)
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return None
+        return entry[1]
+
+    def _failed(self, kind, value, page, error):
+        logger.warning("Предзагрузка страницы %s (%s %s) не удалась: %s", page, kind, value, error)
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending, positions = len(self._store), len(self._positions)
+        taken = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "pending": pending, "positions": positions,
+                "hit_ratio": round(self.hits / taken, 4) if taken else 0.0}
+
+    def _purge(self, now): # вызывается под self._lock
+        for key in [key for key, (expires_at, _) in self._store.items() if expires_at < now]:
+            _, future = self._store.pop(key)
+            future.cancel()
+        for chat_id in [chat_id for chat_id, (expires_at, _) in self._positions.items() if expires_at < now]:
+            del self._positions[chat_id] # пользователь давно не листал — позиция больше не нужна
+
+
+class PagePrefetcher(PrefetcherBase): # fetch — обычная функция, загрузка в пуле потоков
+    def __init__(self, depth=1, max_workers=2, ttl=120):
+        super().__init__(depth=depth, ttl=ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def _submit(self, fetch, page):
+        return self._executor.submit(fetch, page)
+
+    def take(self, chat_id, kind, value, page): # готовая (или загружающаяся) страница, иначе None
+        future = self._pop(chat_id, kind, value, page)
+        if future is None:
+            return None
+        try:
+            result = future.result()
+        except Exception as e: # в т.ч. CancelledError
+            return self._failed(kind, value, page, e)
+        self.hits += 1
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncPagePrefetcher(PrefetcherBase): # для async режима: fetch — корутина, загрузка в задачах event loop
+    def _submit(self, fetch, page):
+        return asyncio.ensure_future(fetch(page))
+
+    async def take(self, chat_id, kind, value, page):
+        future = self._pop(chat_id, kind, value, page)
+        if future is None:
+            return None
+        try:
+            result = await future
+        except (Exception, asyncio.CancelledError) as e:
+            return self._failed(kind, value, page, e)
+        self.hits += 1
+        return result
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher() -> PagePrefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = PagePrefetcher(
+                    depth=config.PREFETCH_DEPTH,
+                    max_workers=config.PREFETCH_WORKERS,
+                    ttl=config.PREFETCH_TTL,
+                )
+                metrics.collector("prefetch", _prefetcher.stats)
+    return _prefetcher
+
+_async_prefetcher = None
+
+def get_async_prefetcher() -> AsyncPagePrefetcher:
+    global _async_prefetcher
+    if _async_prefetcher is None:
+        _async_prefetcher = AsyncPagePrefetcher(depth=config.PREFETCH_DEPTH, ttl=config.PREFETCH_TTL)
+        metrics.collector("prefetch", _async_prefetcher.stats)
+    return _async_prefetcher
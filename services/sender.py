@@ -0,0 +1,369 @@
+import time
+import asyncio
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_SECONDS = metrics.histogram("telegram_queue_wait_seconds", "Ожидание в очереди отправки до первой попытки", ("method",))
+REQUEST_SECONDS = metrics.histogram("telegram_request_seconds", "Время запроса к Telegram", ("method",))
+REQUESTS = metrics.counter("telegram_requests_total", "Запросы к Telegram по результату", ("method", "outcome"))
+
+# Все исходящие вызовы Telegram идут через одну очередь: ограничение скорости на чат и на бота,
+# интерактивные ответы раньше страниц результатов, порядок сообщений внутри чата сохраняется,
+# на 429 ждем retry_after и повторяем. Лимит чата считает сообщения, которые видит пользователь: альбом —
+# одно сообщение, правки и удаления не считаются. В общий лимит бота идет каждое фото альбома и каждый вызов.
+
+INTERACTIVE = 0 # ответ на действие пользователя
+BULK = 1 # страницы результатов, альбомы
+
+_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+# методы, которые считаются отправкой в чат; остальное вызывается у бота напрямую
+SCHEDULED_METHODS = {
+    "send_message", "send_photo", "send_media_group", "send_chat_action",
+    "edit_message_text", "edit_message_caption", "edit_message_media", "edit_message_reply_markup",
+    "delete_message",
+}
+CHAT_FREE_METHODS = { # не новое сообщение в чате: в лимит чата не входят
+    "edit_message_text", "edit_message_caption", "edit_message_media", "edit_message_reply_markup",
+    "delete_message",
+}
+
+
+@contextlib.contextmanager
+def bulk_priority(): # отправки внутри блока уступают интерактивным ответам
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def delay(self, now) -> float: # сколько ждать до следующего токена; 0 — можно отправлять
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, cost=1): # может уйти в минус — тогда следующая отправка подождет дольше
+        self.tokens -= cost
+
+    def full(self, now) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Job:
+    __slots__ = ("future", "call", "priority", "seq", "cost", "chat_cost", "attempts", "method", "queued")
+
+    def __init__(self, call, priority, seq, cost, chat_cost, method):
+        self.future = Future()
+        self.call = call
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost # токены общего лимита: альбом — по фото
+        self.chat_cost = chat_cost # токены лимита чата: альбом — одно сообщение, правка — 0
+        self.attempts = 0
+        self.method = method # для метрик
+        self.queued = time.monotonic()
+
+
+class _Chat:
+    __slots__ = ("jobs", "bucket", "busy", "not_before")
+
+    def __init__(self, bucket):
+        self.jobs = deque()
+        self.bucket = bucket
+        self.busy = False # задача этого чата уже выполняется — следующую не берем
+        self.not_before = 0.0 # до этого момента чат под flood control
+
+
+def retry_after(error): # секунды из ответа 429, иначе None
+    if getattr(error, "error_code", None) != 429:
+        return None
+    parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+    return float(parameters.get("retry_after", 1))
+
+
+class SendPermit:
+    # Очередь разрешила запрос (лимиты учтены, чат занят), но выполняет его вызывающий — например, event loop.
+    # Исход обязательно сообщить: succeeded() или failed(error); до этого следующие сообщения чата ждут.
+    def __init__(self, scheduler, chat_id, job, started):
+        self._scheduler, self._chat_id, self._job, self._started = scheduler, chat_id, job, started
+
+    def succeeded(self):
+        self._scheduler._finish(self._chat_id, self._job, self._started)
+
+    def failed(self, error) -> Future | None: # на 429 — Future разрешения на повтор, иначе None
+        return self._scheduler._finish(self._chat_id, self._job, self._started, error=error)
+
+
+class SendScheduler:
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=5, group_rate=20 / 60,
+                 workers=8, max_retries=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chats = {} # chat_id -> _Chat
+        self._pending = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, name=f"sender-{i}", daemon=True) for i in range(workers)]
+        self._started = False
+        self._stopped = False
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def submit(self, chat_id, call, priority=None, cost=1, method="call", chat_cost=1) -> Future: # call() выполнится в рабочем потоке; None — permit()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Очередь отправки остановлена")
+            if not self._started:
+                self._started = True
+                for worker in self._workers:
+                    worker.start()
+            self._seq += 1
+            job = _Job(call, _priority.get() if priority is None else priority, self._seq, cost, chat_cost, method)
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(self._bucket_for(chat_id))
+            chat.jobs.append(job)
+            self._pending += 1
+            self._cond.notify()
+        return job.future
+
+    def permit(self, chat_id, priority=None, cost=1, method="call", chat_cost=1) -> Future: # Future с SendPermit, когда очередь дойдет
+        return self.submit(chat_id, None, priority, cost, method, chat_cost)
+
+    def call(self, chat_id, call, priority=None, cost=1, method="call", chat_cost=1): # синхронная отправка: ждем результат
+        return self.submit(chat_id, call, priority, cost, method, chat_cost).result()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": self._pending,
+                "chats": len(self._chats),
+                "sent": self.sent,
+                "retried": self.retried,
+                "failed": self.failed,
+            }
+
+    def stop(self, timeout=10):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join(timeout)
+
+    def _bucket_for(self, chat_id):
+        # в группах Telegram разрешает около 20 сообщений в минуту, в личных — около одного в секунду
+        rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+        return TokenBucket(rate, self.chat_burst if rate == self.chat_rate else 1)
+
+    def _next(self, now): # (chat_id, job) или (None, сколько ждать); вызывается под self._cond
+        if self._pending == 0:
+            return None, None
+        global_delay = self.global_bucket.delay(now)
+        if global_delay:
+            return None, global_delay
+        best, best_key, wait = None, None, None
+        for chat_id, chat in self._chats.items():
+            if chat.busy or not chat.jobs:
+                continue
+            bucket_delay = chat.bucket.delay(now)
+            delay = max(chat.not_before - now, bucket_delay if chat.jobs[0].chat_cost else 0.0) # правку лимит чата не держит
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            key = (min(job.priority for job in chat.jobs), chat.jobs[0].seq) # интерактивные вперед, затем по очереди поступления
+            if best_key is None or key < best_key:
+                best, best_key = chat_id, key
+        if best is None:
+            return None, wait
+        chat = self._chats[best]
+        job = chat.jobs.popleft()
+        chat.busy = True
+        chat.bucket.take(job.chat_cost)
+        self.global_bucket.take(job.cost)
+        self._pending -= 1
+        return best, job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped and self._pending == 0:
+                        return
+                    chat_id, job_or_wait = self._next(time.monotonic())
+                    if chat_id is not None:
+                        break
+                    self._cond.wait(job_or_wait)
+            self._run(chat_id, job_or_wait)
+
+    def _run(self, chat_id, job):
+        job.attempts += 1
+        started = time.monotonic()
+        if job.attempts == 1:
+            QUEUE_WAIT_SECONDS.labels(job.method).observe(started - job.queued)
+        if job.call is None: # разрешение: запрос выполнит сам ожидающий, рабочий поток сразу свободен
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_result(SendPermit(self, chat_id, job, started))
+            else: # ожидающий отменен — чат не должен остаться занятым
+                self._finish(chat_id, job, started, error=CancelledError())
+            return
+        try:
+            result = job.call()
+        except Exception as e:
+            self._finish(chat_id, job, started, error=e)
+            return
+        self._finish(chat_id, job, started, result=result)
+
+    def _finish(self, chat_id, job, started, result=None, error=None): # при повторе разрешения — Future нового
+        REQUEST_SECONDS.labels(job.method).observe(time.monotonic() - started)
+        if error is not None:
+            delay = retry_after(error)
+            REQUESTS.labels(job.method, "flood" if delay is not None else "error").inc()
+            retry = delay is not None and job.attempts <= self.max_retries
+            with self._cond:
+                chat = self._chats[chat_id]
+                chat.busy = False
+                if retry:
+                    logger.warning("Flood control для chat_id %s: повтор через %s с", chat_id, delay)
+                    if job.call is None: # прежнее разрешение уже выдано, повтор ждет новое
+                        job.future = Future()
+                    chat.not_before = time.monotonic() + delay
+                    chat.jobs.appendleft(job) # порядок в чате не меняется
+                    self._pending += 1
+                    self.retried += 1
+                else:
+                    self.failed += 1
+                    self._release(chat_id, chat)
+                self._cond.notify_all()
+            if retry:
+                return job.future if job.call is None else None
+            if job.call is not None:
+                job.future.set_exception(error)
+            return None
+        REQUESTS.labels(job.method, "ok").inc()
+        with self._cond:
+            chat = self._chats[chat_id]
+            chat.busy = False
+            self.sent += 1
+            self._release(chat_id, chat)
+            self._cond.notify_all()
+        if job.call is not None:
+            job.future.set_result(result)
+        return None
+
+    def _release(self, chat_id, chat): # забываем чат без очереди, когда его лимит восстановился
+        if not chat.jobs and chat.bucket.full(time.monotonic()) and chat.not_before <= time.monotonic():
+            del self._chats[chat_id]
+
+
+def _chat_id(args, kwargs):
+    return kwargs["chat_id"] if "chat_id" in kwargs else (args[0] if args else None)
+
+
+def _costs(name, args, kwargs): # (токены общего лимита, токены лимита чата)
+    if name in CHAT_FREE_METHODS:
+        return 1, 0
+    if name != "send_media_group":
+        return 1, 1
+    media = kwargs["media"] if "media" in kwargs else (args[1] if len(args) > 1 else [])
+    return max(1, len(media)), 1
+
+
+def _return_permit(granted):
+    if not granted.cancelled():
+        granted.result().failed(CancelledError())
+
+
+class ScheduledBot:
+    # Обертка над TeleBot: send_*/edit_*/delete_* идут через SendScheduler и ждут результата,
+    # остальное (регистрация обработчиков, answer_callback_query и т.д.) — напрямую к боту.
+    def __init__(self, bot, scheduler):
+        self._bot = bot
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if name not in SCHEDULED_METHODS:
+            return attr
+
+        def scheduled(*args, **kwargs):
+            cost, chat_cost = _costs(name, args, kwargs)
+            with metrics.span("telegram." + name): # вместе с ожиданием в очереди
+                return self._scheduler.call(_chat_id(args, kwargs), lambda: attr(*args, **kwargs),
+                                            cost=cost, method=name, chat_cost=chat_cost)
+        return scheduled
+
+
+class AsyncScheduledBot:
+    # То же для AsyncTeleBot: лимиты считает общий SendScheduler, но рабочий поток только выдает разрешение,
+    # сам запрос выполняется и ждется в event loop — потоки очереди не блокируются на время запроса.
+    def __init__(self, bot, scheduler):
+        self._bot = bot
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if name not in SCHEDULED_METHODS:
+            return attr
+
+        async def scheduled(*args, **kwargs):
+            cost, chat_cost = _costs(name, args, kwargs)
+            with metrics.span("telegram." + name):
+                granted = self._scheduler.permit(_chat_id(args, kwargs), cost=cost, method=name, chat_cost=chat_cost)
+                while True:
+                    try:
+                        permit = await asyncio.wrap_future(granted)
+                    except asyncio.CancelledError: # разрешение могло успеть прийти — возвращаем его
+                        granted.add_done_callback(_return_permit)
+                        raise
+                    try:
+                        result = await attr(*args, **kwargs)
+                    except BaseException as e: # и отмена: чат освобождается
+                        granted = permit.failed(e)
+                        if granted is None:
+                            raise
+                        continue # 429: ждем повторного разрешения
+                    permit.succeeded()
+                    return result
+        return scheduled
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> SendScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = SendScheduler(
+                    global_rate=config.SENDER_GLOBAL_RATE,
+                    chat_rate=config.SENDER_CHAT_RATE,
+                    chat_burst=config.SENDER_CHAT_BURST,
+                    group_rate=config.SENDER_GROUP_RATE,
+                    workers=config.SENDER_WORKERS,
+                    max_retries=config.SENDER_MAX_RETRIES,
+                )
+                metrics.collector("sender", _scheduler.stats)
+    return _scheduler
@@ -0,0 +1,152 @@
+import abc
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Какой ввод бот ждет от пользователя (waiting_for_*). Состояние живет ограниченное время:
+# пользователь, который не дописал название, через STATE_TTL секунд снова попадает в обычное меню.
+
+
+class StateStore(abc.ABC):
+    def __init__(self, ttls=None, default_ttl=900):
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+
+    def ttl_for(self, state) -> float:
+        return self.ttls.get(state, self.default_ttl)
+
+    @abc.abstractmethod
+    def get(self, chat_id, default=None):
+        ...
+
+    @abc.abstractmethod
+    def set(self, chat_id, state):
+        ...
+
+    @abc.abstractmethod
+    def pop(self, chat_id, default=None):
+        ...
+
+    @abc.abstractmethod
+    def __len__(self):
+        ...
+
+
+class MemoryStateStore(StateStore): # в памяти процесса, не больше max_entries чатов
+    def __init__(self, ttls=None, default_ttl=900, max_entries=100_000):
+        super().__init__(ttls, default_ttl)
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict() # chat_id -> (expires_at, state), давно не менявшиеся первыми
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, chat_id, default=None):
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[chat_id]
+                return default
+            return entry[1]
+
+    def set(self, chat_id, state):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(chat_id, None)
+            self._entries[chat_id] = (now + self.ttl_for(state), state)
+            self._writes += 1
+            if self._writes % 1000 == 0: # просроченные записи тех, кто больше не пишет боту
+                self._purge(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, chat_id, default=None):
+        with self._lock:
+            entry = self._entries.pop(chat_id, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _purge(self, now): # вызывается под self._lock
+        for chat_id in [chat_id for chat_id, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[chat_id]
+
+
+class SqliteStateStore(StateStore):
+    # Переживает рестарт; один файл можно открыть из нескольких процессов бота.
+    # Время — time.time(), чтобы сроки совпадали между процессами.
+    def __init__(self, path, ttls=None, default_ttl=900):
+        super().__init__(ttls, default_ttl)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_state ("
+            "chat_id INTEGER PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM user_state WHERE expires_at <= ?", (time.time(),))
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, chat_id, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM user_state WHERE chat_id = ? AND expires_at > ?", (chat_id, time.time())
+            ).fetchone()
+        return row[0] if row else default
+
+    def set(self, chat_id, state):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_state (chat_id, state, expires_at) VALUES (?, ?, ?)",
+                (chat_id, state, now + self.ttl_for(state)),
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._conn.execute("DELETE FROM user_state WHERE expires_at <= ?", (now,))
+
+    def pop(self, chat_id, default=None):
+        with self._lock: # RETURNING есть только с SQLite 3.35 — читаем и удаляем в одной транзакции
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state, expires_at FROM user_state WHERE chat_id = ?", (chat_id,)).fetchone()
+                self._conn.execute("DELETE FROM user_state WHERE chat_id = ?", (chat_id,))
+            finally:
+                self._conn.execute("COMMIT")
+        if row is None or row[1] <= time.time():
+            return default
+        return row[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM user_state WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+def create_state_store(backend=None) -> StateStore:
+    backend = backend or config.STATE_BACKEND
+    store = None
+    if backend == 'sqlite':
+        try:
+            store = SqliteStateStore(config.STATE_DB_PATH, config.STATE_TTLS, config.STATE_TTL)
+        except sqlite3.Error as e:
+            logger.error("Не удалось открыть хранилище состояний %s: %s. Состояния хранятся в памяти.", config.STATE_DB_PATH, e)
+    if store is None:
+        store = MemoryStateStore(config.STATE_TTLS, config.STATE_TTL, config.STATE_MAX_ENTRIES)
+    metrics.collector("state_store", lambda: {"entries": len(store)})
+    return store
@@ -0,0 +1,166 @@
+import re
+import heapq
+import logging
+import threading
+from collections import OrderedDict
+
+import config
+from services import metrics
+from api.movie import Movie
+
+logger = logging.getLogger(__name__)
+
+# Индекс названий в памяти для inline-режима: подсказки на каждое нажатие клавиши без запросов к API.
+# Наполняется фильмами из ответов PoiskKino (поиск, рейтинг, бюджет) и прогревом популярными фильмами.
+# Каждое слово запроса — префикс слова названия: "власт кол" находит "Властелин колец".
+# Ключи индекса: префиксы слова длиной 1–3 и триграммы слова; кандидаты проверяются по префиксу.
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", (text or "").casefold().replace("ё", "е")))
+
+
+def _word_keys(word): # префиксы до 3 символов и все триграммы
+    keys = {word[:length] for length in range(1, min(len(word), 3) + 1)}
+    keys.update(word[i:i + 3] for i in range(1, len(word) - 2))
+    return keys
+
+
+def _query_keys(word): # ключи, которые обязан иметь подходящий фильм
+    if len(word) <= 3:
+        return [word]
+    return [word[:3]] + [word[i:i + 3] for i in range(1, len(word) - 2)]
+
+
+class _Entry:
+    __slots__ = ("movie", "title", "words", "keys", "score")
+
+    def __init__(self, movie, title, words, keys):
+        self.movie = movie
+        self.title = title # нормализованное основное название
+        self.words = words
+        self.keys = keys
+        self.score = 0
+
+
+class TitleIndex:
+    def __init__(self, max_entries=20_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # id -> _Entry, давно не встречавшиеся первыми
+        self._keys = {} # ключ -> set(id)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def add(self, movies, weight=1): # weight — насколько фильм популярнее от этого показа
+        with self._lock:
+            for movie in movies:
+                movie_id = movie.get("id")
+                if movie_id is None:
+                    continue
+                entry = self._entries.get(movie_id)
+                if entry is None:
+                    entry = self._insert(movie_id, movie)
+                    if entry is None:
+                        continue
+                else:
+                    self._entries.move_to_end(movie_id)
+                entry.score += weight
+            while len(self._entries) > self.max_entries:
+                self._remove(*self._entries.popitem(last=False))
+                self.evictions += 1
+
+    def search(self, query, offset=0, limit=20): # (фильмы, сколько всего подходит)
+        words = normalize(query).split()
+        if not words:
+            return self.popular(offset, limit)
+        with self._lock:
+            candidates = None
+            for key in sorted((key for word in words for key in _query_keys(word)),
+                              key=lambda key: len(self._keys.get(key, ()))):
+                ids = self._keys.get(key)
+                if not ids:
+                    candidates = set()
+                    break
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            phrase = " ".join(words)
+            matches = []
+            for movie_id in candidates:
+                entry = self._entries[movie_id]
+                if all(any(title_word.startswith(word) for title_word in entry.words) for word in words):
+                    matches.append((entry.title == phrase, entry.title.startswith(phrase), entry.score, movie_id, entry))
+            if matches:
+                self.hits += 1
+            else:
+                self.misses += 1
+            top = heapq.nlargest(offset + limit, matches, key=lambda match: match[:4])
+            return [match[4].movie for match in top[offset:]], len(matches)
+
+    def popular(self, offset=0, limit=20): # для пустого запроса
+        with self._lock:
+            top = heapq.nlargest(offset + limit, self._entries.values(), key=lambda entry: entry.score)
+            return [entry.movie for entry in top[offset:]], len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "keys": len(self._keys), "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0, "evictions": self.evictions}
+
+    def _insert(self, movie_id, movie): # вызывается под self._lock
+        title = normalize(movie.get("name") or movie.get("alternativeName"))
+        words = tuple(dict.fromkeys((title + " " + normalize(movie.get("alternativeName"))).split()))
+        if not words:
+            return None
+        keys = set()
+        for word in words:
+            keys.update(_word_keys(word))
+        entry = self._entries[movie_id] = _Entry(Movie.from_doc(movie), title, words, keys)
+        for key in keys:
+            self._keys.setdefault(key, set()).add(movie_id)
+        return entry
+
+    def _remove(self, movie_id, entry): # вызывается под self._lock
+        for key in entry.keys:
+            ids = self._keys.get(key)
+            if ids is not None:
+                ids.discard(movie_id)
+                if not ids:
+                    del self._keys[key]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_title_index(): # None, если inline-режим выключен
+    global _index
+    if _index is None and config.INLINE_ENABLED:
+        with _index_lock:
+            if _index is None:
+                _index = TitleIndex(max_entries=config.INLINE_INDEX_MAX_ENTRIES)
+                metrics.collector("title_index", _index.stats)
+    return _index
+
+
+def warm_up(pages=None): # популярные фильмы (по числу оценок) — подсказки есть сразу после старта
+    from api.poiskkino import get_client # api.poiskkino наполняет этот индекс
+    pages = config.INLINE_WARMUP_PAGES if pages is None else pages
+    for page in range(1, pages + 1):
+        try:
+            result = get_client().discover({}, page=page, limit=250, sort_field="votes.kp", sort_type=-1)
+        except Exception as e:
+            logger.warning("Прогрев индекса названий: страница %s не загружена: %s", page, e)
+            return
+        if page >= result.pages:
+            break
+    logger.info("Индекс названий прогрет: %s фильмов", get_title_index().stats()['entries'])
+
+
+def start_index_warmup(): # в фоне, чтобы не задерживать запуск бота
+    if get_title_index() is None or config.INLINE_WARMUP_PAGES <= 0:
+        return None
+    thread = threading.Thread(target=warm_up, name="title-index-warmup", daemon=True)
+    thread.start()
+    return thread
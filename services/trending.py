@@ -0,0 +1,254 @@
+import re
+import math
+import time
+import heapq
+import logging
+import datetime
+import threading
+
+import config
+from services import metrics
+from database import db, History, TrendBucket, history_writer
+from peewee import EXCLUDED
+
+logger = logging.getLogger(__name__)
+
+# "Популярное": что чаще всего ищут. Строки истории ("Поиск по названию: 'Матрица'", "Рейтинг от 7.5",
+# "Бюджет от $50.0 млн.") разбираются в (вид, нормализованное значение). При каждой записи пачки истории
+# счетчики за час и за сутки в trend_bucket увеличиваются в той же транзакции, а в памяти обновляется
+# затухающий вес запроса: каждый поиск весит 2^((t - origin) / half_life), т.е. вдвое меньше через half_life.
+# Затухание у всех запросов одинаковое, поэтому порядок не меняется со временем, и топ пересчитывается
+# только по запросам из новой пачки — обработчик отдает готовый список.
+# Почасовые счетчики хранятся TRENDING_HOURLY_HOURS, дальше — суточные, всего TRENDING_RETENTION_DAYS.
+#
+#   python -m services.trending --rebuild   # пересчитать trend_bucket по таблице History
+
+KINDS = ('name', 'rating', 'budget')
+HOUR = 3600
+DAY = 86400
+MAX_EXPONENT = 512 # дальше веса пересчитываются от нового origin, чтобы не переполнить float
+
+PATTERNS = (
+    ('name', re.compile(r"^Поиск по названию: '(.*?)'?$", re.S)), # save_query обрезает строку до 255 символов
+    ('rating', re.compile(r"^Рейтинг от (\S+)$")),
+    ('budget', re.compile(r"^Бюджет от \$(\S+) млн\.$")),
+)
+
+
+def normalize_title(text: str) -> str: # как services.title_index.normalize: регистр, ё, пунктуация не важны
+    return " ".join(re.findall(r"\w+", text.casefold().replace("ё", "е")))
+
+
+def normalize_query(query: str): # -> (вид, значение, подпись) или None для нераспознанной строки
+    for kind, pattern in PATTERNS:
+        match = pattern.match(query or "")
+        if match is None:
+            continue
+        text = " ".join(match.group(1).split())
+        if kind == 'name':
+            value = normalize_title(text)
+            return (kind, value, text) if value else None
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+        if not math.isfinite(number):
+            return None
+        value = f"{number:g}"
+        return kind, value, value
+    return None
+
+
+def hour_start(when: float) -> int:
+    return int(when // HOUR * HOUR)
+
+
+def day_start(when: float) -> int: # полночь по местному времени, как у timestamp в History
+    date = datetime.datetime.fromtimestamp(when).date()
+    return int(datetime.datetime.combine(date, datetime.time()).timestamp())
+
+
+def bucket_increments(rows) -> dict: # строки истории -> {(period, kind, value, start): [count, label]}
+    increments = {}
+    for row in rows:
+        parsed = normalize_query(row['query'])
+        if parsed is None:
+            continue
+        kind, value, label = parsed
+        when = row['timestamp'].timestamp()
+        for period, start in (('hour', hour_start(when)), ('day', day_start(when))):
+            entry = increments.setdefault((period, kind, value, start), [0, label])
+            entry[0] += 1
+            entry[1] = label
+    return increments
+
+
+def store_increments(increments): # upsert в trend_bucket; вызывается внутри транзакции
+    rows = [{'period': period, 'kind': kind, 'value': value, 'start': start, 'count': count, 'label': label}
+            for (period, kind, value, start), (count, label) in increments.items()]
+    for chunk in range(0, len(rows), 150): # 6 параметров на строку, лимит SQLite — 999
+        (TrendBucket.insert_many(rows[chunk:chunk + 150])
+         .on_conflict(conflict_target=[TrendBucket.period, TrendBucket.kind, TrendBucket.value, TrendBucket.start],
+                      update={TrendBucket.count: TrendBucket.count + EXCLUDED.count, TrendBucket.label: EXCLUDED.label})
+         .execute())
+
+
+class TrendRollup:
+    def __init__(self, half_life_hours=24.0, top_n=10, hourly_hours=48, retention_days=30):
+        self.half_life = half_life_hours * HOUR
+        self.top_n = top_n
+        self.hourly_hours = hourly_hours
+        self.retention_days = retention_days
+        self._origin = time.time()
+        self._scores = {} # (kind, value) -> вес относительно self._origin
+        self._labels = {} # (kind, value) -> подпись для показа
+        self._last_seen = {} # (kind, value) -> начало последнего часа с поиском
+        self._top = {kind: [] for kind in KINDS} # kind -> [(kind, value)] по убыванию веса
+        self._lock = threading.Lock()
+        self._pruned = time.monotonic()
+        self.recorded = 0
+
+    def record(self, batch): # наблюдатель HistoryWriter: пишет счетчики и обновляет топ в памяти
+        increments = bucket_increments(batch)
+        if not increments:
+            return
+        store_increments(increments)
+        with self._lock:
+            changed = self._apply((kind, value, start, count, label)
+                                  for (period, kind, value, start), (count, label) in increments.items() if period == 'hour')
+            for kind in KINDS: # остальные запросы затухают одинаково — их порядок прежний
+                candidates = set(self._top[kind]) | {key for key in changed if key[0] == kind}
+                self._top[kind] = heapq.nlargest(self.top_n, candidates, key=self._scores.__getitem__)
+            self.recorded += sum(count for key, (count, _) in increments.items() if key[0] == 'hour')
+        if time.monotonic() - self._pruned >= HOUR:
+            self.prune()
+
+    def top(self, kind, limit=None) -> list: # [(подпись, вес сейчас)]; без подсчета — готовый список
+        with self._lock:
+            now_weight = self._weight(time.time())
+            return [(self._labels[key], self._scores[key] / now_weight) for key in self._top[kind][:limit or self.top_n]]
+
+    def load(self): # веса из trend_bucket: почасовые счетчики за последние часы, суточные — за более ранние дни
+        now = time.time()
+        split, cutoff = self._split(now), day_start(now - self.retention_days * DAY)
+        rows = (TrendBucket.select()
+                .where(((TrendBucket.period == 'hour') & (TrendBucket.start >= split)) |
+                       ((TrendBucket.period == 'day') & (TrendBucket.start < split) & (TrendBucket.start >= cutoff)))
+                .order_by(TrendBucket.start)
+                .tuples())
+        with self._lock:
+            self._origin = now
+            self._scores, self._labels, self._last_seen = {}, {}, {}
+            self._apply((kind, value, start + DAY // 2 if period == 'day' else start, count, label) # сутки — по середине
+                        for period, kind, value, start, count, label in rows)
+            self._refresh_top()
+        logger.info("Популярное: загружено %s запросов", len(self._scores))
+
+    def prune(self): # удаляем счетчики старше окна хранения — в памяти и в базе
+        self._pruned = time.monotonic()
+        now = time.time()
+        split, cutoff = self._split(now), day_start(now - self.retention_days * DAY)
+        with self._lock:
+            for key in [key for key, seen in self._last_seen.items() if seen < cutoff]:
+                del self._scores[key], self._labels[key], self._last_seen[key]
+            self._refresh_top()
+        try:
+            with db.atomic():
+                TrendBucket.delete().where((TrendBucket.period == 'hour') & (TrendBucket.start < split)).execute()
+                TrendBucket.delete().where((TrendBucket.period == 'day') & (TrendBucket.start < cutoff)).execute()
+        except Exception as e:
+            logger.warning("Не удалось удалить старые счетчики популярного: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queries": len(self._scores), "recorded": self.recorded}
+
+    def _split(self, now): # с этой полуночи веса считаются по часам, раньше — по суткам
+        return day_start(now - self.hourly_hours * HOUR)
+
+    def _weight(self, when):
+        return 2 ** ((when - self._origin) / self.half_life)
+
+    def _apply(self, buckets) -> set: # вызывается под self._lock; buckets — (kind, value, start, count, label)
+        changed = set()
+        for kind, value, start, count, label in buckets:
+            if (start - self._origin) / self.half_life > MAX_EXPONENT:
+                self._rebase(start)
+            key = (kind, value)
+            self._scores[key] = self._scores.get(key, 0.0) + count * self._weight(start)
+            self._labels[key] = label
+            self._last_seen[key] = max(self._last_seen.get(key, 0), start)
+            changed.add(key)
+        return changed
+
+    def _rebase(self, when): # вызывается под self._lock
+        factor = self._weight(when)
+        self._scores = {key: score / factor for key, score in self._scores.items()}
+        self._origin = when
+
+    def _refresh_top(self): # вызывается под self._lock; полный пересчет — после загрузки и чистки
+        for kind in KINDS:
+            keys = [key for key in self._scores if key[0] == kind]
+            self._top[kind] = heapq.nlargest(self.top_n, keys, key=self._scores.__getitem__)
+
+
+def rebuild(chunk_size=5000) -> int: # пересчет trend_bucket по всей таблице History; возвращает число учтенных строк
+    increments, counted, last_id = {}, 0, 0
+    while True:
+        rows = list(History.select(History.id, History.query, History.timestamp)
+                    .where(History.id > last_id).order_by(History.id).limit(chunk_size).dicts())
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        for key, (count, label) in bucket_increments(rows).items():
+            entry = increments.setdefault(key, [0, label])
+            entry[0] += count
+            entry[1] = label
+            if key[0] == 'hour':
+                counted += count
+    with db.atomic():
+        TrendBucket.delete().execute()
+        store_increments(increments)
+    logger.info("Популярное пересчитано по истории: %s запросов, %s счетчиков", counted, len(increments))
+    return counted
+
+
+_rollup = None
+_rollup_lock = threading.Lock()
+
+def get_trending() -> TrendRollup: # при первом вызове подключается к записи истории
+    global _rollup
+    if _rollup is None:
+        with _rollup_lock:
+            if _rollup is None:
+                rollup = TrendRollup(half_life_hours=config.TRENDING_HALF_LIFE_HOURS, top_n=config.TRENDING_TOP_N,
+                                     hourly_hours=config.TRENDING_HOURLY_HOURS, retention_days=config.TRENDING_RETENTION_DAYS)
+                try:
+                    if not TrendBucket.select().exists() and History.select().exists():
+                        rebuild() # счетчиков еще нет, а история уже есть
+                    rollup.load()
+                except Exception as e:
+                    logger.error("Не удалось загрузить счетчики популярного: %s", e)
+                history_writer.observers.append(rollup.record)
+                metrics.collector("trending", rollup.stats)
+                _rollup = rollup
+    return _rollup
+
+
+if __name__ == '__main__':
+    import argparse
+    from database import create_tables
+    from services.logs import setup_logging
+
+    parser = argparse.ArgumentParser(description="Trending rollups maintenance")
+    parser.add_argument("--rebuild", action="store_true", help="пересчитать trend_bucket по таблице History")
+    args = parser.parse_args()
+    setup_logging()
+    create_tables()
+    if args.rebuild:
+        print(f"Учтено запросов: {rebuild()}")
+    rollup = TrendRollup(half_life_hours=config.TRENDING_HALF_LIFE_HOURS, top_n=config.TRENDING_TOP_N,
+                         hourly_hours=config.TRENDING_HOURLY_HOURS, retention_days=config.TRENDING_RETENTION_DAYS)
+    rollup.load()
+    for kind in KINDS:
+        print(kind, rollup.top(kind))
@@ -0,0 +1,159 @@
+import json
+import time
+import queue
+import hmac
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from telebot import types
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024 # Telegram не присылает обновления больше мегабайта
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+QUEUE_WAIT_SECONDS = metrics.histogram("webhook_queue_wait_seconds", "Ожидание обновления в очереди до рабочего потока")
+
+
+class WebhookServer:
+    # Принимает POST от Telegram, кладет обновления в ограниченную очередь,
+    # которую разбирают рабочие потоки через dispatch(updates).
+    def __init__(self, dispatch, host=None, port=None, path=None, secret_token=None, queue_size=None, workers=None):
+        self.dispatch = dispatch
+        self.host = host or config.WEBHOOK_HOST
+        self.port = config.WEBHOOK_PORT if port is None else port
+        self.path = path or config.WEBHOOK_PATH
+        self.secret_token = config.WEBHOOK_SECRET if secret_token is None else secret_token
+        self.queue = queue.Queue(maxsize=queue_size or config.WEBHOOK_QUEUE_SIZE)
+        self.workers_count = workers or config.WEBHOOK_WORKERS
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self._workers = []
+        self._server = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else (self.host, self.port)
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        for i in range(self.workers_count):
+            worker = threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        threading.Thread(target=self._server.serve_forever, name="webhook-http", daemon=True).start()
+        metrics.collector("webhook", self.stats)
+        logger.info("Webhook сервер слушает %s:%s%s", self.address[0], self.address[1], self.path)
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self._stopping.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout=10): # перестаем принимать обновления и дорабатываем очередь
+        self._stopping.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def is_ready(self) -> bool:
+        return (not self._stopping.is_set()
+                and any(worker.is_alive() for worker in self._workers)
+                and not self.queue.full())
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+        }
+
+    def submit(self, update) -> bool: # False, если очередь переполнена
+        try:
+            self.queue.put_nowait((time.monotonic(), update))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+        with self._stats_lock:
+            self.accepted += 1
+        return True
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            queued, update = item
+            QUEUE_WAIT_SECONDS.observe(time.monotonic() - queued)
+            try:
+                self.dispatch([update])
+            except Exception as e:
+                logger.exception("Ошибка обработки обновления %s: %s", update.update_id, e)
+            finally:
+                with self._stats_lock:
+                    self.processed += 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404, {"ok": False})
+                if server.secret_token and not hmac.compare_digest(
+                        self.headers.get(SECRET_HEADER, "").encode(), server.secret_token.encode()):
+                    return self._reply(403, {"ok": False})
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_SIZE:
+                    return self._reply(413, {"ok": False})
+                if length <= 0:
+                    return self._reply(400, {"ok": False})
+                try:
+                    update = types.Update.de_json(self.rfile.read(length).decode("utf-8"))
+                except Exception as e:
+                    logger.warning("Некорректное обновление от Telegram: %s", e)
+                    return self._reply(400, {"ok": False})
+                if not server.submit(update): # Telegram повторит доставку позже
+                    return self._reply(503, {"ok": False})
+                self._reply(200, {"ok": True})
+
+            def do_GET(self):
+                if self.path == "/healthz": # процесс жив
+                    return self._reply(200, {"ok": True})
+                if self.path == "/readyz": # готов принимать обновления
+                    ready = server.is_ready()
+                    return self._reply(200 if ready else 503, dict(server.stats(), ok=ready))
+                self._reply(404, {"ok": False})
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # access log не нужен на каждое обновление
+                pass
+
+        return Handler
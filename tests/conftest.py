@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Настройки до импорта config: база истории и счетчики ключей — во временном каталоге, а не в рабочих файлах бота.
+_workdir = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ["HISTORY_DB_PATH"] = os.path.join(_workdir, "history.db")
+os.environ["POISKINO_KEYS_DB_PATH"] = ""
+os.environ["STATE_BACKEND"] = "memory"
+os.environ["METRICS_PORT"] = "0"
+os.environ.setdefault("BOT_TOKEN", "123:test") # main.py создает бота при импорте
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
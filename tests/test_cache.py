@@ -0,0 +1,61 @@
+import time
+
+from api.cache import ResponseCache, make_key
+
+
+def test_make_key_normalizes_query_and_order():
+    assert make_key("/search", {"query": "  The  Matrix ", "page": 1}) == make_key("/search", {"page": 1, "query": "the matrix"})
+    assert make_key("/movie", {"rating.kp": 7.0}) == make_key("/movie", {"rating.kp": 7})
+    assert make_key("/movie", {"page": 1}) != make_key("/movie", {"page": 2})
+
+
+def test_hit_and_miss_are_counted():
+    cache = ResponseCache()
+    assert cache.get("k") is None
+    cache.set("k", "/movie", {"docs": []}, 10)
+    assert cache.get("k") == {"docs": []}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_entry_is_a_miss_but_served_as_stale():
+    cache = ResponseCache(ttls={"/movie": 0.01}, stale_ttl=60)
+    cache.set("k", "/movie", "old", 3)
+    time.sleep(0.02)
+    assert cache.get("k") is None
+    assert cache.get_stale("k") == "old"
+
+
+def test_stale_entry_is_dropped_after_stale_ttl():
+    cache = ResponseCache(default_ttl=0, stale_ttl=0)
+    cache.set("k", "/movie", "old", 3)
+    assert cache.get("k") is None
+    assert cache.get_stale("k") is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "/movie", 1, 1)
+    cache.set("b", "/movie", 2, 1)
+    cache.get("a")
+    cache.set("c", "/movie", 3, 1)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit_evicts_and_skips_oversized():
+    cache = ResponseCache(max_bytes=100)
+    cache.set("a", "/movie", 1, 60)
+    cache.set("b", "/movie", 2, 60)
+    assert cache.get("a") is None and cache.get("b") == 2
+    cache.set("huge", "/movie", 3, 1000)
+    assert cache.get("huge") is None
+    assert cache.stats()["bytes"] == 60
+
+
+def test_disk_level_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(disk_path=path).set("k", "/movie", {"docs": [1, 2]}, 10)
+    restarted = ResponseCache(disk_path=path)
+    assert restarted.get("k") == {"docs": [1, 2]}
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import config
+from api.poiskkino import MoviePage
+from handlers.flow import Call, Prefetch
+from handlers.common import PAGE_LIMIT
+from handlers.carousel import carousel_markup, unpack, pack, shown, register_carousel_handlers
+from handlers.results import show_results
+from handlers.movie_budget_search_handler import BUDGET
+
+
+def movie(movie_id, budget=None):
+    return {"id": movie_id, "name": f"Фильм {movie_id}", "budget": {"value": budget, "currency": "$"} if budget else None}
+
+
+def run(flow, page): # выполняет шаги flow: предзагрузка отдает page, отправки записываются
+    calls, value = [], None
+    try:
+        while True:
+            op = flow.send(value)
+            value = None
+            if isinstance(op, Prefetch) and op.method == 'take':
+                value = page
+            elif type(op) is Call:
+                calls.append(op)
+                value = SimpleNamespace(message_id=len(calls), photo=None)
+    except StopIteration:
+        return calls
+
+
+class CallbackRouter:
+    def callback(self, prefix):
+        def register(handler):
+            self.handler = handler
+            return handler
+        return register
+
+
+def fetch_page(value, page):
+    return MoviePage(docs=[movie(n) for n in range(PAGE_LIMIT)], total=2 * PAGE_LIMIT)
+    yield
+
+
+def press(message, target, current):
+    return SimpleNamespace(id="q", data=pack('rating', 7.0, target, current), message=message)
+
+
+def until_edit(flow): # шаги нажатия до правки сообщения; None — до Telegram не дошло
+    value = None
+    while True:
+        try:
+            op = flow.send(value)
+        except StopIteration:
+            return None
+        value = None
+        if op.method == 'edit_message_text':
+            return op
+
+
+def buttons(markup):
+    return {button.text: unpack(button.callback_data) for row in markup.keyboard for button in row}
+
+
+def test_budget_carousel_shows_only_movies_with_budget(monkeypatch):
+    monkeypatch.setattr(config, "CAROUSEL_ENABLED", True)
+    page = MoviePage(docs=[movie(1), movie(2, 5_000_000), movie(3, 7_000_000)], total=3)
+
+    calls = run(show_results(42, BUDGET, 1_000_000, 1), page)
+
+    sent = [call for call in calls if call.method == 'send_message']
+    assert len(sent) == 1
+    assert "Фильм 2" in sent[0].kwargs["text"] # первый слайд — первый фильм с бюджетом, а не movie(1)
+
+
+def test_last_movie_of_filtered_page_steps_to_next_page():
+    markup = carousel_markup('budget', 1, 2, total=3 * PAGE_LIMIT, on_page=3)
+
+    assert buttons(markup)["▶️"][2] == PAGE_LIMIT
+
+
+def test_next_button_inside_page_steps_by_one():
+    markup = carousel_markup('rating', 7.0, 0, total=3 * PAGE_LIMIT)
+
+    assert buttons(markup)["▶️"][2] == 1
+
+
+def test_repeated_press_while_edit_in_flight_is_skipped():
+    router = CallbackRouter()
+    register_carousel_handlers(router, {'rating': (fetch_page, lambda movie: movie["name"], lambda movie: True)})
+    message = SimpleNamespace(chat=SimpleNamespace(id=501), message_id=9, photo=None)
+    shown.set(501, 9, 0)
+
+    first = router.handler(press(message, 1, 0))
+    assert until_edit(first) is not None # первая правка еще не ответила
+    assert until_edit(router.handler(press(message, 1, 0))) is None
+
+    with_error = first.throw(RuntimeError("Telegram недоступен"))
+    assert with_error.method == 'send_message'
+    assert until_edit(first) is None # ошибка правки — позиция возвращается к прежней
+    assert until_edit(router.handler(press(message, 1, 0))) is not None
@@ -0,0 +1,29 @@
+import pytest
+
+from api.catalog import MovieCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = MovieCatalog(str(tmp_path / "catalog.db"))
+    if not catalog.fts:
+        pytest.skip("SQLite собран без FTS5")
+    catalog.upsert([
+        {"id": 1, "name": "Матрица", "year": 1999, "rating": {"kp": 8.5}},
+        {"id": 2, "name": "Матрица: Перезагрузка", "year": 2003, "rating": {"kp": 7.7}},
+    ])
+    yield catalog
+    catalog.close()
+
+
+def test_partial_catalog_does_not_answer_search(catalog):
+    assert catalog.search("матр") is None # первичная загрузка не закончена — в API
+    assert catalog.stats()["misses"] == 1
+
+
+def test_complete_catalog_answers_search(catalog):
+    catalog.set_state("complete", 1)
+    page = catalog.search("матр")
+    assert page.total == 2 and {movie.id for movie in page.docs} == {1, 2}
+    assert catalog.search("аватар") is None
+    assert (catalog.stats()["hits"], catalog.stats()["misses"]) == (1, 1)
@@ -0,0 +1,125 @@
+import time
+import threading
+
+import pytest
+from telebot.types import Update
+
+import config
+from services.chat_pool import ChatWorkerPool
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**options):
+        pool = ChatWorkerPool(**options)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop(timeout=5)
+
+
+def blocked(pool, key="blocker"): # занимает рабочего, пока не отпустят
+    started, release = threading.Event(), threading.Event()
+    pool.submit(key, lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    return release
+
+
+def test_updates_of_one_chat_run_in_order_one_at_a_time(make_pool):
+    pool = make_pool(workers=8, max_chat_queue=100)
+    order, running, overlaps = [], [0], []
+    lock = threading.Lock()
+
+    def handler(i):
+        with lock:
+            running[0] += 1
+            overlaps.append(running[0])
+        time.sleep(0.005)
+        with lock:
+            running[0] -= 1
+            order.append(i)
+
+    futures = [pool.submit(1, lambda i=i: handler(i)) for i in range(20)]
+    for future in futures:
+        future.result(timeout=10)
+    assert order == list(range(20))
+    assert max(overlaps) == 1 # восемь рабочих, но чат — строго по одному
+    assert pool.stats()["processed"] == 20
+
+
+def test_chats_are_served_round_robin(make_pool):
+    pool = make_pool(workers=1, max_chat_queue=100)
+    release = blocked(pool)
+    order = []
+    futures = [pool.submit("noisy", lambda i=i: order.append(("noisy", i))) for i in range(5)]
+    futures += [pool.submit(chat, lambda chat=chat: order.append((chat, 0))) for chat in ("a", "b")]
+    release.set()
+
+    for future in futures:
+        future.result(timeout=5)
+    assert order[:4] == [("noisy", 0), ("a", 0), ("b", 0), ("noisy", 1)] # частый чат не держит остальных
+
+
+def test_per_chat_limits_concurrency_within_a_chat(make_pool):
+    pool = make_pool(workers=4, per_chat=2, max_chat_queue=100)
+    running, peak, gate = [0], [0], threading.Event()
+    lock = threading.Lock()
+
+    def handler():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        gate.wait(5)
+        with lock:
+            running[0] -= 1
+
+    futures = [pool.submit(1, handler) for _ in range(6)]
+    time.sleep(0.2)
+    assert peak[0] == 2 and pool.stats()["running"] == 2
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_long_chat_queue_and_total_queue_are_shed(make_pool):
+    pool = make_pool(workers=1, max_chat_queue=2, max_queue=3)
+    release = blocked(pool)
+    assert pool.submit(1, lambda: None) and pool.submit(1, lambda: None)
+    assert pool.submit(1, lambda: None) is None # очередь чата полна
+    assert pool.submit(2, lambda: None) is not None
+    assert pool.submit(3, lambda: None) is None # всего в очередях max_queue
+    assert pool.stats()["shed"] == 2
+    release.set()
+
+
+def test_busy_notice_once_per_interval(make_pool):
+    pool = make_pool()
+    assert pool.claim_busy_notice(1)
+    assert not pool.claim_busy_notice(1)
+    assert pool.claim_busy_notice(2)
+
+
+def test_shed_update_gets_busy_reply(make_pool, monkeypatch):
+    import main
+
+    pool = make_pool(workers=1, max_chat_queue=1)
+    monkeypatch.setattr(main, "get_chat_pool", lambda: pool)
+    monkeypatch.setattr(config, "SENDER_ENABLED", False)
+    bot = main.PooledTeleBot("123:test", threaded=False)
+    replies = []
+    monkeypatch.setattr(bot, "send_message", lambda chat_id, text, **kwargs: replies.append((chat_id, text)))
+    release = blocked(pool, key=42)
+
+    def update(update_id):
+        return Update.de_json({"update_id": update_id, "message": {
+            "message_id": update_id, "date": 0, "text": "/start",
+            "chat": {"id": 42, "type": "private"}, "from": {"id": 42, "is_bot": False, "first_name": "U"}}})
+
+    futures = bot.process_new_updates([update(1), update(2), update(3)])
+    assert futures[0] is not None and futures[1:] == [None, None]
+    assert replies == [(42, main.BUSY_TEXT)] # один ответ на несколько отброшенных обновлений
+    release.set()
@@ -0,0 +1,78 @@
+from api.poiskkino import record_outcome
+from api.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, is_upstream_failure
+from api.errors import ApiHTTPError, ApiTimeoutError, ApiQuotaExhaustedError
+
+
+def open_breaker(**options):
+    breaker = CircuitBreaker(window=4, min_calls=4, error_ratio=0.5, slow_call=0, **options)
+    for failed in (True, False, True, False):
+        breaker.record(0.1, failed=failed)
+    return breaker
+
+
+def test_upstream_failures_are_server_side_only():
+    assert is_upstream_failure(ApiHTTPError(503, ""))
+    assert is_upstream_failure(ApiHTTPError(429, ""))
+    assert is_upstream_failure(ApiTimeoutError("timeout"))
+    assert not is_upstream_failure(ApiHTTPError(400, ""))
+    assert not is_upstream_failure(ApiQuotaExhaustedError("quota"))
+
+
+def test_stays_closed_until_min_calls():
+    breaker = CircuitBreaker(window=10, min_calls=5, error_ratio=0.5)
+    for _ in range(4):
+        breaker.record(0.1, failed=True)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_opens_on_error_ratio_and_rejects_calls():
+    breaker = open_breaker(open_seconds=60)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert not breaker.probe_due() # open_seconds еще не прошли
+    assert breaker.stats()["opened"] == 1 and breaker.stats()["rejected"] == 1
+
+
+def test_opens_on_slow_calls():
+    breaker = CircuitBreaker(window=4, min_calls=4, slow_call=1.0, slow_ratio=0.5)
+    for seconds in (2.0, 0.1, 2.0, 0.1):
+        breaker.record(seconds)
+    assert breaker.state == OPEN
+
+
+def test_successful_probe_closes():
+    breaker = open_breaker(open_seconds=0)
+    assert breaker.probe_due()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.probe_due() # пробный запрос уже в полете
+    breaker.record(0.1, probe=True)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_opens_again():
+    breaker = open_breaker(open_seconds=0)
+    assert breaker.probe_due()
+    breaker.record(0.1, failed=True, probe=True)
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 1 # повторное размыкание не считается новым
+
+
+def test_late_answers_do_not_count_while_open():
+    breaker = open_breaker(open_seconds=60)
+    for _ in range(10):
+        breaker.record(0.1, failed=False)
+    assert breaker.state == OPEN
+
+
+def test_probe_without_upstream_answer_is_not_counted():
+    breaker = open_breaker(open_seconds=60)
+    breaker._opened_at -= 60
+    assert breaker.probe_due()
+
+    record_outcome(breaker, 0, ApiQuotaExhaustedError("quota"), probe=True) # ключей нет — до API не дошли
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.probe_due() # следующий вызов пробует снова, не дожидаясь open_seconds
+
+    record_outcome(breaker, 0, ApiHTTPError(400, ""), probe=True)
+    assert breaker.state == OPEN and breaker.probe_due()
+    assert breaker.stats()["probes"] == 3 and breaker.stats()["opened"] == 1
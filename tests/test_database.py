@@ -0,0 +1,95 @@
+import datetime
+import threading
+
+import pytest
+
+import database
+from database import (db, create_tables, enable_incremental_vacuum, trim_user_history, get_history,
+                      History, HistoryWriter)
+
+
+def auto_vacuum():
+    return db.execute_sql('PRAGMA auto_vacuum').fetchone()[0]
+
+
+def test_large_history_defers_vacuum_until_maintenance(caplog):
+    create_tables()
+    with db.connection_context():
+        db.execute_sql('PRAGMA auto_vacuum = NONE')
+        db.execute_sql('VACUUM') # база из времени до миграции
+
+        assert not enable_incremental_vacuum(max_bytes=0) # больше порога — только предупреждение
+        assert auto_vacuum() == 0
+        assert "отложен" in caplog.text
+
+        assert enable_incremental_vacuum() # python database.py --vacuum
+        assert auto_vacuum() == 2
+
+
+def test_small_history_is_converted_by_migration():
+    create_tables()
+    with db.connection_context():
+        assert auto_vacuum() == 2
+
+
+def test_trim_keeps_limit_when_timestamps_tie():
+    create_tables()
+    with db.connection_context():
+        History.delete().where(History.user_id == 42).execute()
+        now = datetime.datetime.now()
+        History.insert_many([{"user_id": 42, "query": f"q{i}", "timestamp": now} for i in range(5)]).execute()
+
+        assert trim_user_history({42}, 3) == 2 # одно время у всей пачки — остаются 3 последние по id
+        assert [row.query for row in History.select().where(History.user_id == 42).order_by(History.id)] == ["q2", "q3", "q4"]
+
+
+@pytest.fixture
+def writer():
+    create_tables()
+    History.delete().where(History.user_id.in_([51, 52])).execute()
+    writer = HistoryWriter(batch_size=100, flush_interval=10) # сам поток за время теста ничего не пишет
+    yield writer
+    writer.stop()
+    History.delete().where(History.user_id.in_([51, 52])).execute()
+
+
+def saved(user_id):
+    return [row.query for row in History.select().where(History.user_id == user_id).order_by(History.id)]
+
+
+def test_stop_flushes_pending_records(writer):
+    for i in range(3):
+        writer.enqueue(51, f"q{i}")
+    assert saved(51) == [] and writer.stats()["pending"] == 3
+    writer.stop()
+    assert saved(51) == ["q0", "q1", "q2"]
+    writer.enqueue(51, "после stop") # поток записи остановлен — пишем сразу
+    assert saved(51)[-1] == "после stop"
+
+
+def test_full_buffer_blocks_enqueue_until_flush(writer):
+    writer.max_pending = 2
+    writer.enqueue(51, "q0")
+    writer.enqueue(51, "q1")
+    blocked = threading.Thread(target=writer.enqueue, args=(51, "q2"))
+    blocked.start()
+    blocked.join(0.3)
+    assert blocked.is_alive() and writer.stats()["pending"] == 2 # буфер не растет выше max_pending
+
+    writer.flush()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    assert saved(51) == ["q0", "q1"] and writer.stats()["pending"] == 1
+
+
+def test_get_history_merges_pending_with_saved(writer, monkeypatch):
+    monkeypatch.setattr(database, "history_writer", writer)
+    old = datetime.datetime.now() - datetime.timedelta(hours=1)
+    History.insert_many([{"user_id": 52, "query": f"old{i}", "timestamp": old + datetime.timedelta(minutes=i)}
+                         for i in range(3)]).execute()
+    writer.enqueue(52, "new0")
+    writer.enqueue(52, "new1")
+    writer.enqueue(51, "чужой")
+
+    assert [row.query for row in get_history(52, limit=4)] == ["new1", "new0", "old2", "old1"]
+    assert [row.query for row in get_history(52, limit=1)] == ["new1"]
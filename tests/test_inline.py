@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+from api.poiskkino import MoviePage
+from handlers.flow import Api
+from handlers.inline_handler import search_api
+
+
+class Index:
+    def search(self, text, offset, limit):
+        return [], 0
+
+
+def ops(flow): # операции flow; на запрос к API — пустая страница, остальное — None
+    seen, value = [], None
+    try:
+        while True:
+            op = flow.send(value)
+            seen.append(op)
+            value = MoviePage() if isinstance(op, Api) else None
+    except StopIteration:
+        return seen
+
+
+def test_superseded_query_spends_no_api_request():
+    query = SimpleNamespace(id="1", query="ёлки")
+
+    assert ops(search_api(Index(), query, "ёлки", False, 0, lambda: False)) == []
+
+
+def test_current_query_searches_api_and_answers():
+    query = SimpleNamespace(id="1", query="ёлки")
+
+    seen = ops(search_api(Index(), query, "ёлки", False, 0, lambda: True))
+
+    assert [op.method for op in seen] == ["search", "answer_inline_query"]
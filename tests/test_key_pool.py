@@ -0,0 +1,122 @@
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from api.errors import ApiHTTPError, ApiQuotaExhaustedError
+from api.key_pool import ApiKey, ApiKeyPool, parse_keys
+
+
+def test_parse_keys_reads_budget_and_weight():
+    keys = parse_keys("a:200, b:500:3, c", default_budget=50)
+    assert [(key.value, key.budget, key.weight) for key in keys] == [("a", 200, 200), ("b", 500, 3.0), ("c", 50, 50)]
+
+
+def test_least_used_spreads_requests_by_weight():
+    pool = ApiKeyPool([ApiKey("a", weight=1), ApiKey("b", weight=3)])
+    used = [pool.acquire().value for _ in range(8)]
+    assert used.count("a") == 2 and used.count("b") == 6
+
+
+def test_exhausted_budget_moves_to_next_key_then_raises():
+    pool = ApiKeyPool([ApiKey("a", budget=1), ApiKey("b", budget=1)])
+    assert {pool.acquire().value, pool.acquire().value} == {"a", "b"}
+    with pytest.raises(ApiQuotaExhaustedError):
+        pool.acquire()
+
+
+def test_rejected_key_is_excluded_until_reset_when_another_works():
+    a, b = ApiKey("a"), ApiKey("b")
+    pool = ApiKeyPool([a, b], cooldown=60)
+    assert pool.reject(a, 401) is True
+    assert a.blocked_until > time.time() + 60 # до полуночи квоты, а не на паузу
+    assert {pool.acquire().value for _ in range(3)} == {"b"}
+
+
+def test_last_rejected_key_gets_cooldown_and_http_error():
+    key = ApiKey("a")
+    pool = ApiKeyPool([key], cooldown=60)
+    assert pool.reject(key, 403) is False
+    assert key.blocked_until == pytest.approx(time.time() + 60, abs=5)
+    with pytest.raises(ApiHTTPError) as error:
+        pool.acquire()
+    assert error.value.status_code == 403
+
+
+def test_throttled_key_pauses_for_retry_after():
+    a, b = ApiKey("a"), ApiKey("b")
+    pool = ApiKeyPool([a, b], cooldown=1)
+    pool.throttle(a, "30")
+    assert a.blocked_until == pytest.approx(time.time() + 30, abs=5)
+    assert pool.acquire() is b
+    assert pool.stats()["available"] == 1
+
+
+def test_last_throttled_key_waits_only_for_retry_after():
+    key = ApiKey("a")
+    pool = ApiKeyPool([key], cooldown=60)
+    assert pool.throttle(key, "1") is False
+    assert key.blocked_until == pytest.approx(time.time() + 1, abs=0.5) # не cooldown
+    with pytest.raises(ApiHTTPError) as error: # частота, а не дневная квота
+        pool.acquire()
+    assert error.value.status_code == 429
+    key.blocked_until = 0
+    assert pool.acquire() is key
+
+
+def test_usage_survives_restart(tmp_path):
+    path = str(tmp_path / "keys.db")
+    pool = ApiKeyPool([ApiKey("a", budget=10)], db_path=path)
+    for _ in range(3):
+        pool.acquire()
+    pool.close()
+
+    restarted = ApiKeyPool([ApiKey("a", budget=10)], db_path=path)
+    assert restarted.keys[0].used == 3
+    assert restarted.stats()["remaining"] == 7
+
+
+class RecordingDb: # обертка соединения SQLite: запоминает, из каких потоков шли запросы
+    def __init__(self, db):
+        self.db, self.threads = db, set()
+
+    def __getattr__(self, name):
+        self.threads.add(threading.current_thread().name)
+        return getattr(self.db, name)
+
+    def __enter__(self):
+        return self.db.__enter__()
+
+    def __exit__(self, *exc):
+        return self.db.__exit__(*exc)
+
+
+def test_acquire_and_reject_do_no_io(tmp_path):
+    path = str(tmp_path / "keys.db")
+    a, b = ApiKey("a", budget=10), ApiKey("b", budget=10)
+    pool = ApiKeyPool([a, b], db_path=path, flush_interval=0.05)
+    pool._db = RecordingDb(pool._db)
+
+    for _ in range(5):
+        pool.acquire()
+    pool.reject(a, 401)
+    assert threading.current_thread().name not in pool._db.threads # запись — только в фоновом потоке
+
+    probe = sqlite3.connect(path) # отдельное соединение: видит только то, что уже записано
+    deadline = time.monotonic() + 5
+    while True:
+        rows = {row[0]: row[1:] for row in probe.execute("SELECT key_id, used, blocked_until FROM api_key_usage")}
+        if sum(row[0] for row in rows.values()) == 5 and rows.get(a.id, (0, 0.0))[1] == a.blocked_until:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    probe.close()
+    assert rows[a.id][0] == a.used and rows[b.id][0] == b.used
+    assert pool._db.threads == {"poiskkino-keys-flush"}
+    pool.close()
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ApiKeyPool([ApiKey("a")], strategy="random")
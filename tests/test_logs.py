@@ -0,0 +1,52 @@
+import io
+import queue
+import logging
+import threading
+
+from services.logs import DROPPED, QueuedHandler, make_formatter
+
+
+def record(level, msg):
+    return logging.LogRecord("test", level, __file__, 1, msg, None, None)
+
+
+def full_handler():
+    output = logging.StreamHandler(io.StringIO())
+    output.setFormatter(make_formatter("text"))
+    handler = QueuedHandler(queue.Queue(1), fallback=output)
+    handler.block_seconds = 0.01
+    handler.handle(record(logging.INFO, "занимает очередь"))
+    return handler, output.stream
+
+
+def test_full_queue_drops_info_records():
+    handler, stream = full_handler()
+    dropped = DROPPED.labels("queue").value
+
+    handler.handle(record(logging.INFO, "частое событие"))
+
+    assert DROPPED.labels("queue").value == dropped + 1
+    assert stream.getvalue() == ""
+
+
+def test_full_queue_writes_warnings_directly():
+    handler, stream = full_handler()
+    dropped = DROPPED.labels("queue").value
+
+    handler.handle(record(logging.ERROR, "ошибка %s" % 500))
+
+    assert DROPPED.labels("queue").value == dropped
+    assert "ERROR - ошибка 500" in stream.getvalue()
+
+
+def test_warning_waits_for_free_slot():
+    handler, stream = full_handler()
+    handler.block_seconds = 2
+    writer = threading.Timer(0.05, handler.queue.get_nowait) # поток записи освобождает место чуть позже
+    writer.start()
+
+    handler.handle(record(logging.WARNING, "предупреждение"))
+    writer.join()
+
+    assert handler.queue.get_nowait().getMessage() == "предупреждение"
+    assert stream.getvalue() == ""
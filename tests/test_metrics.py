@@ -0,0 +1,127 @@
+import json
+import asyncio
+import threading
+import urllib.request
+
+import pytest
+
+import config
+from services import metrics
+from services.metrics import Registry, MetricsServer, span, start_trace, finish_trace, recent_traces
+
+
+def test_counter_and_gauge_text_format():
+    registry = Registry()
+    requests = registry.counter("app_requests_total", "Запросы", ("endpoint", "outcome"))
+    requests.labels("/movie", "ok").inc()
+    requests.labels("/movie", "ok").inc(2)
+    requests.labels('/se"arch', "http_500").inc()
+    active = registry.gauge("app_active", "Активные")
+    active.inc(3)
+    active.dec()
+
+    lines = registry.render().splitlines()
+    assert "# HELP app_requests_total Запросы" in lines
+    assert "# TYPE app_requests_total counter" in lines
+    assert 'app_requests_total{endpoint="/movie",outcome="ok"} 3' in lines
+    assert 'app_requests_total{endpoint="/se\\"arch",outcome="http_500"} 1' in lines
+    assert "# TYPE app_active gauge" in lines and "app_active 2" in lines
+
+
+def test_histogram_buckets_sum_and_count():
+    registry = Registry()
+    latency = registry.histogram("app_seconds", "Задержка", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.labels("api").observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE app_seconds histogram" in lines
+    assert [line for line in lines if line.startswith("app_seconds_bucket")] == [ # накопительно, с +Inf
+        'app_seconds_bucket{stage="api",le="0.1"} 1',
+        'app_seconds_bucket{stage="api",le="1.0"} 2',
+        'app_seconds_bucket{stage="api",le="+Inf"} 3',
+    ]
+    assert 'app_seconds_sum{stage="api"} 5.55' in lines
+    assert 'app_seconds_count{stage="api"} 3' in lines
+
+
+def test_collectors_and_registration_conflicts():
+    registry = Registry()
+    registry.collector("pool", lambda: {"depth": 4, "ready": True, "name": "skipped"})
+    registry.collector("broken", lambda: 1 / 0) # ошибка одного компонента не ломает /metrics
+    lines = registry.render().splitlines()
+    assert "pool_depth 4" in lines and "pool_ready 1" in lines
+    assert not any(line.startswith(("pool_name", "broken")) for line in lines)
+
+    registry.counter("x_total", "x", ("a",))
+    with pytest.raises(ValueError):
+        registry.gauge("x_total", "x", ("a",))
+    with pytest.raises(ValueError):
+        registry.counter("x_total", "x").labels("a", "b")
+
+
+@pytest.fixture
+def sampled(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_TRACE_SAMPLE", 1.0)
+
+
+def last_trace(handler):
+    return next(trace for trace in reversed(recent_traces()) if trace["handler"] == handler)
+
+
+def test_trace_follows_context_into_threads_and_tasks(sampled):
+    async def handler():
+        token = start_trace("async_handler", chat_id=7)
+        with span("in_loop"):
+            pass
+        await asyncio.to_thread(lambda: span("in_to_thread").__enter__().__exit__(None, None, None))
+        await asyncio.create_task(task())
+        finish_trace(token)
+
+    async def task():
+        with span("in_task"):
+            await asyncio.sleep(0)
+
+    asyncio.run(handler())
+    trace = last_trace("async_handler")
+    assert trace["chat_id"] == 7 and trace["error"] is None
+    assert [item["stage"] for item in trace["spans"]] == ["in_loop", "in_to_thread", "in_task"]
+
+
+def test_concurrent_traces_do_not_mix(sampled):
+    barrier = threading.Barrier(2)
+
+    def handler(name):
+        token = start_trace(name)
+        barrier.wait(5) # оба обновления в работе одновременно
+        with span(name + "_stage"):
+            pass
+        finish_trace(token, error=ValueError() if name == "b" else None)
+
+    threads = [threading.Thread(target=handler, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert [item["stage"] for item in last_trace("a")["spans"]] == ["a_stage"]
+    assert [item["stage"] for item in last_trace("b")["spans"]] == ["b_stage"]
+    assert last_trace("b")["error"] == "ValueError"
+
+    with span("outside"): # без обновления — в метку handler="background", трассы нет
+        pass
+    assert 'bot_stage_seconds_count{handler="background",stage="outside"}' in metrics.registry.render()
+
+
+def test_metrics_server_serves_metrics_and_traces(sampled):
+    token = start_trace("served")
+    finish_trace(token)
+    server = MetricsServer(host="127.0.0.1", port=0).start()
+    try:
+        base = "http://%s:%s" % server.address
+        with urllib.request.urlopen(base + "/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "# TYPE bot_stage_seconds histogram" in response.read().decode()
+        with urllib.request.urlopen(base + "/traces", timeout=5) as response:
+            assert any(trace["handler"] == "served" for trace in json.load(response))
+    finally:
+        server.stop()
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from api.movie import Movie, decode_page
+
+
+def test_decode_page_trims_each_doc_to_movie():
+    body = json.dumps({
+        "docs": [{"id": 1, "name": "Матрица", "persons": [{"id": 7}], "rating": {"kp": 8.5, "tmdb": 8.2}}, None],
+        "total": 1, "page": 1,
+    }, ensure_ascii=False).encode()
+    page = decode_page(body)
+    assert [type(movie) for movie in page["docs"]] == [Movie]
+    assert page["docs"][0].rating == {"kp": 8.5} and "persons" not in page["docs"][0].keys()
+    assert (page["total"], page["page"]) == (1, 1)
+
+
+@pytest.mark.parametrize("body", ['{"docs": [1,]}', '{"total": 1,}', '{"total": 1} x', '{"total" 1}'])
+def test_decode_page_rejects_malformed_json(body):
+    with pytest.raises(json.JSONDecodeError):
+        decode_page(body)
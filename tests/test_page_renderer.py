@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+from telebot import apihelper
+from telebot.types import InlineKeyboardMarkup
+
+from database import create_tables, PosterFile
+from handlers.flow import Engine
+from handlers.common import format_rating_card
+from handlers.page_renderer import CAPTION_LIMIT, build_page, open_entity, send_page, truncate
+from services import poster_cache
+from services.poster_cache import PosterCache
+
+
+def movie(movie_id, description):
+    return {"id": movie_id, "name": f"Фильм {movie_id}", "year": 2000, "rating": {"kp": 8.0}, "description": description,
+            "poster": {"url": f"https://example.com/{movie_id}.jpg"}}
+
+
+def test_long_description_is_cut_before_an_open_entity():
+    # курсив начинается до лимита подписи и закрывается после него
+    description = "а" * 950 + " _очень длинная цитата " + "б" * 200 + "_ конец"
+    plan = build_page([movie(1, description)], format_rating_card)
+    caption = plan.media[0].caption
+    assert len(caption) <= CAPTION_LIMIT
+    assert open_entity(caption) is None # разметку Telegram разберет
+    assert caption.endswith("а…") and plan.media_texts[0].endswith("_ конец") # полный текст — для отправки текстом
+
+
+def test_truncate_keeps_closed_entities_and_drops_a_cut_link():
+    text = "*Название* " + "x" * 20 + " [ссылка](https://example.com/long/path) хвост"
+    assert truncate(text, 45) == "*Название* " + "x" * 20 + "…"
+    assert truncate("*a* _b_ `c` " + "d" * 20, 20) == "*a* _b_ `c` ddddddd…"
+    assert truncate("коротко", 20) == "коротко"
+
+
+def telegram_error(description):
+    return apihelper.ApiTelegramException("sendMediaGroup", None, {"error_code": 400, "description": description})
+
+
+class StubBot: # send_media_group отвергает file_id из reject и альбомы целиком, если задан album_error
+    def __init__(self, reject=(), album_error=None):
+        self.reject, self.album_error = set(reject), album_error
+        self.calls = []
+
+    def send_media_group(self, chat_id, media):
+        self.calls.append(("send_media_group", [item.media for item in media]))
+        if self.album_error is not None:
+            raise self.album_error
+        if self.reject & {item.media for item in media}:
+            raise telegram_error("Bad Request: wrong file identifier/HTTP URL specified")
+        return [SimpleNamespace(photo=[SimpleNamespace(file_id=f"new-{i}")]) for i in range(len(media))]
+
+    def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        self.calls.append(("send_message", text, reply_markup))
+        return SimpleNamespace(message_id=len(self.calls), photo=None)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    create_tables()
+    PosterFile.delete().execute()
+    cache = PosterCache()
+    monkeypatch.setattr(poster_cache, "_poster_cache", cache)
+    yield cache
+    PosterFile.delete().execute()
+
+
+def test_rejected_file_id_is_evicted_and_album_resent_by_url(cache):
+    cache.put(1, "old-1")
+    plan = build_page([movie(1, "первый"), movie(2, "второй")], format_rating_card)
+    assert [item.media for item in plan.media] == ["old-1", "https://example.com/2.jpg"]
+    bot = StubBot(reject={"old-1"})
+
+    Engine(bot, None, None).run(send_page(42, plan))
+
+    assert bot.calls == [
+        ("send_media_group", ["old-1", "https://example.com/2.jpg"]),
+        ("send_media_group", ["https://example.com/1.jpg", "https://example.com/2.jpg"]), # повтор по URL
+    ]
+    assert cache.stats()["invalidated"] == 1
+    assert (cache.get(1), cache.get(2)) == ("new-0", "new-1") # file_id из ответа на повтор
+    assert PosterFile.get_by_id(1).file_id == "new-0"
+
+
+def test_failed_album_falls_back_to_text(cache):
+    markup = InlineKeyboardMarkup()
+    no_poster = dict(movie(3, "третий"), poster=None)
+    plan = build_page([movie(1, "первый"), movie(2, "второй"), no_poster], format_rating_card)
+    bot = StubBot(album_error=telegram_error("Bad Request: can't parse entities"))
+
+    Engine(bot, None, None).run(send_page(42, plan, reply_markup=markup))
+
+    assert [call[0] for call in bot.calls] == ["send_media_group", "send_message"] # без повтора: file_id не было
+    text, reply_markup = bot.calls[1][1:]
+    assert [name in text for name in ("Фильм 1", "Фильм 2", "Фильм 3")] == [True] * 3
+    assert text.index("Фильм 1") < text.index("Фильм 3") and reply_markup is markup
+    assert cache.stats()["entries"] == 0 # из неудачной отправки ничего не запоминаем
@@ -0,0 +1,126 @@
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+import requests
+
+from api.cache import ResponseCache
+from api.errors import ApiHTTPError, ApiTimeoutError
+from api.poiskkino import PoiskKinoClient
+from api.poiskkino_async import AsyncPoiskKinoClient
+
+
+class StubResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(body if body is not None else {"docs": [], "total": 0}).encode()
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class StubSession: # отдает заготовленные ответы по очереди и запоминает время каждого запроса
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append(time.monotonic())
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        pass
+
+
+def make_client(*responses, **options):
+    options.setdefault("backoff", 0)
+    client = PoiskKinoClient(api_key="test", cache=False, catalog=False, singleflight=False,
+                             title_index=False, breaker=False, **options)
+    client.session = StubSession(*responses)
+    return client
+
+
+def test_single_key_retries_after_short_429():
+    client = make_client(StubResponse(429, headers={"Retry-After": "1"}),
+                         StubResponse(200, {"docs": [{"id": 1, "name": "Матрица"}], "total": 1}),
+                         StubResponse(200, {"docs": [], "total": 0}))
+    page = client.search("матрица")
+    assert [movie.id for movie in page.docs] == [1]
+    first, second = client.session.calls
+    assert 1 <= second - first < 5 # ждали Retry-After, а не POISKINO_KEY_COOLDOWN
+    assert client.search("аватар").total == 0 # следующий поиск не упирается в "квота исчерпана"
+
+
+def test_retries_server_errors_then_succeeds():
+    client = make_client(StubResponse(502), StubResponse(503), StubResponse(200, {"docs": [{"id": 2}], "total": 1}))
+    assert client.search("матрица").total == 1
+    assert len(client.session.calls) == 3
+
+
+def test_retry_after_is_honored_and_capped(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("api.poiskkino.time.sleep", sleeps.append)
+    client = make_client(StubResponse(503, headers={"Retry-After": "3"}), StubResponse(503, headers={"Retry-After": "600"}),
+                         StubResponse(200), backoff_max=8)
+    client.search("матрица")
+    assert sleeps == [3.0, 8.0]
+
+
+def test_gives_up_after_max_retries():
+    client = make_client(*[StubResponse(500)] * 3, max_retries=2)
+    with pytest.raises(ApiHTTPError) as error:
+        client.search("матрица")
+    assert error.value.status_code == 500
+    assert len(client.session.calls) == 3 # первый запрос и два повтора
+
+
+@pytest.mark.parametrize("status", [400, 404])
+def test_client_errors_are_not_retried(status):
+    client = make_client(StubResponse(status), StubResponse(200))
+    with pytest.raises(ApiHTTPError) as error:
+        client.search("матрица")
+    assert error.value.status_code == status
+    assert len(client.session.calls) == 1
+
+
+def test_connection_errors_are_retried():
+    client = make_client(requests.exceptions.ConnectionError("reset"), StubResponse(200, {"docs": [], "total": 0}))
+    assert client.search("матрица").total == 0
+    assert len(client.session.calls) == 2
+
+
+def test_async_client_reads_disk_cache_off_the_event_loop(tmp_path):
+    cache = ResponseCache(disk_path=str(tmp_path / "cache.db"))
+    threads = {}
+    for name in ("get", "get_stale", "set"):
+        method = getattr(cache, name)
+        setattr(cache, name, lambda *args, name=name, method=method: (
+            threads.setdefault(name, set()).add(threading.current_thread().name), method(*args))[1])
+
+    client = AsyncPoiskKinoClient(api_key="test", cache=cache, catalog=False, singleflight=False,
+                                  title_index=False, breaker=False)
+
+    async def fetch(endpoint, params):
+        if params["query"] == "сбой":
+            raise ApiTimeoutError("timeout")
+        return {"docs": [{"id": 1}], "total": 1}, 100
+
+    client._fetch = fetch
+
+    async def scenario():
+        loop_thread = threading.current_thread().name
+        assert (await client.search("матрица")).total == 1 # промах, запрос, запись в кэш
+        assert (await client.search("матрица")).total == 1 # из кэша
+        with pytest.raises(ApiTimeoutError): # сохраненного ответа нет
+            await client.search("сбой")
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+    assert set(threads) == {"get", "get_stale", "set"}
+    assert all(loop_thread not in names for names in threads.values())
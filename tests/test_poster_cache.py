@@ -0,0 +1,32 @@
+import pytest
+
+from database import create_tables, PosterFile
+from services.poster_cache import PosterCache
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    create_tables()
+    PosterFile.delete().execute()
+    yield
+    PosterFile.delete().execute()
+
+
+def test_load_reads_table_once_so_get_does_no_io(monkeypatch):
+    PosterCache().put(1, "file-1")
+    cache = PosterCache()
+    cache.load()
+
+    def no_query(*args, **kwargs):
+        raise AssertionError("get() не должен читать базу после load()")
+
+    monkeypatch.setattr(PosterFile, "select", no_query)
+    assert cache.get(1) == "file-1" and cache.get(2) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_disabled_cache_does_not_load(monkeypatch):
+    monkeypatch.setattr(PosterFile, "select", lambda *args: pytest.fail("выключенный кэш читает базу"))
+    cache = PosterCache(enabled=False)
+    cache.load()
+    assert cache.get(1) is None
@@ -0,0 +1,42 @@
+import time
+import asyncio
+
+from services.prefetch import PagePrefetcher, AsyncPagePrefetcher
+
+
+def test_sync_prefetch_loads_next_page_in_pool():
+    prefetcher = PagePrefetcher(depth=2, max_workers=2, ttl=60)
+    try:
+        prefetcher.schedule(1, 'rating', 7.0, 1, 5, lambda page: f"page {page}")
+
+        assert prefetcher.take(1, 'rating', 7.0, 3) == "page 3"
+        assert prefetcher.take(1, 'rating', 7.0, 4) is None
+        assert prefetcher.stats()["hits"] == 1 and prefetcher.stats()["misses"] == 1
+    finally:
+        prefetcher.shutdown()
+
+
+def test_async_prefetch_runs_in_event_loop():
+    async def main():
+        prefetcher = AsyncPagePrefetcher(depth=1, ttl=60)
+
+        async def fetch(page):
+            return f"page {page}"
+
+        prefetcher.schedule(1, 'budget', 100, 1, 5, fetch)
+        return await prefetcher.take(1, 'budget', 100, 2)
+
+    assert asyncio.run(main()) == "page 2"
+
+
+def test_positions_expire_with_pages():
+    prefetcher = PagePrefetcher(depth=1, max_workers=1, ttl=0.01)
+    try:
+        for chat_id in range(100):
+            prefetcher.schedule(chat_id, 'rating', 7.0, 1, 1, lambda page: None)
+        time.sleep(0.02)
+        prefetcher.schedule(500, 'rating', 7.0, 1, 1, lambda page: None) # очистка — при следующем schedule
+
+        assert prefetcher.stats()["positions"] == 1
+    finally:
+        prefetcher.shutdown()
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from handlers.router import Router, PrefixTrie
+
+
+def message(text, chat_id=1, chat_type="private"):
+    return SimpleNamespace(text=text, chat=SimpleNamespace(id=chat_id, type=chat_type))
+
+
+@pytest.fixture
+def states():
+    return {}
+
+
+@pytest.fixture
+def router(states):
+    router = Router(states.get)
+    for name in ("start", "back", "movie_name", "private_only"):
+        handler = lambda update: None
+        handler.__name__ = name
+        setattr(router, f"{name}_handler", handler)
+    router.command("start")(router.start_handler)
+    router.text("Назад")(router.back_handler)
+    router.text("История запросов", chat_types=["private"])(router.private_only_handler)
+    router.state("waiting_for_movie_name")(router.movie_name_handler)
+    return router
+
+
+def test_command_text_and_state(router, states):
+    assert router.resolve_message(message("/start")) is router.start_handler
+    assert router.resolve_message(message("/start@movie_bot")) is router.start_handler
+    assert router.resolve_message(message("Матрица")) is None
+    states[1] = "waiting_for_movie_name"
+    assert router.resolve_message(message("Матрица")) is router.movie_name_handler
+
+
+def test_button_wins_over_state(router, states):
+    states[1] = "waiting_for_movie_name"
+    assert router.resolve_message(message("Назад")) is router.back_handler
+
+
+def test_chat_type_limits_buttons(router):
+    assert router.resolve_message(message("История запросов")) is router.private_only_handler
+    assert router.resolve_message(message("История запросов", chat_id=-5, chat_type="group")) is None
+
+
+def test_unknown_command_falls_back_to_state(router, states):
+    states[1] = "waiting_for_movie_name"
+    assert router.resolve_message(message("/unknown")) is router.movie_name_handler
+
+
+def test_async_resolve_reads_state_off_the_event_loop(router, states):
+    threads = []
+    states[1] = "waiting_for_movie_name"
+    router.get_state = lambda chat_id: (threads.append(threading.current_thread()), states.get(chat_id))[1]
+
+    async def resolve(text):
+        return await router.resolve_message_async(message(text))
+
+    assert asyncio.run(resolve("Матрица")) is router.movie_name_handler
+    assert threads and threading.main_thread() not in threads # SQLite не держит event loop
+    assert asyncio.run(resolve("/start")) is router.start_handler
+    assert len(threads) == 1 # команде и кнопке состояние не нужно
+
+
+def test_duplicate_registration_is_rejected(router):
+    with pytest.raises(ValueError):
+        router.text("Назад")(lambda update: None)
+
+
+def test_callback_uses_longest_prefix():
+    router = Router(lambda chat_id: None)
+    short, long = object(), object()
+    router.callback("c:")(short)
+    router.callback("c:r:", "c:b:")(long)
+    assert router.resolve_callback(SimpleNamespace(data="c:r:7.5:0:1")) is long
+    assert router.resolve_callback(SimpleNamespace(data="c:x")) is short
+    assert router.resolve_callback(SimpleNamespace(data="rating_page:7:2")) is None
+
+
+def test_prefix_trie_rejects_same_prefix_twice():
+    trie = PrefixTrie()
+    trie.add("rating_page:", 1)
+    with pytest.raises(ValueError):
+        trie.add("rating_page:", 2)
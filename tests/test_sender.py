@@ -0,0 +1,228 @@
+import time
+import asyncio
+import threading
+
+import pytest
+from telebot import TeleBot, apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.types import InputMediaPhoto
+
+from benchmarks.fake_telegram import FakeTelegram
+from services.sender import SendScheduler, ScheduledBot, AsyncScheduledBot, INTERACTIVE, BULK, bulk_priority
+
+
+@pytest.fixture
+def fake():
+    fake = FakeTelegram(chat_rate=1000, chat_burst=1000, global_rate=1000).start()
+    previous = apihelper.API_URL
+    apihelper.API_URL = fake.api_url
+    yield fake
+    apihelper.API_URL = previous
+    fake.stop()
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(**options):
+        options = dict(dict(global_rate=1000, chat_rate=1000, chat_burst=1000, workers=4), **options)
+        scheduler = SendScheduler(**options)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop(timeout=5)
+
+
+def test_messages_of_one_chat_keep_order(fake, make_scheduler):
+    scheduler = make_scheduler(workers=8)
+    bot = TeleBot("123:test", threaded=False)
+    futures = {chat_id: [scheduler.submit(chat_id, lambda chat_id=chat_id, i=i: bot.send_message(chat_id, f"{i}"))
+                         for i in range(10)]
+               for chat_id in (1, 2, 3)}
+
+    for chat_futures in futures.values():
+        message_ids = [future.result(timeout=10).message_id for future in chat_futures]
+        assert message_ids == sorted(message_ids) # Telegram выдает id по мере приема
+    assert scheduler.stats()["sent"] == 30
+
+
+def test_interactive_jobs_go_before_bulk(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    started, release, order = threading.Event(), threading.Event(), []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit(100, blocker)
+    assert started.wait(5) # единственный рабочий занят, остальное ждет в очереди
+    with bulk_priority():
+        bulk = [scheduler.submit(chat_id, lambda chat_id=chat_id: order.append(chat_id)) for chat_id in (1, 2, 3)]
+    interactive = scheduler.submit(4, lambda: order.append(4))
+    release.set()
+
+    for future in bulk + [interactive]:
+        future.result(timeout=5)
+    assert order == [4, 1, 2, 3]
+
+
+def test_priority_defaults_to_interactive_outside_bulk_block(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    started, release, order = threading.Event(), threading.Event(), []
+
+    scheduler.submit(100, lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    first = scheduler.submit(1, lambda: order.append("bulk"), priority=BULK)
+    second = scheduler.submit(2, lambda: order.append("interactive"), priority=INTERACTIVE)
+    release.set()
+
+    first.result(timeout=5), second.result(timeout=5)
+    assert order == ["interactive", "bulk"]
+
+
+def test_retries_after_flood_control(make_scheduler):
+    fake = FakeTelegram(chat_rate=1, chat_burst=1, global_rate=1000).start() # второе сообщение в секунду — 429
+    previous = apihelper.API_URL
+    apihelper.API_URL = fake.api_url
+    try:
+        scheduler = make_scheduler() # лимит чата очереди выше, чем у Telegram
+        bot = ScheduledBot(TeleBot("123:test", threaded=False), scheduler)
+        started = time.monotonic()
+        first = bot.send_message(7, "один")
+        second = bot.send_message(7, "два")
+        elapsed = time.monotonic() - started
+    finally:
+        apihelper.API_URL = previous
+        fake.stop()
+
+    assert second.message_id > first.message_id
+    assert fake.flood_errors >= 1
+    assert scheduler.stats()["retried"] == fake.flood_errors and scheduler.stats()["failed"] == 0
+    assert elapsed >= 0.9 # ждали retry_after из ответа
+
+
+def test_media_group_is_one_message_for_the_chat_limit(fake, make_scheduler):
+    scheduler = make_scheduler(chat_rate=1, chat_burst=2)
+    bot = ScheduledBot(TeleBot("123:test", threaded=False), scheduler)
+    media = [InputMediaPhoto(f"https://example.com/{i}.jpg") for i in range(5)]
+
+    started = time.monotonic()
+    bot.send_media_group(5, media)
+    bot.send_message(5, "после альбома") # второй токен чата из двух
+    assert time.monotonic() - started < 0.5
+    assert fake.stats()["delivered"] == 6
+
+
+def test_media_group_costs_one_global_token_per_photo(fake, make_scheduler):
+    scheduler = make_scheduler(global_rate=3)
+    bot = ScheduledBot(TeleBot("123:test", threaded=False), scheduler)
+    media = [InputMediaPhoto(f"https://example.com/{i}.jpg") for i in range(3)]
+
+    bot.send_media_group(5, media) # весь запас бота
+    album_done = time.monotonic()
+    bot.send_message(6, "другой чат")
+    assert time.monotonic() - album_done >= 0.25 # следующий токен бота — через 1/3 с
+
+
+def test_edits_and_deletes_do_not_use_chat_tokens(fake, make_scheduler):
+    scheduler = make_scheduler(chat_rate=1, chat_burst=1)
+    bot = ScheduledBot(TeleBot("123:test", threaded=False), scheduler)
+
+    started = time.monotonic()
+    message = bot.send_message(8, "страница 1") # весь запас чата
+    for page in range(2, 5):
+        bot.edit_message_text(f"страница {page}", 8, message.message_id)
+    bot.delete_message(8, message.message_id)
+    assert time.monotonic() - started < 0.5
+
+
+def test_text_messages_within_burst_are_not_delayed(fake, make_scheduler):
+    scheduler = make_scheduler(chat_rate=1, chat_burst=3)
+    bot = ScheduledBot(TeleBot("123:test", threaded=False), scheduler)
+
+    started = time.monotonic()
+    for i in range(3):
+        bot.send_message(6, f"{i}")
+
+    assert time.monotonic() - started < 0.5
+
+
+@pytest.fixture
+def async_fake():
+    def start(**options):
+        fake = FakeTelegram(**dict(dict(chat_rate=1000, chat_burst=1000, global_rate=1000), **options)).start()
+        fakes.append(fake)
+        asyncio_helper.API_URL = fake.api_url
+        return fake
+
+    fakes, previous = [], asyncio_helper.API_URL
+    yield start
+    asyncio_helper.API_URL = previous
+    for fake in fakes:
+        fake.stop()
+
+
+def run_async_bot(scheduler, steps): # steps(bot) — корутина; сессия aiohttp закрывается в том же loop
+    async def main():
+        bot = AsyncTeleBot("123:test")
+        try:
+            return await steps(AsyncScheduledBot(bot, scheduler))
+        finally:
+            await bot.close_session()
+    return asyncio.run(main())
+
+
+def test_async_sends_do_not_hold_sender_threads(async_fake, make_scheduler):
+    async_fake(latency=0.2)
+    scheduler = make_scheduler(workers=1) # один поток очереди на десять чатов
+
+    started = time.monotonic()
+    messages = run_async_bot(scheduler, lambda bot: asyncio.gather(*(bot.send_message(chat_id, "hi") for chat_id in range(1, 11))))
+    elapsed = time.monotonic() - started
+
+    assert len(messages) == 10
+    assert elapsed < 1.0 # запросы ждутся в event loop одновременно, а не по очереди в потоке (10 × 0.2 с)
+    assert scheduler.stats()["sent"] == 10
+
+
+def test_async_messages_of_one_chat_keep_order(async_fake, make_scheduler):
+    async_fake(latency=0.01)
+    scheduler = make_scheduler(workers=4)
+
+    messages = run_async_bot(scheduler, lambda bot: asyncio.gather(*(bot.send_message(3, f"{i}") for i in range(10))))
+
+    message_ids = [message.message_id for message in messages] # gather отдает в порядке вызовов
+    assert message_ids == sorted(message_ids)
+
+
+def test_async_retries_after_flood_control(async_fake, make_scheduler):
+    fake = async_fake(chat_rate=1, chat_burst=1) # второе сообщение в секунду — 429
+    scheduler = make_scheduler()
+
+    async def steps(bot):
+        return await bot.send_message(7, "один"), await bot.send_message(7, "два")
+
+    started = time.monotonic()
+    first, second = run_async_bot(scheduler, steps)
+
+    assert second.message_id > first.message_id
+    assert fake.flood_errors >= 1
+    assert scheduler.stats()["retried"] == fake.flood_errors and scheduler.stats()["failed"] == 0
+    assert time.monotonic() - started >= 0.9
+
+
+def test_cancelled_async_send_releases_chat(async_fake, make_scheduler):
+    async_fake(latency=0.5)
+    scheduler = make_scheduler()
+
+    async def steps(bot):
+        slow = asyncio.ensure_future(bot.send_message(8, "долгое"))
+        await asyncio.sleep(0.1)
+        slow.cancel()
+        return await asyncio.wait_for(bot.send_message(8, "следующее"), 2) # чат не остался занятым
+
+    assert run_async_bot(scheduler, steps).message_id
+    assert scheduler.stats()["failed"] == 1
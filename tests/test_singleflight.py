@@ -0,0 +1,92 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.errors import ApiHTTPError, ApiOverloadedError
+from api.singleflight import SingleFlight, AsyncSingleFlight
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def run_together(flight, fn, callers): # callers вызовов do() с одним ключом, пока первый еще в полете
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return fn()
+
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(flight.do, "k", slow) for _ in range(callers)]
+        wait_for(lambda: flight.stats()["collapsed"] == callers - 1)
+        release.set()
+    return futures
+
+
+def test_concurrent_calls_for_one_key_make_one_fetch():
+    flight, fetches = SingleFlight(), []
+
+    futures = run_together(flight, lambda: fetches.append(1) or "ответ", 5)
+
+    assert [future.result() for future in futures] == ["ответ"] * 5
+    assert len(fetches) == 1
+    assert flight.stats()["calls"] == 1 and flight.stats()["in_flight"] == 0
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    def fail():
+        raise ApiHTTPError(503, "")
+
+    futures = run_together(flight, fail, 4)
+
+    for future in futures:
+        with pytest.raises(ApiHTTPError):
+            future.result()
+    assert flight.do("k", lambda: "снова") == "снова" # ошибка не остается в таблице
+
+
+def test_waiters_over_limit_are_rejected():
+    flight, release = SingleFlight(max_waiters=1), threading.Event()
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "k", lambda: release.wait(5))
+        wait_for(lambda: flight.stats()["in_flight"] == 1)
+        waiter = pool.submit(flight.do, "k", lambda: None)
+        wait_for(lambda: flight.stats()["collapsed"] == 1)
+
+        with pytest.raises(ApiOverloadedError):
+            flight.do("k", lambda: None)
+        release.set()
+    assert leader.result() is True and waiter.result() is True
+
+
+def test_async_calls_share_one_fetch_and_its_error():
+    async def main():
+        flight, fetches = AsyncSingleFlight(), []
+
+        async def fetch():
+            fetches.append(1)
+            await asyncio.sleep(0.01)
+            return "ответ"
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ApiHTTPError(503, "")
+
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        errors = await asyncio.gather(*(flight.do("e", fail) for _ in range(3)), return_exceptions=True)
+        return results, fetches, errors, flight.stats()
+
+    results, fetches, errors, stats = asyncio.run(main())
+
+    assert results == ["ответ"] * 5 and len(fetches) == 1
+    assert all(isinstance(error, ApiHTTPError) for error in errors)
+    assert stats["calls"] == 2 and stats["collapsed"] == 6 and stats["in_flight"] == 0
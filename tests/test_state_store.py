@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from services.state_store import StateStore, MemoryStateStore, SqliteStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**options):
+        if request.param == "memory":
+            return MemoryStateStore(**options)
+        return SqliteStateStore(str(tmp_path / "state.db"), **options)
+    return make
+
+
+def test_set_get_pop(make_store):
+    store = make_store()
+    assert store.get(1) is None and store.get(1, "menu") == "menu"
+    store.set(1, "waiting_for_min_rating")
+    assert store.get(1) == "waiting_for_min_rating"
+    assert len(store) == 1
+    assert store.pop(1) == "waiting_for_min_rating"
+    assert store.pop(1, "gone") == "gone"
+    assert len(store) == 0
+
+
+def test_state_expires_after_ttl(make_store):
+    store = make_store(default_ttl=0.05, ttls={"waiting_for_movie_name": 60})
+    store.set(1, "waiting_for_min_rating")
+    store.set(2, "waiting_for_movie_name")
+    time.sleep(0.1)
+    assert store.get(1) is None
+    assert store.pop(1) is None
+    assert store.get(2) == "waiting_for_movie_name"
+
+
+def test_memory_store_evicts_oldest_chats():
+    store = MemoryStateStore(max_entries=2)
+    for chat_id in (1, 2, 3):
+        store.set(chat_id, "waiting_for_min_budget")
+    assert store.get(1) is None
+    assert store.get(3) == "waiting_for_min_budget"
+    assert store.evictions == 1
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    SqliteStateStore(path).set(1, "waiting_for_movie_name")
+    assert SqliteStateStore(path).get(1) == "waiting_for_movie_name"
+
+
+def test_backend_must_implement_the_interface():
+    class Partial(StateStore):
+        def get(self, chat_id, default=None):
+            return default
+
+    with pytest.raises(TypeError):
+        Partial()
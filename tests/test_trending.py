@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+
+from database import db, create_tables, History, TrendBucket
+from services.trending import TrendRollup, normalize_query, bucket_increments, rebuild
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    create_tables()
+    TrendBucket.delete().execute()
+    yield
+    TrendBucket.delete().execute()
+
+
+def rows(*queries, hours_ago=0):
+    when = datetime.datetime.now() - datetime.timedelta(hours=hours_ago)
+    return [{"query": query, "timestamp": when} for query in queries]
+
+
+def test_normalize_query():
+    assert normalize_query("Поиск по названию: 'Ёлки  2!'") == ("name", "елки 2", "Ёлки 2!")
+    assert normalize_query("Рейтинг от 7.50") == ("rating", "7.5", "7.5")
+    assert normalize_query("Бюджет от $50.0 млн.") == ("budget", "50", "50")
+    assert normalize_query("Рейтинг от nan") is None
+    assert normalize_query("что-то другое") is None
+
+
+def test_increments_count_hour_and_day_buckets():
+    increments = bucket_increments(rows("Поиск по названию: 'Матрица'", "Поиск по названию: 'матрица'", "Рейтинг от 8"))
+    hourly = {key[1:3]: value[0] for key, value in increments.items() if key[0] == "hour"}
+    daily = {key[1:3]: value[0] for key, value in increments.items() if key[0] == "day"}
+    assert hourly == daily == {("name", "матрица"): 2, ("rating", "8"): 1}
+
+
+def test_top_orders_by_count_and_keeps_last_label():
+    rollup = TrendRollup(half_life_hours=24, top_n=2)
+    rollup.record(rows("Поиск по названию: 'Матрица'", "Поиск по названию: 'дюна'", "Поиск по названию: 'Аватар'",
+                       "Поиск по названию: 'ДЮНА'", "Поиск по названию: 'Матрица'", "Поиск по названию: 'Дюна'"))
+    top = rollup.top("name")
+    assert [label for label, _ in top] == ["Дюна", "Матрица"]
+    assert top[0][1] == pytest.approx(3, rel=0.05) # вес считается от начала часа
+    assert rollup.top("rating") == []
+
+
+def test_old_searches_weigh_less():
+    rollup = TrendRollup(half_life_hours=1, top_n=5)
+    rollup.record(rows(*["Поиск по названию: 'Старое'"] * 3, hours_ago=3)) # три поиска три периода назад — 3/8
+    rollup.record(rows("Поиск по названию: 'Новое'"))
+    assert [label for label, _ in rollup.top("name")] == ["Новое", "Старое"]
+
+
+def test_incremental_top_updates_with_new_batches():
+    rollup = TrendRollup(top_n=1)
+    rollup.record(rows("Рейтинг от 7"))
+    assert rollup.top("rating")[0][0] == "7"
+    rollup.record(rows("Рейтинг от 8", "Рейтинг от 8"))
+    assert rollup.top("rating")[0][0] == "8"
+
+
+def test_load_restores_weights_from_buckets():
+    TrendRollup().record(rows("Бюджет от $100 млн.", "Бюджет от $100 млн.", "Бюджет от $50 млн."))
+    restored = TrendRollup()
+    restored.load()
+    assert [label for label, _ in restored.top("budget")] == ["100", "50"]
+
+
+def test_rebuild_recounts_history():
+    with db.atomic():
+        History.delete().execute()
+        History.insert_many([{"user_id": 1, "query": "Рейтинг от 7"}] * 3 + [{"user_id": 1, "query": "x"}]).execute()
+    assert rebuild() == 3
+    assert TrendBucket.select().where(TrendBucket.period == "hour").get().count == 3
+    History.delete().execute()
@@ -0,0 +1,87 @@
+import json
+import threading
+import http.client
+
+import pytest
+
+from services.webhook import WebhookServer, MAX_BODY_SIZE, SECRET_HEADER
+
+
+def update(update_id):
+    return json.dumps({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "/start",
+        "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "U"}}})
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(dispatch=lambda updates: None, **options):
+        options = dict(dict(host="127.0.0.1", port=0, path="/hook", secret_token="s3cret", queue_size=10, workers=1), **options)
+        server = WebhookServer(dispatch, **options)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop(timeout=5)
+
+
+def request(server, method, path, body=None, headers=None): # (статус, JSON ответа)
+    conn = http.client.HTTPConnection(*server.address, timeout=5)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def post(server, body, secret="s3cret", headers=None):
+    headers = dict({SECRET_HEADER: secret, "Content-Type": "application/json"}, **(headers or {}))
+    return request(server, "POST", "/hook", body, headers)
+
+
+def test_accepts_update_and_dispatches_it(make_server):
+    received, done = [], threading.Event()
+    server = make_server(lambda updates: (received.extend(updates), done.set()))
+    assert post(server, update(7)) == (200, {"ok": True})
+    assert done.wait(5) and received[0].update_id == 7
+
+
+def test_wrong_secret_token_is_forbidden(make_server):
+    server = make_server()
+    assert post(server, update(1), secret="wrong")[0] == 403
+    assert post(server, update(1), secret="")[0] == 403
+    assert server.stats()["accepted"] == 0
+
+
+def test_oversized_and_malformed_bodies_are_rejected(make_server):
+    server = make_server()
+    assert post(server, b"{}", headers={"Content-Length": str(MAX_BODY_SIZE + 1)})[0] == 413
+    assert post(server, "not json")[0] == 400
+    assert post(server, b"")[0] == 400
+    assert request(server, "POST", "/other", update(1), {SECRET_HEADER: "s3cret"})[0] == 404
+
+
+def test_full_queue_answers_503_and_is_not_ready(make_server):
+    started, release = threading.Event(), threading.Event()
+    server = make_server(lambda updates: (started.set(), release.wait(5)), queue_size=1)
+    assert post(server, update(1))[0] == 200
+    assert started.wait(5) # единственный рабочий занят
+    assert post(server, update(2))[0] == 200 # ждет в очереди
+    assert post(server, update(3))[0] == 503 # Telegram повторит позже
+    status, body = request(server, "GET", "/readyz")
+    assert status == 503 and body["ok"] is False and body["rejected"] == 1
+    release.set()
+
+
+def test_health_and_readiness(make_server):
+    server = make_server()
+    assert request(server, "GET", "/healthz") == (200, {"ok": True})
+    status, body = request(server, "GET", "/readyz")
+    assert status == 200 and body["ok"] is True and body["queue_size"] == 10
+    server.stop(timeout=5)
+    assert not server.is_ready()